@@ -1,15 +1,20 @@
-from openai import OpenAI
-import base64
 import os
+import threading
+import time
 import tkinter as tk
+from concurrent.futures import Future
 from tkinter import filedialog, messagebox, scrolledtext, ttk
-from PIL import Image, ImageTk
-from dotenv import load_dotenv
-import json
-import re
 
-# Carregar variáveis de ambiente do arquivo .env
-load_dotenv()
+import analise
+import estruturado
+import instrumentacao
+import verificacao_local
+from balanceador import BalanceadorEndpoints, descrever_endpoints
+from cache import abrir_cache_padrao, descrever_estatisticas
+from configuracao import criar_cliente
+from execucao import ExecutorSegundoPlano
+from limitador import descrever_metricas
+from resultados import abrir_armazem_padrao, campos_indexados, descrever_conciliacao
 
 # Como instalar as dependências:
 # 1. Certifique-se de ter Python 3.7 ou superior instalado
@@ -17,6 +22,9 @@ load_dotenv()
 #    pip install -r requirements.txt
 # 3. Ou instale manualmente com: pip install openai Pillow python-dotenv
 # 4. Crie um arquivo .env na raiz do projeto com suas credenciais (use .env.example como modelo)
+# 5. Para processar muitos pares sem interface, use: python lote.py PASTA --saida vereditos.jsonl
+# 6. Para conciliar continuamente o que os scanners gravam numa pasta, use: python vigia.py PASTA --saida vereditos.jsonl
+# 7. Para conferir uma remessa inteira (várias caixas e notas) extraindo cada documento uma vez, use: python remessa.py PASTA
 
 class AnalisadorImagens:
     def __init__(self, root):
@@ -24,32 +32,75 @@ class AnalisadorImagens:
         self.root.title("Analisador de Caixa e Nota Fiscal")
         self.root.geometry("900x700")
         
-        # Carregar credenciais das variáveis de ambiente
-        self.endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-        self.deployment_name = os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4.1")
-        self.api_key = os.getenv("AZURE_OPENAI_API_KEY")
-        
-        # Validar se as credenciais foram carregadas
-        if not self.endpoint or not self.api_key:
-            raise ValueError(
-                "Credenciais não encontradas! \n"
-                "Certifique-se de criar um arquivo .env com:\n"
-                "AZURE_OPENAI_ENDPOINT=seu_endpoint\n"
-                "AZURE_OPENAI_API_KEY=sua_api_key\n"
-                "AZURE_OPENAI_DEPLOYMENT=gpt-4.1"
-            )
-        
-        self.client = OpenAI(
-            base_url=self.endpoint,
-            api_key=self.api_key
-        )
+        # O cliente (e o SDK da OpenAI, que é lento de importar) é criado numa thread enquanto
+        # a janela é desenhada; as chamadas ao modelo esperam por ele nas threads de trabalho
+        self.cliente_futuro = Future()
+        threading.Thread(target=self.criar_cliente_em_segundo_plano, daemon=True).start()
+        self.cache = abrir_cache_padrao()
+        self.resultados = abrir_armazem_padrao()
         
         self.imagem_caixa_path = None
         self.imagem_nota_path = None
         self.informacoes_caixa = None
         self.informacoes_nota = None
         
+        # No modo estruturado as extrações também ficam guardadas como dicionário
+        self.modo_estruturado = estruturado.modo_extracao() == estruturado.MODO_ESTRUTURADO
+        self.dados_caixa = None
+        self.dados_nota = None
+        
+        # Resultado da verificação local (código de barras/OCR) do par atual
+        self.verificacao = None
+        
+        # Dados do par atual gravados no histórico de conciliações
+        self.inicio_analise = None
+        self.estatisticas_caixa = {}
+        self.estatisticas_nota = {}
+        self.estatisticas_cruzamento = {}
+        self.veredito = None
+        
+        # Tarefas em andamento por etapa ("caixa", "nota", "cruzamento")
+        self.tarefas = {}
+        
+        # Tempo gasto inserindo trechos no texto, por operação (etapa "renderizacao")
+        self.tempo_renderizacao = {}
+        self.versao_desempenho = None
+        
         self.criar_interface()
+        
+        # As chamadas ao modelo rodam em threads; os resultados voltam ao loop do Tk
+        self.executor = ExecutorSegundoPlano(self.root, ao_mudar=self.atualizar_progresso)
+        self.relogio_progresso()
+        self.aguardar_cliente()
+        self.root.protocol("WM_DELETE_WINDOW", self.fechar)
+    
+    def criar_cliente_em_segundo_plano(self):
+        try:
+            self.cliente_futuro.set_result(criar_cliente())
+        except Exception as e:
+            self.cliente_futuro.set_exception(e)
+    
+    @property
+    def client(self):
+        # Bloqueia até o cliente ficar pronto: só deve ser lido nas threads de trabalho
+        return self.cliente_futuro.result()[0]
+    
+    @property
+    def deployment_name(self):
+        return self.cliente_futuro.result()[1]
+    
+    def cliente_pronto(self):
+        return self.cliente_futuro.done() and self.cliente_futuro.exception() is None
+    
+    def aguardar_cliente(self):
+        if not self.cliente_futuro.done():
+            self.root.after(100, self.aguardar_cliente)
+            return
+        erro = self.cliente_futuro.exception()
+        if erro is not None:
+            # Sem cliente as análises falham com o mesmo erro; a verificação local e o histórico continuam
+            self.lbl_limitador.config(text=f"❌ Cliente do modelo indisponível: {erro}", fg="red")
+            messagebox.showerror("Erro", f"Não foi possível criar o cliente do modelo:\n{erro}")
     
     def criar_interface(self):
         # Criar sistema de abas
@@ -64,8 +115,27 @@ class AnalisadorImagens:
         self.tab_cruzamento = tk.Frame(self.notebook)
         self.notebook.add(self.tab_cruzamento, text="2. Cruzamento de Informações")
         
+        # Aba 3: Desempenho (tempo por etapa das chamadas ao modelo)
+        self.tab_desempenho = tk.Frame(self.notebook)
+        self.notebook.add(self.tab_desempenho, text="3. Desempenho")
+        
         self.criar_aba_analise()
         self.criar_aba_cruzamento()
+        self.criar_aba_desempenho()
+        
+        # Barra de progresso das chamadas em andamento
+        frame_progresso = tk.Frame(self.root, padx=10)
+        frame_progresso.pack(fill="x")
+        
+        self.barra_progresso = ttk.Progressbar(frame_progresso, mode="indeterminate", length=160)
+        self.barra_progresso.pack(side="left", padx=5)
+        self.barra_ativa = False
+        
+        self.lbl_progresso = tk.Label(frame_progresso, text="Nenhuma análise em andamento", fg="gray")
+        self.lbl_progresso.pack(side="left", padx=5)
+        
+        self.btn_cancelar = tk.Button(frame_progresso, text="⛔ Cancelar", command=self.cancelar_tarefas, state="disabled", bg="#9E9E9E", fg="white", font=("Arial", 10, "bold"))
+        self.btn_cancelar.pack(side="right", padx=5)
         
         # Botão de Reset Global
         btn_reset = tk.Button(self.root, text="🔄 Nova Análise (Reset)", command=self.resetar_sistema, bg="#FF5722", fg="white", font=("Arial", 11, "bold"))
@@ -89,10 +159,10 @@ class AnalisadorImagens:
         frame_nota = tk.LabelFrame(self.tab_analise, text="2. Imagem da Nota Fiscal", padx=10, pady=10)
         frame_nota.pack(fill="x", padx=10, pady=5)
         
-        self.btn_nota = tk.Button(frame_nota, text="Anexar Imagem da Nota", command=self.anexar_nota, state="disabled", bg="#4CAF50", fg="white", font=("Arial", 10, "bold"))
+        self.btn_nota = tk.Button(frame_nota, text="Anexar Imagem da Nota", command=self.anexar_nota, bg="#4CAF50", fg="white", font=("Arial", 10, "bold"))
         self.btn_nota.pack(side="left", padx=5)
         
-        self.label_nota = tk.Label(frame_nota, text="Primeiro analise a caixa", fg="gray")
+        self.label_nota = tk.Label(frame_nota, text="Nenhuma imagem selecionada", fg="gray")
         self.label_nota.pack(side="left", padx=5)
         
         self.btn_analisar_nota = tk.Button(frame_nota, text="Analisar Nota", command=self.analisar_nota, state="disabled", bg="#2196F3", fg="white", font=("Arial", 10, "bold"))
@@ -132,6 +202,18 @@ class AnalisadorImagens:
         self.lbl_veredito = tk.Label(self.frame_status, text="", font=("Arial", 14, "bold"))
         self.lbl_veredito.pack(anchor="w", pady=10)
         
+        # Label avisando se a mesma nota já foi conciliada antes (histórico)
+        self.lbl_historico = tk.Label(self.frame_status, text="", fg="#3F51B5", font=("Arial", 10))
+        self.lbl_historico.pack(anchor="w")
+        
+        # Label com acertos/falhas do cache de respostas
+        self.lbl_cache = tk.Label(self.frame_status, text="", fg="gray", font=("Arial", 9))
+        self.lbl_cache.pack(anchor="w")
+        
+        # Label com as métricas do limitador de requisições (fila, novas tentativas, 429)
+        self.lbl_limitador = tk.Label(self.frame_status, text="", fg="gray", font=("Arial", 9))
+        self.lbl_limitador.pack(anchor="w")
+        
         # Botões de ação
         frame_botoes = tk.Frame(self.tab_cruzamento, padx=10, pady=10)
         frame_botoes.pack(fill="x")
@@ -149,122 +231,223 @@ class AnalisadorImagens:
         self.text_cruzamento = scrolledtext.ScrolledText(frame_resultados, wrap=tk.WORD, font=("Arial", 10), state="disabled")
         self.text_cruzamento.pack(fill="both", expand=True)
 
+    def criar_aba_desempenho(self):
+        frame_etapas = tk.LabelFrame(self.tab_desempenho, text="Tempo por etapa (p50 / p95)", padx=10, pady=10)
+        frame_etapas.pack(fill="both", expand=True, padx=10, pady=5)
+        
+        self.lbl_percentis = tk.Label(frame_etapas, text=instrumentacao.descrever_percentis({}), font=("Courier", 10), justify="left", anchor="nw")
+        self.lbl_percentis.pack(fill="both", expand=True)
+        
+        frame_totais = tk.LabelFrame(self.tab_desempenho, text="Tokens, bytes e novas tentativas", padx=10, pady=10)
+        frame_totais.pack(fill="x", padx=10, pady=5)
+        
+        self.lbl_totais = tk.Label(frame_totais, text="", font=("Arial", 9), justify="left", anchor="w")
+        self.lbl_totais.pack(fill="x")
+    
     def atualizar_status_cruzamento(self):
         if self.informacoes_caixa:
             self.lbl_status_caixa.config(text="✓ Informações da Caixa: Carregadas", fg="green")
+        elif "caixa" in self.tarefas:
+            self.lbl_status_caixa.config(text="⏳ Informações da Caixa: Extraindo...", fg="orange")
+        else:
+            self.lbl_status_caixa.config(text="❌ Informações da Caixa: Pendente", fg="red")
         
         if self.informacoes_nota:
             self.lbl_status_nota.config(text="✓ Informações da Nota: Carregadas", fg="green")
+        elif "nota" in self.tarefas:
+            self.lbl_status_nota.config(text="⏳ Informações da Nota: Extraindo...", fg="orange")
+        else:
+            self.lbl_status_nota.config(text="❌ Informações da Nota: Pendente", fg="red")
             
-        if self.informacoes_caixa and self.informacoes_nota:
+        if self.informacoes_caixa and self.informacoes_nota and "cruzamento" not in self.tarefas:
             self.btn_cruzar.config(state="normal")
+        else:
+            self.btn_cruzar.config(state="disabled")
+    
+    def cruzar_se_pronto(self):
+        # As duas extrações terminaram: o cruzamento começa na hora
+        if self.informacoes_caixa and self.informacoes_nota:
+            self.notebook.select(1)
+            self.realizar_cruzamento()
             
     def realizar_cruzamento(self):
+        if "cruzamento" in self.tarefas:
+            return
+        
+        # Modo estruturado: cruzamento local e imediato; o LLM só entra se houver ambiguidade e o fallback estiver ativo
+        if self.modo_estruturado and self.dados_caixa is not None and self.dados_nota is not None:
+            veredito, relatorio = estruturado.comparar_localmente(self.dados_caixa, self.dados_nota)
+            if not (veredito["ambiguo"] and estruturado.fallback_llm_ativado()):
+                self.exibir_cruzamento_local(veredito, relatorio)
+                return
+        
+        # O texto do cruzamento aparece conforme o modelo gera a resposta
         self.text_cruzamento.config(state="normal")
         self.text_cruzamento.delete(1.0, tk.END)
-        self.text_cruzamento.insert(tk.END, "🔄 Realizando cruzamento de informações...\n\n")
+        self.text_cruzamento.insert(tk.END, "="*90 + "\n")
+        self.text_cruzamento.insert(tk.END, "ANÁLISE DE CRUZAMENTO - CAIXA vs NOTA FISCAL\n")
+        self.text_cruzamento.insert(tk.END, "="*90 + "\n\n")
         self.text_cruzamento.config(state="disabled")
-        self.root.update()
+        self.lbl_veredito.config(text="🔄 Realizando cruzamento de informações...", fg="gray")
+        self.lbl_historico.config(text="")
+        self.btn_cruzar.config(state="disabled")
+        self.estatisticas_cruzamento = {}
+        self.cruzamento_parcial = ""
+        self.tempo_renderizacao["cruzamento"] = 0.0
+        self.veredito_exibido = False
+        
+        informacoes_caixa = self.informacoes_caixa
+        informacoes_nota = self.informacoes_nota
+        estatisticas = self.estatisticas_cruzamento
+        self.tarefas["cruzamento"] = self.executor.executar(
+            "Cruzando informações",
+            lambda tarefa: analise.cruzar_informacoes(
+                self.client, self.deployment_name, informacoes_caixa, informacoes_nota,
+                cache=self.cache, cancelamento=tarefa.cancelamento, ao_receber_trecho=tarefa.publicar,
+                estatisticas=estatisticas
+            ),
+            self.concluir_cruzamento,
+            self.falhar_cruzamento,
+            ao_cancelar=self.cancelar_cruzamento,
+            ao_progresso=self.receber_trecho_cruzamento,
+        )
+    
+    def receber_trecho_cruzamento(self, trecho):
+        inicio = time.perf_counter()
+        self.cruzamento_parcial += trecho
+        self.text_cruzamento.config(state="normal")
+        self.text_cruzamento.insert(tk.END, trecho)
+        self.text_cruzamento.config(state="disabled")
+        self.tempo_renderizacao["cruzamento"] = self.tempo_renderizacao.get("cruzamento", 0.0) + time.perf_counter() - inicio
         
-        try:
-            completion = self.client.chat.completions.create(
-                model=self.deployment_name,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": f"""Realize um cruzamento SIMPLIFICADO e DIRETO entre as informações da caixa e da nota fiscal.
-Foque EXCLUSIVAMENTE nas informações cruciais: Produtos (Nome e Quantidade) e Número da Nota.
-
-INFORMAÇÕES DA CAIXA:
-{self.informacoes_caixa}
-
-INFORMAÇÕES DA NOTA FISCAL:
-{self.informacoes_nota}
-
-Por favor, forneça a análise no seguinte formato:
-
-1. COMPARAÇÃO DE PRODUTOS (Crucial):
-   Liste cada produto encontrado e compare a quantidade.
-   Formato:
-   - [Nome do Produto]: Caixa [Qtd] x Nota [Qtd] -> [Status: OK/DIVERGENTE]
-
-2. COMPARAÇÃO DO NÚMERO DA NOTA:
-   - Caixa: [Número]
-   - Nota: [Número]
-   - Status: [OK/DIVERGENTE]
-
-3. CONCLUSÃO RÁPIDA:
-   - Aprovado ou Reprovado com base apenas nos produtos e número da nota.
-
-4. DADOS ESTRUTURADOS (JSON):
-   Por favor, inclua ao final da resposta, EXATAMENTE o seguinte bloco JSON (e nada mais depois dele):
-   ```json
-   {{
-       "score": <numero_inteiro_0_a_100_baseado_apenas_em_produtos_e_numero_nota>,
-       "produtos_match": <true_se_nomes_e_quantidades_batem_senao_false>,
-       "nota_match": <true_se_numero_nota_igual_senao_false>
-   }}
-   ```"""
-                    }
-                ],
-            )
-            
-            resultado_cruzamento = completion.choices[0].message.content
-            
-            # Extrair JSON do final
-            try:
-                json_match = re.search(r"```json\s*({.*?})\s*```", resultado_cruzamento, re.DOTALL)
-                if json_match:
-                    dados_json = json.loads(json_match.group(1))
-                    score = dados_json.get("score", 0)
-                    produtos_match = dados_json.get("produtos_match", False)
-                    nota_match = dados_json.get("nota_match", False)
-                    
-                    # Lógica de Aprovação
-                    if score >= 70 and produtos_match and nota_match:
-                        self.lbl_veredito.config(text="✅ APROVADO", fg="green")
-                    else:
-                        motivos = []
-                        if score < 70: motivos.append(f"Score baixo ({score}%)")
-                        if not produtos_match: motivos.append("Produtos divergentes")
-                        if not nota_match: motivos.append("Nota fiscal divergente")
-                        
-                        texto_reprovado = "❌ REPROVADO"
-                        if motivos:
-                            texto_reprovado += f" ({', '.join(motivos)})"
-                        
-                        self.lbl_veredito.config(text=texto_reprovado, fg="red")
-                else:
-                    self.lbl_veredito.config(text="⚠️ Análise Manual Necessária (JSON não encontrado)", fg="orange")
-            except Exception as e:
-                print(f"Erro ao processar JSON: {e}")
-                self.lbl_veredito.config(text="⚠️ Erro ao processar veredito automático", fg="orange")
-            
-            self.text_cruzamento.config(state="normal")
-            self.text_cruzamento.delete(1.0, tk.END)
-            self.text_cruzamento.insert(tk.END, "="*90 + "\n")
-            self.text_cruzamento.insert(tk.END, "ANÁLISE DE CRUZAMENTO - CAIXA vs NOTA FISCAL\n")
-            self.text_cruzamento.insert(tk.END, "="*90 + "\n\n")
-            self.text_cruzamento.insert(tk.END, resultado_cruzamento + "\n\n")
-            self.text_cruzamento.insert(tk.END, "="*90 + "\n")
-            self.text_cruzamento.insert(tk.END, "Análise concluída com sucesso!\n")
-            self.text_cruzamento.config(state="disabled")
-            self.text_cruzamento.see(1.0)
-            
-            self.btn_cruzar.config(state="disabled")
-            self.btn_salvar.config(state="normal")
-            
-            messagebox.showinfo("Sucesso", "Cruzamento de informações concluído!")
-            
-        except Exception as e:
-            erro_msg = str(e)
-            if "429" in erro_msg:
-                erro_msg = "O sistema da IA está sobrecarregado no momento (Erro 429). Por favor, aguarde alguns instantes e tente novamente."
-            
-            self.text_cruzamento.config(state="normal")
-            self.text_cruzamento.insert(tk.END, f"\n❌ Erro ao realizar cruzamento: {erro_msg}\n")
-            self.text_cruzamento.config(state="disabled")
-            messagebox.showerror("Erro", f"Erro ao realizar cruzamento: {erro_msg}")
+        # O veredito é mostrado assim que o bloco JSON fecha, sem esperar o fim da resposta
+        if not self.veredito_exibido and "`" in trecho and analise.encontrar_bloco_json(self.cruzamento_parcial):
+            self.exibir_veredito(self.cruzamento_parcial)
+    
+    def exibir_veredito(self, resultado_cruzamento):
+        veredito = analise.interpretar_veredito(resultado_cruzamento)
+        if veredito["status"] == analise.ERRO:
+            print(veredito["motivos"][0])
+        self.mostrar_veredito(veredito)
+    
+    def mostrar_veredito(self, veredito):
+        cores = {analise.APROVADO: "green", analise.REPROVADO: "red"}
+        self.lbl_veredito.config(text=analise.descrever_veredito(veredito), fg=cores.get(veredito["status"], "orange"))
+        self.veredito = veredito
+        self.veredito_exibido = True
+    
+    def registrar_conciliacao(self, cruzamento, campos=None):
+        if self.resultados is None:
+            return
+        registro = {
+            "caixa": self.imagem_caixa_path,
+            "nota": self.imagem_nota_path,
+            **self.veredito,
+            **(campos or {}),
+            "informacoes_caixa": self.dados_caixa or self.informacoes_caixa,
+            "informacoes_nota": self.dados_nota or self.informacoes_nota,
+            "imagem_caixa": self.estatisticas_caixa,
+            "imagem_nota": self.estatisticas_nota,
+            "estatisticas_cruzamento": self.estatisticas_cruzamento,
+            "cruzamento": cruzamento,
+            "duracao_s": round(time.perf_counter() - self.inicio_analise, 3) if self.inicio_analise else None,
+            "erro": None,
+        }
+        modo = estruturado.MODO_ESTRUTURADO if self.modo_estruturado else estruturado.MODO_TEXTO
+        deployment_name = self.deployment_name if self.cliente_pronto() else None
+        resultados = self.resultados
+        
+        def gravar(tarefa):
+            # Antes de gravar, procura se a mesma nota já tinha sido conciliada
+            campos_indice = campos_indexados(registro)
+            anterior = resultados.ultima_conciliacao(campos_indice["numero_nota"], campos_indice["cnpj"])
+            resultados.registrar(registro, origem="interface", modo=modo, deployment_name=deployment_name)
+            return anterior
+        
+        # Hash das imagens e SQLite fora da thread do Tk; um registro anterior ainda
+        # em andamento continua gravando, mas não mexe mais no aviso
+        if "historico" in self.tarefas:
+            self.executor.cancelar(self.tarefas["historico"])
+        self.tarefas["historico"] = self.executor.executar(
+            "Gravando no histórico",
+            gravar,
+            self.concluir_registro_conciliacao,
+            self.falhar_registro_conciliacao,
+            ao_cancelar=lambda: self.tarefas.pop("historico", None),
+        )
+    
+    def concluir_registro_conciliacao(self, anterior):
+        del self.tarefas["historico"]
+        self.lbl_historico.config(text=f"ℹ️ {descrever_conciliacao(anterior)}" if anterior else "")
+    
+    def falhar_registro_conciliacao(self, e):
+        del self.tarefas["historico"]
+        print(f"Erro ao gravar no histórico de conciliações: {e}")
+    
+    def exibir_cruzamento_local(self, veredito, relatorio):
+        self.estatisticas_cruzamento = {}
+        self.mostrar_veredito(veredito)
+        self.registrar_conciliacao(relatorio)
+        
+        self.text_cruzamento.config(state="normal")
+        self.text_cruzamento.delete(1.0, tk.END)
+        self.text_cruzamento.insert(tk.END, "="*90 + "\n")
+        self.text_cruzamento.insert(tk.END, "ANÁLISE DE CRUZAMENTO (LOCAL) - CAIXA vs NOTA FISCAL\n")
+        self.text_cruzamento.insert(tk.END, "="*90 + "\n\n")
+        self.text_cruzamento.insert(tk.END, relatorio + "\n\n")
+        self.text_cruzamento.insert(tk.END, "="*90 + "\n")
+        self.text_cruzamento.insert(tk.END, "Análise concluída com sucesso!\n")
+        self.text_cruzamento.config(state="disabled")
+        self.text_cruzamento.see(1.0)
+        
+        self.btn_cruzar.config(state="disabled")
+        self.btn_salvar.config(state="normal")
+        
+        messagebox.showinfo("Sucesso", "Cruzamento de informações concluído!")
+    
+    def concluir_cruzamento(self, resultado_cruzamento):
+        del self.tarefas["cruzamento"]
+        self.registrar_renderizacao("cruzamento")
+        self.atualizar_status_cache()
+        
+        if not self.veredito_exibido:
+            self.exibir_veredito(resultado_cruzamento)
+        self.registrar_conciliacao(resultado_cruzamento)
+        
+        self.text_cruzamento.config(state="normal")
+        self.text_cruzamento.insert(tk.END, "\n\n")
+        self.text_cruzamento.insert(tk.END, "="*90 + "\n")
+        self.text_cruzamento.insert(tk.END, "Análise concluída com sucesso!\n")
+        self.text_cruzamento.config(state="disabled")
+        self.text_cruzamento.see(1.0)
+        
+        self.btn_cruzar.config(state="disabled")
+        self.btn_salvar.config(state="normal")
+        
+        messagebox.showinfo("Sucesso", "Cruzamento de informações concluído!")
+    
+    def falhar_cruzamento(self, e):
+        del self.tarefas["cruzamento"]
+        self.atualizar_status_cruzamento()
+        self.lbl_veredito.config(text="")
+        
+        erro_msg = str(e)
+        if "429" in erro_msg:
+            erro_msg = "O sistema da IA continua sobrecarregado (Erro 429) mesmo após novas tentativas automáticas. Por favor, aguarde alguns instantes e tente novamente."
+        
+        self.text_cruzamento.config(state="normal")
+        self.text_cruzamento.insert(tk.END, f"\n❌ Erro ao realizar cruzamento: {erro_msg}\n")
+        self.text_cruzamento.config(state="disabled")
+        messagebox.showerror("Erro", f"Erro ao realizar cruzamento: {erro_msg}")
+    
+    def cancelar_cruzamento(self):
+        del self.tarefas["cruzamento"]
+        self.atualizar_status_cruzamento()
+        self.lbl_veredito.config(text="")
+        
+        self.text_cruzamento.config(state="normal")
+        self.text_cruzamento.insert(tk.END, "\n⛔ Cruzamento cancelado.\n")
+        self.text_cruzamento.config(state="disabled")
     
     def salvar_relatorio(self):
         try:
@@ -282,17 +465,24 @@ Por favor, forneça a análise no seguinte formato:
 
     def resetar_sistema(self):
         if messagebox.askyesno("Confirmar Reset", "Deseja limpar tudo e iniciar uma nova análise?"):
+            # Cancelar chamadas em andamento
+            self.executor.cancelar_todas()
+            
             # Limpar variáveis
             self.imagem_caixa_path = None
             self.imagem_nota_path = None
             self.informacoes_caixa = None
             self.informacoes_nota = None
+            self.dados_caixa = None
+            self.dados_nota = None
+            self.verificacao = None
+            self.inicio_analise = None
+            self.veredito = None
             
             # Resetar UI Aba 1
             self.label_caixa.config(text="Nenhuma imagem selecionada", fg="gray")
-            self.label_nota.config(text="Primeiro analise a caixa", fg="gray")
+            self.label_nota.config(text="Nenhuma imagem selecionada", fg="gray")
             self.btn_analisar_caixa.config(state="disabled")
-            self.btn_nota.config(state="disabled")
             self.btn_analisar_nota.config(state="disabled")
             self.text_resultados.delete(1.0, tk.END)
             
@@ -300,6 +490,7 @@ Por favor, forneça a análise no seguinte formato:
             self.lbl_status_caixa.config(text="❌ Informações da Caixa: Pendente", fg="red")
             self.lbl_status_nota.config(text="❌ Informações da Nota: Pendente", fg="red")
             self.lbl_veredito.config(text="")
+            self.lbl_historico.config(text="")
             self.btn_cruzar.config(state="disabled")
             self.btn_salvar.config(state="disabled")
             self.text_cruzamento.config(state="normal")
@@ -311,6 +502,83 @@ Por favor, forneça a análise no seguinte formato:
             
             messagebox.showinfo("Reset", "Sistema pronto para nova análise!")
     
+    def relogio_progresso(self):
+        self.atualizar_progresso()
+        self.atualizar_desempenho()
+        self.root.after(200, self.relogio_progresso)
+    
+    def atualizar_desempenho(self):
+        # Só recalcula os percentis quando chegou alguma medição nova
+        histograma = instrumentacao.instrumentacao_padrao().histograma
+        if histograma.versao == self.versao_desempenho:
+            return
+        self.versao_desempenho = histograma.versao
+        self.lbl_percentis.config(text=instrumentacao.descrever_percentis(histograma.percentis()))
+        self.lbl_totais.config(text=instrumentacao.descrever_totais(histograma.totais()))
+    
+    def medir_renderizacao(self, operacao, inserir):
+        self.tempo_renderizacao[operacao] = 0.0
+        def inserir_medindo(trecho):
+            inicio = time.perf_counter()
+            inserir(trecho)
+            self.tempo_renderizacao[operacao] += time.perf_counter() - inicio
+        return inserir_medindo
+    
+    def registrar_renderizacao(self, operacao):
+        duracao = self.tempo_renderizacao.pop(operacao, None)
+        if duracao:
+            instrumentacao.registrar_etapa(operacao, "renderizacao", duracao)
+    
+    def fechar(self):
+        self.executor.cancelar_todas()
+        # Grava o que ainda estiver pendente nos sinks (ex.: arquivo do Prometheus)
+        instrumentacao.instrumentacao_padrao().fechar()
+        self.root.destroy()
+    
+    def atualizar_progresso(self):
+        if self.cliente_pronto() and hasattr(self.client, "limitador"):
+            texto = descrever_metricas(self.client.limitador.metricas())
+            if isinstance(self.client.client, BalanceadorEndpoints):
+                texto += "\n" + descrever_endpoints(self.client.client.metricas())
+            self.lbl_limitador.config(text=texto, justify="left")
+        
+        # Mostra o tempo decorrido de cada chamada em andamento
+        if self.executor.em_andamento():
+            partes = [f"{tarefa.descricao} ({tarefa.tempo_decorrido():.1f}s)" for tarefa in self.executor.tarefas]
+            self.lbl_progresso.config(text="⏳ " + " | ".join(partes), fg="black")
+            self.btn_cancelar.config(state="normal", bg="#F44336")
+            if not self.barra_ativa:
+                self.barra_progresso.start(15)
+                self.barra_ativa = True
+        else:
+            self.lbl_progresso.config(text="Nenhuma análise em andamento", fg="gray")
+            self.btn_cancelar.config(state="disabled", bg="#9E9E9E")
+            self.barra_progresso.stop()
+            self.barra_ativa = False
+    
+    def cancelar_tarefas(self):
+        self.executor.cancelar_todas()
+    
+    def atualizar_status_cache(self):
+        if self.cache is not None:
+            self.lbl_cache.config(text=descrever_estatisticas(self.cache.estatisticas()))
+    
+    def registrar_preprocessamento(self, info_imagem):
+        self.atualizar_status_cache()
+        if info_imagem.get("cache"):
+            self.text_resultados.insert(tk.END, "♻️ Resultado reaproveitado do cache (sem chamada ao modelo)\n")
+            return
+        
+        original_kb = info_imagem["bytes_original"] / 1024
+        processado_kb = info_imagem["bytes_processado"] / 1024
+        economia_kb = info_imagem["bytes_economizados"] / 1024
+        memoria_mb = info_imagem["memoria_pico_estimada_bytes"] / 1024 / 1024
+        self.text_resultados.insert(
+            tk.END,
+            f"📦 Imagem enviada como {info_imagem['mime']}: {original_kb:.0f} KB -> {processado_kb:.0f} KB "
+            f"({economia_kb:.0f} KB economizados, ~{memoria_mb:.1f} MB de memória no pico)\n"
+        )
+    
     def anexar_caixa(self):
         filepath = filedialog.askopenfilename(
             title="Selecione a imagem da caixa",
@@ -321,6 +589,12 @@ Por favor, forneça a análise no seguinte formato:
             self.label_caixa.config(text=os.path.basename(filepath), fg="green")
             self.btn_analisar_caixa.config(state="normal")
             self.text_resultados.insert(tk.END, f"✓ Imagem da caixa selecionada: {os.path.basename(filepath)}\n\n")
+            self.descartar_par_anterior("caixa")
+            self.informacoes_caixa = None
+            self.dados_caixa = None
+            self.verificacao = None
+            self.inicio_analise = None
+            self.iniciar_extracoes()
     
     def anexar_nota(self):
         filepath = filedialog.askopenfilename(
@@ -332,107 +606,251 @@ Por favor, forneça a análise no seguinte formato:
             self.label_nota.config(text=os.path.basename(filepath), fg="green")
             self.btn_analisar_nota.config(state="normal")
             self.text_resultados.insert(tk.END, f"✓ Imagem da nota selecionada: {os.path.basename(filepath)}\n\n")
+            self.descartar_par_anterior("nota")
+            self.informacoes_nota = None
+            self.dados_nota = None
+            self.verificacao = None
+            self.inicio_analise = None
+            self.iniciar_extracoes()
+    
+    def descartar_par_anterior(self, tipo):
+        # Uma imagem nova invalida a extração dela e a verificação local, o cruzamento e o veredito do par anterior
+        for nome in (tipo, "verificacao"):
+            if nome in self.tarefas:
+                self.executor.cancelar(self.tarefas[nome])
+        self.descartar_cruzamento()
+    
+    def descartar_cruzamento(self):
+        # O cruzamento (em andamento ou já exibido) deixa de valer quando uma das extrações é refeita
+        for nome in ("cruzamento", "historico"):
+            if nome in self.tarefas:
+                self.executor.cancelar(self.tarefas[nome])
+        self.veredito = None
+        self.lbl_veredito.config(text="")
+        self.lbl_historico.config(text="")
+        self.text_cruzamento.config(state="normal")
+        self.text_cruzamento.delete(1.0, tk.END)
+        self.text_cruzamento.config(state="disabled")
+        self.btn_salvar.config(state="disabled")
+    
+    def iniciar_extracoes(self):
+        # Assim que as duas imagens estão anexadas, as duas extrações rodam em paralelo
+        if not (self.imagem_caixa_path and self.imagem_nota_path):
+            return
+        if self.inicio_analise is None:
+            self.inicio_analise = time.perf_counter()
+        
+        # Antes do modelo, a verificação local pode reprovar o par sem nenhuma chamada à API
+        if verificacao_local.verificacao_ativada() and self.verificacao is None:
+            if "verificacao" not in self.tarefas:
+                self.verificar_localmente()
+            return
+        if self.verificacao is not None and self.verificacao["status"] == verificacao_local.DIVERGENTE:
+            return
+        
+        if self.informacoes_caixa is None and "caixa" not in self.tarefas:
+            self.analisar_caixa()
+        if self.informacoes_nota is None and "nota" not in self.tarefas:
+            self.analisar_nota()
+    
+    def verificar_localmente(self):
+        self.text_resultados.insert(tk.END, "🔎 Verificando número da nota localmente (código de barras/OCR)...\n")
+        caminho_caixa = self.imagem_caixa_path
+        caminho_nota = self.imagem_nota_path
+        self.tarefas["verificacao"] = self.executor.executar(
+            "Verificação local",
+            lambda tarefa: verificacao_local.verificar_par(caminho_caixa, caminho_nota),
+            self.concluir_verificacao_local,
+            self.falhar_verificacao_local,
+            ao_cancelar=lambda: self.tarefas.pop("verificacao", None),
+        )
+    
+    def concluir_verificacao_local(self, verificacao):
+        del self.tarefas["verificacao"]
+        self.verificacao = verificacao
+        caixa = verificacao["caixa"]["numero_nota"] or "não lido"
+        nota = verificacao["nota"]["numero_nota"] or "não lido"
+        self.text_resultados.insert(tk.END, f"   Caixa: {caixa} | Nota: {nota} -> {verificacao['status']}\n\n")
+        
+        if verificacao["status"] == verificacao_local.DIVERGENTE:
+            veredito = verificacao_local.veredito_divergente(verificacao)
+            self.mostrar_veredito(veredito)
+            self.estatisticas_caixa = self.estatisticas_nota = self.estatisticas_cruzamento = {}
+            self.registrar_conciliacao(None, verificacao_local.campos_nota(verificacao))
+            self.text_cruzamento.config(state="normal")
+            self.text_cruzamento.delete(1.0, tk.END)
+            self.text_cruzamento.insert(tk.END, "="*90 + "\n")
+            self.text_cruzamento.insert(tk.END, "VERIFICAÇÃO LOCAL - CAIXA vs NOTA FISCAL\n")
+            self.text_cruzamento.insert(tk.END, "="*90 + "\n\n")
+            self.text_cruzamento.insert(tk.END, f"Chave de acesso da caixa: {verificacao['caixa']['chave_acesso']}\n")
+            self.text_cruzamento.insert(tk.END, f"Chave de acesso da nota: {verificacao['nota']['chave_acesso']}\n\n")
+            self.text_cruzamento.insert(tk.END, "Os números não conferem; o par foi reprovado sem consultar o modelo.\n")
+            self.text_cruzamento.config(state="disabled")
+            self.btn_salvar.config(state="normal")
+            self.notebook.select(1)
+            return
+        
+        self.iniciar_extracoes()
+    
+    def falhar_verificacao_local(self, e):
+        # Falha na leitura local não impede a análise pelo modelo
+        del self.tarefas["verificacao"]
+        self.text_resultados.insert(tk.END, f"   ⚠️ Verificação local indisponível: {str(e)}\n\n")
+        self.verificacao = {"status": verificacao_local.INCONCLUSIVO, "dicas": {}}
+        self.iniciar_extracoes()
     
     def analisar_caixa(self):
         if not self.imagem_caixa_path:
             messagebox.showerror("Erro", "Selecione uma imagem da caixa primeiro!")
             return
+        if "caixa" in self.tarefas:
+            return
         
+        self.descartar_cruzamento()
+        self.informacoes_caixa = None
+        self.dados_caixa = None
+        self.btn_analisar_caixa.config(state="disabled")
         self.text_resultados.insert(tk.END, "🔍 Analisando imagem da caixa...\n")
-        self.root.update()
         
-        try:
-            with open(self.imagem_caixa_path, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-            
-            completion = self.client.chat.completions.create(
-                model=self.deployment_name,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "Por favor, extraia todas as informações contidas nesta imagem da caixa. Liste todos os detalhes visíveis como textos, números, códigos de barras, etiquetas, endereços, dimensões, produtos e qualquer outra informação relevante."
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/png;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
+        # Cada extração escreve na sua própria seção (marca "fim_caixa"), já que caixa e nota chegam em paralelo
+        self.text_resultados.insert(tk.END, "="*80 + "\n")
+        self.text_resultados.insert(tk.END, "INFORMAÇÕES DA CAIXA:\n")
+        self.text_resultados.insert(tk.END, "="*80 + "\n\n\n")
+        self.text_resultados.mark_set("fim_caixa", "end-3c")
+        self.text_resultados.mark_gravity("fim_caixa", "right")
+        self.text_resultados.see(tk.END)
+        
+        caminho = self.imagem_caixa_path
+        dica = self.verificacao["dicas"].get("caixa") if self.verificacao else None
+        info_imagem = {}
+        if self.modo_estruturado:
+            # A resposta em JSON não é legível em streaming; o resumo aparece ao concluir
+            funcao = lambda tarefa: estruturado.extrair_dados(
+                self.client, self.deployment_name, caminho, "caixa", estatisticas=info_imagem, cache=self.cache,
+                cancelamento=tarefa.cancelamento, dica=dica
             )
-            
-            self.informacoes_caixa = completion.choices[0].message.content
-            
-            self.text_resultados.insert(tk.END, "="*80 + "\n")
-            self.text_resultados.insert(tk.END, "INFORMAÇÕES DA CAIXA:\n")
-            self.text_resultados.insert(tk.END, "="*80 + "\n")
-            self.text_resultados.insert(tk.END, self.informacoes_caixa + "\n\n")
-            self.text_resultados.see(tk.END)
-            
-            # Habilitar próxima etapa
-            self.btn_nota.config(state="normal")
-            self.label_nota.config(text="Nenhuma imagem selecionada", fg="gray")
-            self.atualizar_status_cruzamento()
-            
-            messagebox.showinfo("Sucesso", "Análise da caixa concluída! Agora você pode anexar a imagem da nota.")
-            
-        except Exception as e:
-            messagebox.showerror("Erro", f"Erro ao analisar a caixa: {str(e)}")
-            self.text_resultados.insert(tk.END, f"❌ Erro: {str(e)}\n\n")
+            ao_concluir = lambda dados: self.concluir_analise_caixa(estruturado.formatar_dados(dados), info_imagem, dados)
+        else:
+            funcao = lambda tarefa: analise.extrair_informacoes_caixa(
+                self.client, self.deployment_name, caminho, estatisticas=info_imagem, cache=self.cache,
+                cancelamento=tarefa.cancelamento, ao_receber_trecho=tarefa.publicar, dica=dica
+            )
+            ao_concluir = lambda informacoes: self.concluir_analise_caixa(informacoes, info_imagem)
+        
+        self.tarefas["caixa"] = self.executor.executar(
+            "Analisando caixa",
+            funcao,
+            ao_concluir,
+            self.falhar_analise_caixa,
+            ao_cancelar=self.cancelar_analise_caixa,
+            ao_progresso=self.medir_renderizacao("caixa", lambda trecho: self.text_resultados.insert("fim_caixa", trecho)),
+        )
+        self.atualizar_status_cruzamento()
+    
+    def concluir_analise_caixa(self, informacoes, info_imagem, dados=None):
+        del self.tarefas["caixa"]
+        self.registrar_renderizacao("caixa")
+        self.informacoes_caixa = informacoes
+        self.dados_caixa = dados
+        self.estatisticas_caixa = info_imagem
+        if dados is not None:
+            self.text_resultados.insert("fim_caixa", informacoes)
+        self.btn_analisar_caixa.config(state="normal")
+        self.registrar_preprocessamento(info_imagem)
+        self.text_resultados.see(tk.END)
+        
+        self.atualizar_status_cruzamento()
+        self.cruzar_se_pronto()
+    
+    def falhar_analise_caixa(self, e):
+        del self.tarefas["caixa"]
+        self.btn_analisar_caixa.config(state="normal")
+        self.atualizar_status_cruzamento()
+        self.text_resultados.insert(tk.END, f"❌ Erro: {str(e)}\n\n")
+        messagebox.showerror("Erro", f"Erro ao analisar a caixa: {str(e)}")
+    
+    def cancelar_analise_caixa(self):
+        del self.tarefas["caixa"]
+        self.btn_analisar_caixa.config(state="normal" if self.imagem_caixa_path else "disabled")
+        self.atualizar_status_cruzamento()
+        self.text_resultados.insert(tk.END, "⛔ Análise da caixa cancelada.\n\n")
     
     def analisar_nota(self):
         if not self.imagem_nota_path:
             messagebox.showerror("Erro", "Selecione uma imagem da nota primeiro!")
             return
+        if "nota" in self.tarefas:
+            return
         
+        self.descartar_cruzamento()
+        self.informacoes_nota = None
+        self.dados_nota = None
+        self.btn_analisar_nota.config(state="disabled")
         self.text_resultados.insert(tk.END, "🔍 Analisando imagem da nota fiscal...\n")
-        self.root.update()
         
-        try:
-            with open(self.imagem_nota_path, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-            
-            completion = self.client.chat.completions.create(
-                model=self.deployment_name,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "Por favor, extraia todas as informações contidas nesta nota fiscal. Liste todos os detalhes visíveis como número da nota, data, produtos, quantidades, valores, destinatário, remetente, CNPJ, e qualquer outra informação relevante."
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/png;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
+        # Cada extração escreve na sua própria seção (marca "fim_nota"), já que caixa e nota chegam em paralelo
+        self.text_resultados.insert(tk.END, "="*80 + "\n")
+        self.text_resultados.insert(tk.END, "INFORMAÇÕES DA NOTA FISCAL:\n")
+        self.text_resultados.insert(tk.END, "="*80 + "\n\n\n")
+        self.text_resultados.mark_set("fim_nota", "end-3c")
+        self.text_resultados.mark_gravity("fim_nota", "right")
+        self.text_resultados.see(tk.END)
+        
+        caminho = self.imagem_nota_path
+        dica = self.verificacao["dicas"].get("nota") if self.verificacao else None
+        info_imagem = {}
+        if self.modo_estruturado:
+            # A resposta em JSON não é legível em streaming; o resumo aparece ao concluir
+            funcao = lambda tarefa: estruturado.extrair_dados(
+                self.client, self.deployment_name, caminho, "nota", estatisticas=info_imagem, cache=self.cache,
+                cancelamento=tarefa.cancelamento, dica=dica
             )
-            
-            self.informacoes_nota = completion.choices[0].message.content
-            
-            self.text_resultados.insert(tk.END, "="*80 + "\n")
-            self.text_resultados.insert(tk.END, "INFORMAÇÕES DA NOTA FISCAL:\n")
-            self.text_resultados.insert(tk.END, "="*80 + "\n")
-            self.text_resultados.insert(tk.END, self.informacoes_nota + "\n\n")
-            self.text_resultados.see(tk.END)
-            
-            self.atualizar_status_cruzamento()
-            
-            messagebox.showinfo("Sucesso", "Análise da nota concluída! Vá para a aba 'Cruzamento de Informações'.")
-            
-        except Exception as e:
-            messagebox.showerror("Erro", f"Erro ao analisar a nota: {str(e)}")
-            self.text_resultados.insert(tk.END, f"❌ Erro: {str(e)}\n\n")
+            ao_concluir = lambda dados: self.concluir_analise_nota(estruturado.formatar_dados(dados), info_imagem, dados)
+        else:
+            funcao = lambda tarefa: analise.extrair_informacoes_nota(
+                self.client, self.deployment_name, caminho, estatisticas=info_imagem, cache=self.cache,
+                cancelamento=tarefa.cancelamento, ao_receber_trecho=tarefa.publicar, dica=dica
+            )
+            ao_concluir = lambda informacoes: self.concluir_analise_nota(informacoes, info_imagem)
+        
+        self.tarefas["nota"] = self.executor.executar(
+            "Analisando nota",
+            funcao,
+            ao_concluir,
+            self.falhar_analise_nota,
+            ao_cancelar=self.cancelar_analise_nota,
+            ao_progresso=self.medir_renderizacao("nota", lambda trecho: self.text_resultados.insert("fim_nota", trecho)),
+        )
+        self.atualizar_status_cruzamento()
+    
+    def concluir_analise_nota(self, informacoes, info_imagem, dados=None):
+        del self.tarefas["nota"]
+        self.registrar_renderizacao("nota")
+        self.informacoes_nota = informacoes
+        self.dados_nota = dados
+        self.estatisticas_nota = info_imagem
+        if dados is not None:
+            self.text_resultados.insert("fim_nota", informacoes)
+        self.btn_analisar_nota.config(state="normal")
+        self.registrar_preprocessamento(info_imagem)
+        self.text_resultados.see(tk.END)
+        
+        self.atualizar_status_cruzamento()
+        self.cruzar_se_pronto()
+    
+    def falhar_analise_nota(self, e):
+        del self.tarefas["nota"]
+        self.btn_analisar_nota.config(state="normal")
+        self.atualizar_status_cruzamento()
+        self.text_resultados.insert(tk.END, f"❌ Erro: {str(e)}\n\n")
+        messagebox.showerror("Erro", f"Erro ao analisar a nota: {str(e)}")
+    
+    def cancelar_analise_nota(self):
+        del self.tarefas["nota"]
+        self.btn_analisar_nota.config(state="normal" if self.imagem_nota_path else "disabled")
+        self.atualizar_status_cruzamento()
+        self.text_resultados.insert(tk.END, "⛔ Análise da nota cancelada.\n\n")
+
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,429 @@
+"""Extração e cruzamento de informações, sem dependência da interface Tkinter.
+
+Usado tanto pela interface (Chat.py) quanto pelo processamento em lote (lote.py).
+"""
+import json
+import re
+import time
+
+import cache as cache_respostas
+import imagens
+import instrumentacao
+
+PROMPT_CAIXA = "Por favor, extraia todas as informações contidas nesta imagem da caixa. Liste todos os detalhes visíveis como textos, números, códigos de barras, etiquetas, endereços, dimensões, produtos e qualquer outra informação relevante."
+
+PROMPT_NOTA = "Por favor, extraia todas as informações contidas nesta nota fiscal. Liste todos os detalhes visíveis como número da nota, data, produtos, quantidades, valores, destinatário, remetente, CNPJ, e qualquer outra informação relevante."
+
+# Score mínimo para aprovação automática
+SCORE_MINIMO = 70
+
+APROVADO = "APROVADO"
+REPROVADO = "REPROVADO"
+MANUAL = "MANUAL"
+ERRO = "ERRO"
+
+# Bloco ```json``` com o veredito no final do cruzamento
+PADRAO_BLOCO_JSON = re.compile(r"```json\s*({.*?})\s*```", re.DOTALL)
+
+
+class OperacaoCancelada(Exception):
+    pass
+
+
+def verificar_cancelamento(cancelamento):
+    if cancelamento is not None and cancelamento.is_set():
+        raise OperacaoCancelada()
+
+
+def montar_prompt_cruzamento(informacoes_caixa, informacoes_nota):
+    return f"""Realize um cruzamento SIMPLIFICADO e DIRETO entre as informações da caixa e da nota fiscal.
+Foque EXCLUSIVAMENTE nas informações cruciais: Produtos (Nome e Quantidade) e Número da Nota.
+
+INFORMAÇÕES DA CAIXA:
+{informacoes_caixa}
+
+INFORMAÇÕES DA NOTA FISCAL:
+{informacoes_nota}
+
+Por favor, forneça a análise no seguinte formato:
+
+1. COMPARAÇÃO DE PRODUTOS (Crucial):
+   Liste cada produto encontrado e compare a quantidade.
+   Formato:
+   - [Nome do Produto]: Caixa [Qtd] x Nota [Qtd] -> [Status: OK/DIVERGENTE]
+
+2. COMPARAÇÃO DO NÚMERO DA NOTA:
+   - Caixa: [Número]
+   - Nota: [Número]
+   - Status: [OK/DIVERGENTE]
+
+3. CONCLUSÃO RÁPIDA:
+   - Aprovado ou Reprovado com base apenas nos produtos e número da nota.
+
+4. DADOS ESTRUTURADOS (JSON):
+   Por favor, inclua ao final da resposta, EXATAMENTE o seguinte bloco JSON (e nada mais depois dele):
+   ```json
+   {{
+       "score": <numero_inteiro_0_a_100_baseado_apenas_em_produtos_e_numero_nota>,
+       "produtos_match": <true_se_nomes_e_quantidades_batem_senao_false>,
+       "nota_match": <true_se_numero_nota_igual_senao_false>
+   }}
+   ```"""
+
+
+def somar_uso(uso, usage):
+    """Acumula em `uso` os tokens informados pela API (quando vierem na resposta)."""
+    if uso is None or usage is None:
+        return
+    uso["tokens_entrada"] = uso.get("tokens_entrada", 0) + (usage.prompt_tokens or 0)
+    uso["tokens_saida"] = uso.get("tokens_saida", 0) + (usage.completion_tokens or 0)
+
+
+def tamanho_mensagens(messages):
+    """Bytes de texto e de data URLs enviados na conversa (sem o envelope JSON)."""
+    total = 0
+    for mensagem in messages:
+        conteudo = mensagem["content"]
+        partes = conteudo if isinstance(conteudo, list) else [{"type": "text", "text": conteudo}]
+        for parte in partes:
+            total += len(parte["text"]) if parte["type"] == "text" else len(parte["image_url"]["url"])
+    return total
+
+
+def descartar_imagens(messages):
+    """Troca as data URLs por "" para a str da imagem (até alguns MB) não ficar viva durante o streaming."""
+    for mensagem in messages:
+        if isinstance(mensagem["content"], list):
+            for parte in mensagem["content"]:
+                if parte["type"] == "image_url":
+                    parte["image_url"]["url"] = ""
+
+
+def completar(client, deployment_name, messages, cancelamento=None, ao_receber_trecho=None, response_format=None,
+              uso=None, etapas=None):
+    """Envia a conversa ao modelo e devolve o texto da resposta.
+
+    Com ao_receber_trecho a resposta vem em streaming e cada trecho é repassado
+    assim que chega; um cancelamento fecha o stream no meio da resposta. Se `uso`
+    for um dicionário, recebe os tokens de entrada/saída, os bytes enviados e as
+    novas tentativas da chamada; `etapas` recebe a duração de "fila",
+    "primeiro_trecho" e "modelo" (ver instrumentacao.py).
+
+    As imagens de `messages` são descartadas assim que a requisição é aceita
+    (depois disso não há mais novas tentativas), então a lista não deve ser reutilizada.
+    """
+    verificar_cancelamento(cancelamento)
+    if uso is None:
+        uso = {}
+    if etapas is None:
+        etapas = {}
+    uso["bytes_enviados"] = tamanho_mensagens(messages)
+    opcoes = {}
+    if cancelamento is not None and hasattr(client, "limitador"):
+        # Só o cliente limitado aceita o evento (interrompe a espera na fila e o backoff)
+        opcoes["cancelamento"] = cancelamento
+    if response_format is not None:
+        opcoes["response_format"] = response_format
+
+    inicio = time.perf_counter()
+    try:
+        if ao_receber_trecho is None:
+            completion = client.chat.completions.create(
+                model=deployment_name,
+                messages=messages,
+                **opcoes
+            )
+            descartar_imagens(messages)
+            resposta = completion.choices[0].message.content
+            somar_uso(uso, getattr(completion, "usage", None))
+            verificar_cancelamento(cancelamento)
+            return resposta
+
+        stream = client.chat.completions.create(
+            model=deployment_name,
+            messages=messages,
+            stream=True,
+            # O último chunk traz o uso de tokens da resposta inteira
+            stream_options={"include_usage": True},
+            **opcoes
+        )
+        descartar_imagens(messages)
+        trechos = []
+        try:
+            for chunk in stream:
+                if cancelamento is not None and cancelamento.is_set():
+                    raise OperacaoCancelada()
+                somar_uso(uso, getattr(chunk, "usage", None))
+                # O Azure pode enviar chunks sem choices (ex.: resultado do filtro de conteúdo)
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if not trechos:
+                    etapas["primeiro_trecho"] = time.perf_counter() - inicio
+                trecho = chunk.choices[0].delta.content
+                trechos.append(trecho)
+                ao_receber_trecho(trecho)
+        finally:
+            stream.close()
+        return "".join(trechos)
+    finally:
+        # Espera na fila e novas tentativas ficam no limitador; o resto é envio + geração
+        chamada = client.limitador.ultima_chamada() if hasattr(client, "limitador") else {}
+        fila = chamada.get("espera_fila_s", 0.0)
+        uso["novas_tentativas"] = chamada.get("novas_tentativas", 0)
+        etapas["fila"] = fila
+        etapas["modelo"] = time.perf_counter() - inicio - fila
+        if "primeiro_trecho" in etapas:
+            etapas["primeiro_trecho"] -= fila
+
+
+def registrar_chamada(operacao, inicio, etapas, estatisticas, erro=None):
+    etapas["total"] = time.perf_counter() - inicio
+    instrumentacao.registrar(
+        operacao, etapas, erro=erro,
+        memoria_pico_estimada_bytes=estatisticas.get("memoria_pico_estimada_bytes"),
+        **{contador: estatisticas[contador] for contador in instrumentacao.CONTADORES if contador in estatisticas}
+    )
+
+
+def extrair_informacoes(client, deployment_name, caminho_imagem, prompt, perfil=None, estatisticas=None, cache=None,
+                        cancelamento=None, ao_receber_trecho=None, response_format=None, operacao="extracao",
+                        validar=None):
+    """Envia a imagem com o prompt ao modelo e devolve o texto extraído (do cache, se houver).
+
+    `validar(resposta)`, se informado, roda antes de gravar no cache: uma resposta
+    inválida levanta o erro dele e não fica guardada. Respostas vazias nunca são gravadas.
+    """
+    if estatisticas is None:
+        estatisticas = {}
+    inicio_total = time.perf_counter()
+
+    if cache is not None:
+        chave = cache_respostas.chave_extracao(caminho_imagem, prompt, deployment_name, perfil)
+        informacoes = cache.obter(chave, cache_respostas.EXTRACAO)
+        estatisticas["cache"] = informacoes is not None
+        if informacoes is not None:
+            if ao_receber_trecho is not None:
+                ao_receber_trecho(informacoes)
+            instrumentacao.registrar(operacao, {"cache": time.perf_counter() - inicio_total})
+            return informacoes
+
+    etapas = {}
+    try:
+        inicio = time.perf_counter()
+        url_imagem, info_imagem = imagens.preparar_imagem(caminho_imagem, perfil)
+        estatisticas.update(info_imagem)
+        etapas["recompressao"] = info_imagem["tempo_recompressao_s"]
+        etapas["base64"] = info_imagem["tempo_base64_s"]
+
+        mensagens = [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": url_imagem
+                        }
+                    }
+                ]
+            }
+        ]
+        # A partir daqui a única referência à data URL é a mensagem, descartada após o envio
+        del url_imagem
+
+        informacoes = completar(
+            client,
+            deployment_name,
+            mensagens,
+            cancelamento=cancelamento,
+            ao_receber_trecho=ao_receber_trecho,
+            response_format=response_format,
+            uso=estatisticas,
+            etapas=etapas,
+        )
+        estatisticas["duracao_s"] = time.perf_counter() - inicio
+    except Exception as e:
+        registrar_chamada(operacao, inicio_total, etapas, estatisticas, erro=type(e).__name__)
+        raise
+    registrar_chamada(operacao, inicio_total, etapas, estatisticas)
+
+    if validar is not None:
+        validar(informacoes)
+    if cache is not None and informacoes:
+        cache.gravar(chave, cache_respostas.EXTRACAO, informacoes, estatisticas["duracao_s"])
+    return informacoes
+
+
+def extrair_informacoes_caixa(client, deployment_name, caminho_imagem, estatisticas=None, cache=None,
+                              cancelamento=None, ao_receber_trecho=None, dica=None):
+    return extrair_informacoes(
+        client, deployment_name, caminho_imagem, PROMPT_CAIXA + (dica or ""),
+        perfil=imagens.carregar_perfil("caixa"), estatisticas=estatisticas, cache=cache,
+        cancelamento=cancelamento, ao_receber_trecho=ao_receber_trecho, operacao="caixa"
+    )
+
+
+def extrair_informacoes_nota(client, deployment_name, caminho_imagem, estatisticas=None, cache=None,
+                             cancelamento=None, ao_receber_trecho=None, dica=None):
+    return extrair_informacoes(
+        client, deployment_name, caminho_imagem, PROMPT_NOTA + (dica or ""),
+        perfil=imagens.carregar_perfil("nota"), estatisticas=estatisticas, cache=cache,
+        cancelamento=cancelamento, ao_receber_trecho=ao_receber_trecho, operacao="nota"
+    )
+
+
+def cruzar_informacoes(client, deployment_name, informacoes_caixa, informacoes_nota, cache=None,
+                       cancelamento=None, ao_receber_trecho=None, estatisticas=None):
+    if estatisticas is None:
+        estatisticas = {}
+    inicio = time.perf_counter()
+    prompt = montar_prompt_cruzamento(informacoes_caixa, informacoes_nota)
+
+    if cache is not None:
+        chave = cache_respostas.chave_cruzamento(prompt, deployment_name)
+        resultado = cache.obter(chave, cache_respostas.CRUZAMENTO)
+        estatisticas["cache"] = resultado is not None
+        if resultado is not None:
+            if ao_receber_trecho is not None:
+                ao_receber_trecho(resultado)
+            instrumentacao.registrar("cruzamento", {"cache": time.perf_counter() - inicio})
+            return resultado
+
+    etapas = {}
+    try:
+        resultado = completar(
+            client,
+            deployment_name,
+            [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            cancelamento=cancelamento,
+            ao_receber_trecho=ao_receber_trecho,
+            uso=estatisticas,
+            etapas=etapas,
+        )
+    except Exception as e:
+        registrar_chamada("cruzamento", inicio, etapas, estatisticas, erro=type(e).__name__)
+        raise
+    registrar_chamada("cruzamento", inicio, etapas, estatisticas)
+    estatisticas["duracao_s"] = etapas["total"]
+
+    if cache is not None:
+        cache.gravar(chave, cache_respostas.CRUZAMENTO, resultado, estatisticas["duracao_s"])
+    return resultado
+
+
+def encontrar_bloco_json(texto):
+    return PADRAO_BLOCO_JSON.search(texto)
+
+
+def _como_booleano(valor):
+    # "false" em texto seria verdadeiro para bool()
+    if isinstance(valor, str):
+        return valor.strip().lower() in ("true", "sim", "1")
+    return bool(valor)
+
+
+def interpretar_veredito(resultado_cruzamento):
+    """Lê o bloco JSON do final do cruzamento e decide o veredito."""
+    veredito = {
+        "status": MANUAL,
+        "score": None,
+        "produtos_match": None,
+        "nota_match": None,
+        "motivos": [],
+    }
+
+    # Extrair JSON do final
+    try:
+        json_match = encontrar_bloco_json(resultado_cruzamento)
+        if not json_match:
+            veredito["motivos"].append("JSON não encontrado")
+            return veredito
+
+        dados_json = json.loads(json_match.group(1))
+        score = dados_json.get("score", 0)
+        produtos_match = dados_json.get("produtos_match", False)
+        nota_match = dados_json.get("nota_match", False)
+    except Exception as e:
+        veredito["status"] = ERRO
+        veredito["motivos"].append(f"Erro ao processar JSON: {e}")
+        return veredito
+
+    # O modelo às vezes devolve "score": null ou "85"; sem número não há veredito automático
+    if isinstance(score, bool) or not isinstance(score, (int, float)):
+        veredito["status"] = ERRO
+        veredito["motivos"].append(f"Score inválido: {score!r}")
+        return veredito
+
+    veredito["score"] = score
+    veredito["produtos_match"] = _como_booleano(produtos_match)
+    veredito["nota_match"] = _como_booleano(nota_match)
+
+    # Lógica de Aprovação
+    if score < SCORE_MINIMO: veredito["motivos"].append(f"Score baixo ({score}%)")
+    if not veredito["produtos_match"]: veredito["motivos"].append("Produtos divergentes")
+    if not veredito["nota_match"]: veredito["motivos"].append("Nota fiscal divergente")
+
+    veredito["status"] = REPROVADO if veredito["motivos"] else APROVADO
+    return veredito
+
+
+def descrever_veredito(veredito):
+    if veredito["status"] == APROVADO:
+        return "✅ APROVADO"
+    if veredito["status"] == REPROVADO:
+        texto_reprovado = "❌ REPROVADO"
+        if veredito["motivos"]:
+            texto_reprovado += f" ({', '.join(veredito['motivos'])})"
+        return texto_reprovado
+    if veredito["status"] == ERRO:
+        return "⚠️ Erro ao processar veredito automático"
+    return f"⚠️ Análise Manual Necessária ({', '.join(veredito['motivos'])})"
+
+
+def extrair_par(client, deployment_name, caminho_caixa, caminho_nota, cache=None, dicas=None):
+    """Primeira etapa de analisar_par: as extrações da caixa e da nota."""
+    dicas = dicas or {}
+    imagem_caixa = {}
+    imagem_nota = {}
+    informacoes_caixa = extrair_informacoes_caixa(
+        client, deployment_name, caminho_caixa, estatisticas=imagem_caixa, cache=cache, dica=dicas.get("caixa")
+    )
+    informacoes_nota = extrair_informacoes_nota(
+        client, deployment_name, caminho_nota, estatisticas=imagem_nota, cache=cache, dica=dicas.get("nota")
+    )
+    return {
+        "informacoes_caixa": informacoes_caixa,
+        "informacoes_nota": informacoes_nota,
+        "imagem_caixa": imagem_caixa,
+        "imagem_nota": imagem_nota,
+    }
+
+
+def cruzar_par(client, deployment_name, extracao, cache=None):
+    """Segunda etapa de analisar_par: o cruzamento das extrações e o veredito."""
+    estatisticas_cruzamento = {}
+    resultado_cruzamento = cruzar_informacoes(
+        client, deployment_name, extracao["informacoes_caixa"], extracao["informacoes_nota"], cache=cache,
+        estatisticas=estatisticas_cruzamento
+    )
+    return {
+        **extracao,
+        "estatisticas_cruzamento": estatisticas_cruzamento,
+        "cruzamento": resultado_cruzamento,
+        "veredito": interpretar_veredito(resultado_cruzamento),
+    }
+
+
+def analisar_par(client, deployment_name, caminho_caixa, caminho_nota, cache=None, dicas=None):
+    """Executa o fluxo completo (caixa -> nota -> cruzamento) para um par de imagens."""
+    extracao = extrair_par(client, deployment_name, caminho_caixa, caminho_nota, cache=cache, dicas=dicas)
+    return cruzar_par(client, deployment_name, extracao, cache=cache)
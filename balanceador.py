@@ -0,0 +1,222 @@
+"""Distribui as chamadas ao modelo entre vários endpoints/deployments do Azure OpenAI.
+
+Cada endpoint tem um cliente OpenAI próprio, criado uma vez e reutilizado (as
+conexões HTTP ficam abertas entre as chamadas). Para cada requisição:
+- as que têm imagem vão para o grupo "extracao" e as só de texto (cruzamento)
+  para o grupo "cruzamento", que pode apontar para um deployment mais barato;
+- dentro do grupo escolhe o endpoint com menos requisições em andamento
+  (proporcional ao peso) ou sorteia pelo peso;
+- um endpoint que responde 429, 5xx ou falha a conexão fica em espera e a
+  requisição passa na hora para o próximo. Só quando todos foram tentados o
+  erro sobe para o limitador, que faz as novas tentativas com backoff.
+
+Configuração no .env (listas separadas por vírgula; um único valor vale para todos):
+    AZURE_OPENAI_ENDPOINTS=https://leste.openai.azure.com/openai/v1/,https://sul.openai.azure.com/openai/v1/
+    AZURE_OPENAI_API_KEYS=chave_leste,chave_sul
+    AZURE_OPENAI_DEPLOYMENTS=gpt-4.1
+    AZURE_OPENAI_PESOS=2,1
+    AZURE_OPENAI_CRUZAMENTO_DEPLOYMENTS=gpt-4.1-mini
+    BALANCEAMENTO=menos_pendentes        (ou peso)
+    BALANCEAMENTO_ESPERA_S=30
+"""
+import os
+import random
+import threading
+import time
+
+from limitador import StreamLimitado, ler_retry_after
+
+ROTEAMENTOS = ("menos_pendentes", "peso")
+
+# Espera máxima de um endpoint com falhas seguidas (5xx ou conexão)
+ESPERA_MAXIMA_S = 300.0
+
+
+def tem_imagem(messages):
+    for mensagem in messages:
+        conteudo = mensagem["content"]
+        if isinstance(conteudo, list) and any(parte["type"] == "image_url" for parte in conteudo):
+            return True
+    return False
+
+
+class Endpoint:
+    def __init__(self, client, deployment, peso=1.0, nome=None):
+        self.client = client
+        self.deployment = deployment
+        self.peso = peso
+        self.nome = nome or deployment
+        self.pendentes = 0
+        self.disponivel_em = 0.0
+        self.falhas_seguidas = 0
+        self.metricas = {"requisicoes": 0, "throttles": 0, "falhas": 0, "esperas": 0}
+
+
+class BalanceadorEndpoints:
+    """Mesma interface de chat.completions.create do cliente OpenAI (pode ser envolvido pelo limitador)."""
+
+    def __init__(self, grupos, roteamento="menos_pendentes", espera_base_s=30.0, semente=None):
+        if roteamento not in ROTEAMENTOS:
+            raise ValueError(f"Roteamento desconhecido: {roteamento} (use {' ou '.join(ROTEAMENTOS)})")
+        self.grupos = grupos
+        self.roteamento = roteamento
+        self.espera_base_s = espera_base_s
+        self._aleatorio = random.Random(semente)
+        self._lock = threading.Lock()
+        self.chat = _ChatBalanceado(self)
+
+    def _ordem_grupos(self, messages):
+        if tem_imagem(messages):
+            return ["extracao"]
+        # Sem endpoints de cruzamento disponíveis, o cruzamento vai para os de extração
+        return ["cruzamento", "extracao"]
+
+    def _escolher(self, grupos, tentados):
+        """Reserva (pendentes + 1) o melhor endpoint ainda não tentado; None se não sobrou nenhum."""
+        with self._lock:
+            agora = time.monotonic()
+            for grupo in grupos:
+                candidatos = [e for e in self.grupos.get(grupo, ()) if e not in tentados]
+                saudaveis = [e for e in candidatos if e.disponivel_em <= agora]
+                if saudaveis:
+                    break
+            else:
+                if tentados:
+                    return None
+                # Todos em espera logo na primeira tentativa: usa o que libera primeiro
+                saudaveis = [min(
+                    (e for grupo in grupos for e in self.grupos.get(grupo, ())), key=lambda e: e.disponivel_em
+                )]
+
+            if self.roteamento == "peso":
+                endpoint = self._aleatorio.choices(saudaveis, weights=[e.peso for e in saudaveis])[0]
+            else:
+                endpoint = min(
+                    saudaveis,
+                    key=lambda e: ((e.pendentes + 1) / e.peso, e.metricas["requisicoes"] / e.peso),
+                )
+            endpoint.pendentes += 1
+            endpoint.metricas["requisicoes"] += 1
+            return endpoint
+
+    def _liberar(self, endpoint):
+        with self._lock:
+            endpoint.pendentes -= 1
+
+    def _registrar_sucesso(self, endpoint):
+        with self._lock:
+            endpoint.falhas_seguidas = 0
+
+    def _colocar_em_espera(self, endpoint, retry_after, throttle):
+        with self._lock:
+            endpoint.metricas["throttles" if throttle else "falhas"] += 1
+            endpoint.metricas["esperas"] += 1
+            endpoint.falhas_seguidas += 1
+            if retry_after:
+                espera = retry_after
+            elif throttle:
+                espera = self.espera_base_s
+            else:
+                espera = min(ESPERA_MAXIMA_S, self.espera_base_s * 2 ** (endpoint.falhas_seguidas - 1))
+            endpoint.disponivel_em = max(endpoint.disponivel_em, time.monotonic() + espera)
+
+    def criar(self, **kwargs):
+        import openai
+
+        grupos = self._ordem_grupos(kwargs["messages"])
+        tentados = set()
+        erro = None
+        while True:
+            endpoint = self._escolher(grupos, tentados)
+            if endpoint is None:
+                raise erro
+            tentados.add(endpoint)
+            liberar = True
+            try:
+                resultado = endpoint.client.chat.completions.create(**{**kwargs, "model": endpoint.deployment})
+                self._registrar_sucesso(endpoint)
+                if kwargs.get("stream"):
+                    # O endpoint continua ocupado até o stream ser fechado
+                    liberar = False
+                    return StreamLimitado(resultado, lambda: self._liberar(endpoint))
+                return resultado
+            except openai.RateLimitError as e:
+                self._colocar_em_espera(endpoint, ler_retry_after(e), throttle=True)
+                erro = e
+            except (openai.InternalServerError, openai.APIConnectionError) as e:
+                self._colocar_em_espera(endpoint, None, throttle=False)
+                erro = e
+            finally:
+                if liberar:
+                    self._liberar(endpoint)
+
+    def metricas(self):
+        with self._lock:
+            agora = time.monotonic()
+            return [
+                {
+                    "grupo": grupo,
+                    "nome": endpoint.nome,
+                    "deployment": endpoint.deployment,
+                    "pendentes": endpoint.pendentes,
+                    "em_espera_s": round(max(0.0, endpoint.disponivel_em - agora), 1),
+                    **endpoint.metricas,
+                }
+                for grupo, endpoints in self.grupos.items()
+                for endpoint in endpoints
+            ]
+
+
+class _CompletionsBalanceadas:
+    def __init__(self, balanceador):
+        self._balanceador = balanceador
+
+    def create(self, **kwargs):
+        return self._balanceador.criar(**kwargs)
+
+
+class _ChatBalanceado:
+    def __init__(self, balanceador):
+        self.completions = _CompletionsBalanceadas(balanceador)
+
+
+def criar_balanceador(grupos):
+    """Monta o balanceador a partir de configuracao.carregar_grupos_endpoints().
+
+    Endpoints com a mesma URL e chave compartilham um único cliente OpenAI (e
+    suas conexões), mesmo que atendam deployments diferentes.
+    """
+    from openai import OpenAI
+
+    clientes = {}
+    grupos_endpoints = {}
+    for grupo, itens in grupos.items():
+        grupos_endpoints[grupo] = []
+        for item in itens:
+            chave = (item["endpoint"], item["api_key"])
+            if chave not in clientes:
+                # As novas tentativas ficam a cargo do balanceador e do limitador
+                clientes[chave] = OpenAI(base_url=item["endpoint"], api_key=item["api_key"], max_retries=0)
+            grupos_endpoints[grupo].append(Endpoint(
+                clientes[chave], item["deployment"], peso=item["peso"],
+                nome=f"{item['deployment']} @ {item['endpoint']}",
+            ))
+
+    return BalanceadorEndpoints(
+        grupos_endpoints,
+        roteamento=os.getenv("BALANCEAMENTO", "menos_pendentes"),
+        espera_base_s=float(os.getenv("BALANCEAMENTO_ESPERA_S", "30")),
+    )
+
+
+def descrever_endpoints(metricas):
+    linhas = []
+    for endpoint in metricas:
+        linha = (
+            f"{endpoint['grupo']}: {endpoint['nome']} — {endpoint['requisicoes']} requisições, "
+            f"{endpoint['pendentes']} em andamento, {endpoint['throttles']} 429, {endpoint['falhas']} falhas"
+        )
+        if endpoint["em_espera_s"]:
+            linha += f" (em espera por mais {endpoint['em_espera_s']:.0f}s)"
+        linhas.append(linha)
+    return "\n".join(linhas)
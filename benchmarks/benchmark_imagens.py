@@ -0,0 +1,167 @@
+"""Compara o envio da imagem original com o pré-processamento de imagens.py.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/benchmark_imagens.py                 # só tamanho e tempo local
+    python benchmarks/benchmark_imagens.py --api           # mede também a latência do modelo
+    python benchmarks/benchmark_imagens.py Nota01.png --tipo caixa
+
+Sem argumentos usa as amostras Nota0*.png da raiz. Com --api cada imagem é enviada
+ao deployment configurado no .env nas duas versões (original e processada).
+
+Memória por requisição, sempre comparando o preparo de imagens.py com a montagem
+ingênua da URL a partir do arquivo original (read + b64encode + decode + f-string):
+    pico / ingênuo      pico do heap Python medido com tracemalloc; não enxerga os
+                        pixels decodificados pelo Pillow (memória alocada em C)
+    rss / rss ingênuo   aumento medido do pico de RSS de um processo novo que só faz
+                        o preparo (inclui a memória em C; só no Linux)
+    estimado            estimativa (não medição) de imagens.estimar_memoria_pico, o
+                        valor que a instrumentação registra a cada chamada
+"""
+import argparse
+import base64
+import glob
+import mimetypes
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analise
+import imagens
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def medir_preparo(caminho, perfil, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        url, info = imagens.preparar_imagem(caminho, perfil)
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos), info
+
+
+def montar_url_ingenua(caminho):
+    """Como a URL era montada antes do pré-processamento: o arquivo original inteiro em memória."""
+    with open(caminho, "rb") as f:
+        dados = f.read()
+    mime = mimetypes.guess_type(caminho)[0] or "image/png"
+    return f"data:{mime};base64,{base64.b64encode(dados).decode('utf-8')}"
+
+
+def formatar_kb(valor):
+    return "-" if valor is None else f"{valor / 1024:.0f} KB"
+
+
+def medir_pico(funcao, *args):
+    tracemalloc.start()
+    try:
+        funcao(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+CODIGO_RSS = """
+import json, sys
+sys.path[:0] = [{raiz!r}, {benchmarks!r}]
+import benchmark_imagens, imagens
+from PIL import Image
+
+def ler_kb(campo):
+    with open("/proc/self/status") as f:
+        return next(int(linha.split()[1]) for linha in f if linha.startswith(campo))
+
+# Zera o pico de RSS (VmHWM), para que o das importações não mascare o da chamada
+with open("/proc/self/clear_refs", "w") as f:
+    f.write("5")
+antes = ler_kb("VmRSS:")
+url = {chamada}
+print(json.dumps(max(0, ler_kb("VmHWM:") - antes)))
+"""
+
+
+def medir_rss(caminho, perfil=None, ingenuo=False):
+    """Aumento do pico de RSS (bytes) de um processo novo que só monta a URL; None fora do Linux."""
+    if not os.path.exists("/proc/self/clear_refs"):
+        return None
+    chamada = (
+        f"benchmark_imagens.montar_url_ingenua({caminho!r})" if ingenuo
+        else f"imagens.preparar_imagem({caminho!r}, {perfil!r})"
+    )
+    codigo = CODIGO_RSS.format(raiz=RAIZ, benchmarks=os.path.dirname(os.path.abspath(__file__)), chamada=chamada)
+    processo = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True)
+    if processo.returncode != 0:
+        return None
+    return int(processo.stdout.strip()) * 1024
+
+
+def medir_latencia(client, deployment_name, caminho, prompt, perfil):
+    inicio = time.perf_counter()
+    analise.extrair_informacoes(client, deployment_name, caminho, prompt, perfil=perfil)
+    return time.perf_counter() - inicio
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("imagens", nargs="*", help="Imagens a medir (padrão: Nota0*.png)")
+    parser.add_argument("--tipo", choices=["caixa", "nota"], default="nota", help="Perfil de pré-processamento")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--api", action="store_true", help="Mede a latência real do modelo (consome cota)")
+    args = parser.parse_args(argv)
+
+    caminhos = args.imagens or sorted(glob.glob(os.path.join(RAIZ, "Nota0*.png")))
+    perfil = imagens.carregar_perfil(args.tipo)
+    prompt = analise.PROMPT_CAIXA if args.tipo == "caixa" else analise.PROMPT_NOTA
+    print(f"Perfil '{args.tipo}': {perfil}\n")
+
+    if args.api:
+        from configuracao import criar_cliente
+        client, deployment_name = criar_cliente()
+
+    total_original = 0
+    total_processado = 0
+    print(
+        f"{'imagem':<14}{'upload original':>17}{'upload processado':>19}{'redução':>9}{'preparo':>10}"
+        f"{'pico':>9}{'ingênuo':>10}{'rss':>9}{'rss ingênuo':>13}{'estimado':>10}"
+    )
+    for caminho in caminhos:
+        _, info_original = medir_preparo(caminho, None, 1)
+        tempo, info = medir_preparo(caminho, perfil, args.repeticoes)
+        total_original += info_original["bytes_enviados"]
+        total_processado += info["bytes_enviados"]
+        reducao = 1 - info["bytes_enviados"] / info_original["bytes_enviados"]
+        pico = medir_pico(imagens.preparar_imagem, caminho, perfil)
+        pico_ingenuo = medir_pico(montar_url_ingenua, caminho)
+        rss = medir_rss(caminho, perfil)
+        rss_ingenuo = medir_rss(caminho, ingenuo=True)
+        print(
+            f"{os.path.basename(caminho):<14}"
+            f"{info_original['bytes_enviados'] / 1024:>14.0f} KB"
+            f"{info['bytes_enviados'] / 1024:>16.0f} KB"
+            f"{reducao:>9.0%}"
+            f"{tempo * 1000:>8.0f}ms"
+            f"{pico / 1024:>6.0f} KB"
+            f"{pico_ingenuo / 1024:>7.0f} KB"
+            f"{formatar_kb(rss):>9}{formatar_kb(rss_ingenuo):>13}"
+            f"{info['memoria_pico_estimada_bytes'] / 1024:>7.0f} KB"
+        )
+
+        if args.api:
+            latencia_original = medir_latencia(client, deployment_name, caminho, prompt, None)
+            latencia_processada = medir_latencia(client, deployment_name, caminho, prompt, perfil)
+            print(f"{'':<14}latência do modelo: {latencia_original:.2f}s -> {latencia_processada:.2f}s")
+
+    if total_original:
+        print(
+            f"\nTotal enviado: {total_original / 1024:.0f} KB -> {total_processado / 1024:.0f} KB "
+            f"({1 - total_processado / total_original:.0%} menor)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Mede o tempo de inicialização: importação dos módulos e abertura da janela.
+
+Para cada módulo roda um processo novo com `python -X importtime -c "import MODULO"`
+e mostra o tempo de importação (mediana das repetições), o tempo total do
+processo e quais dependências pesadas (openai, PIL, tkinter) foram carregadas
+só pela importação. Depois abre a interface (Chat.py) e mede o tempo até a
+janela ser desenhada e até o cliente do modelo ficar pronto em segundo plano.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/benchmark_inicializacao.py
+    python benchmarks/benchmark_inicializacao.py --repeticoes 10 --detalhes 15
+    python benchmarks/benchmark_inicializacao.py --max-importacao-ms 300 --json inicio.json   # para CI
+
+A janela precisa de display (DISPLAY no Linux); sem ele só as importações são
+medidas. O cliente é criado com um endpoint fictício (nenhuma requisição é feita)
+e cache/histórico ficam numa pasta temporária.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos usados sem interface (lote, consultas ao histórico) e o da interface
+MODULOS = ("analise", "lote", "resultados", "Chat")
+
+DEPENDENCIAS_PESADAS = ("openai", "PIL", "tkinter")
+
+CODIGO_JANELA = """
+import json, time
+inicio = time.perf_counter()
+import tkinter as tk
+import Chat
+root = tk.Tk()
+app = Chat.AnalisadorImagens(root)
+root.update()
+janela = time.perf_counter() - inicio
+app.cliente_futuro.exception()
+cliente = time.perf_counter() - inicio
+root.destroy()
+print(json.dumps({"janela_s": janela, "cliente_s": cliente}))
+"""
+
+
+def ambiente(pasta):
+    env = dict(os.environ)
+    env.setdefault("AZURE_OPENAI_ENDPOINT", "http://127.0.0.1:9/v1")
+    env.setdefault("AZURE_OPENAI_API_KEY", "benchmark")
+    env["CACHE_CAMINHO"] = os.path.join(pasta, "respostas.sqlite3")
+    env["RESULTADOS_CAMINHO"] = os.path.join(pasta, "resultados.sqlite3")
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def ler_importtime(saida_erro):
+    """{modulo: (próprio_us, acumulado_us)} das linhas do -X importtime."""
+    tempos = {}
+    for linha in saida_erro.splitlines():
+        if not linha.startswith("import time:") or "self [us]" in linha:
+            continue
+        proprio, acumulado, nome = linha[len("import time:"):].split("|")
+        tempos[nome.strip()] = (int(proprio), int(acumulado))
+    return tempos
+
+
+def medir_importacao(modulo, env):
+    codigo = (
+        f"import {modulo}, sys; "
+        f"print(','.join(m for m in {DEPENDENCIAS_PESADAS!r} if m in sys.modules))"
+    )
+    inicio = time.perf_counter()
+    processo = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", codigo], cwd=RAIZ, env=env, capture_output=True, text=True
+    )
+    duracao = time.perf_counter() - inicio
+    if processo.returncode != 0:
+        return None
+    tempos = ler_importtime(processo.stderr)
+    return {
+        "importacao_s": tempos[modulo][1] / 1e6,
+        "processo_s": duracao,
+        "carregadas": [m for m in processo.stdout.strip().split(",") if m],
+        "tempos": tempos,
+    }
+
+
+def medir_janela(env):
+    processo = subprocess.run(
+        [sys.executable, "-c", CODIGO_JANELA], cwd=RAIZ, env=env, capture_output=True, text=True, timeout=60
+    )
+    if processo.returncode != 0:
+        return None, processo.stderr.strip().splitlines()[-1] if processo.stderr.strip() else "erro desconhecido"
+    return json.loads(processo.stdout.strip().splitlines()[-1]), None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--detalhes", type=int, default=0, metavar="N",
+                        help="Mostra os N módulos mais lentos (tempo próprio) de cada importação")
+    parser.add_argument("--json", help="Grava os resultados em JSON")
+    parser.add_argument("--max-importacao-ms", type=float,
+                        help="Falha (código 1) se a importação de algum módulo sem interface passar deste tempo")
+    parser.add_argument("--max-janela-s", type=float, help="Falha (código 1) se a janela demorar mais que isto")
+    args = parser.parse_args(argv)
+
+    resultados = {"importacao": {}, "janela": None}
+    with tempfile.TemporaryDirectory() as pasta:
+        env = ambiente(pasta)
+        print(f"{'módulo':<12}{'importação':>12}{'processo':>11}  dependências pesadas carregadas")
+        for modulo in MODULOS:
+            medicoes = [medir_importacao(modulo, env) for _ in range(args.repeticoes)]
+            if None in medicoes:
+                print(f"{modulo:<12}{'-':>12}{'-':>11}  (não importa neste ambiente)")
+                continue
+            resultado = {
+                "importacao_s": statistics.median(m["importacao_s"] for m in medicoes),
+                "processo_s": statistics.median(m["processo_s"] for m in medicoes),
+                "carregadas": medicoes[0]["carregadas"],
+            }
+            resultados["importacao"][modulo] = resultado
+            print(
+                f"{modulo:<12}{resultado['importacao_s'] * 1000:>10.0f}ms{resultado['processo_s'] * 1000:>9.0f}ms  "
+                f"{', '.join(resultado['carregadas']) or 'nenhuma'}"
+            )
+            if args.detalhes:
+                tempos = medicoes[-1]["tempos"]
+                for nome, (proprio, _) in sorted(tempos.items(), key=lambda item: -item[1][0])[:args.detalhes]:
+                    print(f"{'':<14}{proprio / 1000:>7.1f}ms  {nome}")
+
+        medicoes = []
+        for _ in range(args.repeticoes):
+            medicao, erro = medir_janela(env)
+            if medicao is None:
+                print(f"\nJanela não medida: {erro}")
+                break
+            medicoes.append(medicao)
+        if medicoes:
+            resultados["janela"] = {
+                "janela_s": statistics.median(m["janela_s"] for m in medicoes),
+                "cliente_s": statistics.median(m["cliente_s"] for m in medicoes),
+            }
+            print(
+                f"\nJanela desenhada em {resultados['janela']['janela_s'] * 1000:.0f}ms; "
+                f"cliente do modelo pronto em {resultados['janela']['cliente_s'] * 1000:.0f}ms (em segundo plano)"
+            )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parametros": vars(args), "resultados": resultados}, f, ensure_ascii=False, indent=4)
+
+    falhou = False
+    if args.max_importacao_ms is not None:
+        for modulo, resultado in resultados["importacao"].items():
+            if modulo != "Chat" and resultado["importacao_s"] * 1000 > args.max_importacao_ms:
+                print(f"❌ Importação de {modulo} acima de {args.max_importacao_ms}ms", file=sys.stderr)
+                falhou = True
+    if args.max_janela_s is not None and resultados["janela"] and resultados["janela"]["janela_s"] > args.max_janela_s:
+        print(f"❌ Janela demorou mais de {args.max_janela_s}s", file=sys.stderr)
+        falhou = True
+    return 1 if falhou else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""Benchmark de vazão do fluxo extração + cruzamento contra o servidor simulado (sem rede).
+
+Sobe benchmarks/servidor_simulado.py na própria máquina e processa pares com o
+mesmo código do lote (lote.processar_lote), variando o número de workers.
+Para cada nível mostra pares/s, latência p50/p99 por par, bytes enviados,
+respostas 429 e o pico de memória do heap Python.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/benchmark_simulado.py
+    python benchmarks/benchmark_simulado.py --pares 200 --escala 2 --workers 1,4,16 --latencia-ms 300
+    python benchmarks/benchmark_simulado.py --modo estruturado --taxa-429 0.05
+    python benchmarks/benchmark_simulado.py --endpoints 3 --taxa-429 0.5,0,0   # balanceamento/failover
+    python benchmarks/benchmark_simulado.py --min-pares-s 5 --max-p99-s 2 --json resultado.json   # para CI
+
+Os pares sintéticos são cópias das amostras Nota0*.png (opcionalmente ampliadas
+com --escala), cada uma com um pixel diferente para não serem arquivos idênticos.
+Com --endpoints N sobem N servidores, usados pelo balanceador.py como se fossem
+endpoints diferentes (--taxa-429 aceita um valor por endpoint).
+Com --gravar ARQUIVO as respostas reais do deployment do .env para Nota01.png
+são gravadas no formato de respostas_gravadas.json.
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import OpenAI
+from PIL import Image
+
+import analise
+import estruturado
+import lote
+import remessa
+from balanceador import BalanceadorEndpoints, Endpoint
+from instrumentacao import percentil
+from limitador import LimitadorRequisicoes
+from servidor_simulado import ServidorSimulado
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def gerar_pares(amostras, quantidade, escala, pasta):
+    pares = []
+    for i in range(quantidade):
+        with Image.open(amostras[i % len(amostras)]) as imagem:
+            imagem = imagem.convert("RGB")
+            if escala != 1:
+                imagem = imagem.resize((int(imagem.width * escala), int(imagem.height * escala)), Image.LANCZOS)
+            imagem.putpixel((0, 0), (i % 256, (i // 256) % 256, 0))
+            caminho = os.path.join(pasta, f"par{i:05d}.png")
+            imagem.save(caminho)
+        pares.append({"id": f"par{i:05d}", "caixa": caminho, "nota": caminho})
+    return pares
+
+
+def criar_cliente_simulado(servidores, workers, espera_s):
+    limitador = LimitadorRequisicoes(concorrencia=workers, max_tentativas=10)
+    clientes = [OpenAI(base_url=servidor.url, api_key="simulado", max_retries=0) for servidor in servidores]
+    if len(clientes) == 1:
+        return limitador.envolver(clientes[0])
+    endpoints = [Endpoint(cliente, "simulado", nome=servidor.url) for cliente, servidor in zip(clientes, servidores)]
+    return limitador.envolver(BalanceadorEndpoints({"extracao": endpoints}, espera_base_s=espera_s))
+
+
+def somar_contadores(servidores, nome):
+    return sum(servidor.contadores[nome] for servidor in servidores)
+
+
+def executar_rodada(servidores, pares, workers, modo, medir_memoria, espera_s):
+    for servidor in servidores:
+        servidor.zerar_contadores()
+    client = criar_cliente_simulado(servidores, workers, espera_s)
+    saida = io.StringIO()
+
+    if medir_memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    contagem = lote.processar_lote(client, "simulado", pares, saida, workers=workers, cache=None, modo=modo)
+    duracao = time.perf_counter() - inicio
+    pico_memoria = None
+    if medir_memoria:
+        pico_memoria = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    latencias = sorted(json.loads(linha)["duracao_s"] for linha in saida.getvalue().splitlines())
+    return {
+        "workers": workers,
+        "pares": len(pares),
+        "duracao_s": round(duracao, 3),
+        "pares_por_s": round(len(pares) / duracao, 2),
+        "p50_s": percentil(latencias, 50),
+        "p99_s": percentil(latencias, 99),
+        "bytes_enviados": somar_contadores(servidores, "bytes_recebidos"),
+        "requisicoes": somar_contadores(servidores, "requisicoes"),
+        "requisicoes_por_endpoint": [servidor.contadores["requisicoes"] for servidor in servidores],
+        "respostas_429": somar_contadores(servidores, "respostas_429"),
+        "erros": contagem.get(analise.ERRO, 0),
+        "pico_memoria_bytes": pico_memoria,
+    }
+
+
+def gravar_respostas(caminho, amostra):
+    from configuracao import criar_cliente
+
+    client, deployment_name = criar_cliente()
+    respostas = {
+        "caixa": analise.extrair_informacoes_caixa(client, deployment_name, amostra),
+        "nota": analise.extrair_informacoes_nota(client, deployment_name, amostra),
+        "caixa_estruturado": json.dumps(estruturado.extrair_dados(client, deployment_name, amostra, "caixa"), ensure_ascii=False),
+        "nota_estruturado": json.dumps(estruturado.extrair_dados(client, deployment_name, amostra, "nota"), ensure_ascii=False),
+        # Etiqueta no esquema de remessa.py (várias notas e a nota de cada item)
+        "caixa_remessa": json.dumps(remessa.extrair_caixa(client, deployment_name, amostra), ensure_ascii=False),
+    }
+    respostas["cruzamento"] = analise.cruzar_informacoes(client, deployment_name, respostas["caixa"], respostas["nota"])
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(respostas, f, ensure_ascii=False, indent=4)
+    print(f"✓ Respostas gravadas em {caminho}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pares", type=int, default=None, help="Quantidade de pares (padrão: uma por amostra)")
+    parser.add_argument("--escala", type=float, default=1.0, help="Fator de ampliação das imagens sintéticas")
+    parser.add_argument("--workers", default="1,4,8", help="Níveis de concorrência, separados por vírgula")
+    parser.add_argument("--modo", choices=[estruturado.MODO_TEXTO, estruturado.MODO_ESTRUTURADO], default=estruturado.MODO_TEXTO)
+    parser.add_argument("--latencia-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--taxa-429", default="0", help="Fração de 429; com vários endpoints, um valor por endpoint")
+    parser.add_argument("--endpoints", type=int, default=1, help="Quantidade de servidores simulados (balanceador)")
+    parser.add_argument("--espera-endpoint-s", type=float, default=2.0,
+                        help="Espera de um endpoint depois de um 429 sem Retry-After")
+    parser.add_argument("--retry-after-ms", type=int, default=200)
+    parser.add_argument("--semente", type=int, default=42, help="Semente do jitter e dos 429, para rodadas comparáveis")
+    parser.add_argument("--sem-memoria", action="store_true", help="Não mede o pico de memória (tracemalloc deixa tudo mais lento)")
+    parser.add_argument("--json", help="Grava os resultados em JSON")
+    parser.add_argument("--min-pares-s", type=float, help="Falha (código 1) se algum nível ficar abaixo desta vazão")
+    parser.add_argument("--max-p99-s", type=float, help="Falha (código 1) se algum nível passar deste p99")
+    parser.add_argument("--gravar", metavar="ARQUIVO", help="Grava respostas reais do deployment do .env e sai")
+    args = parser.parse_args(argv)
+
+    amostras = sorted(glob.glob(os.path.join(RAIZ, "Nota0*.png")))
+    if args.gravar:
+        gravar_respostas(args.gravar, amostras[0])
+        return 0
+
+    niveis = [int(nivel) for nivel in args.workers.split(",")]
+    taxas = [float(taxa) for taxa in args.taxa_429.split(",")]
+    if len(taxas) == 1:
+        taxas *= args.endpoints
+    if len(taxas) != args.endpoints:
+        parser.error("--taxa-429 precisa de um valor ou de um valor por endpoint")
+    servidores = [
+        ServidorSimulado(
+            latencia_ms=args.latencia_ms, jitter_ms=args.jitter_ms, taxa_429=taxa,
+            retry_after_ms=args.retry_after_ms, semente=args.semente + i,
+        )
+        for i, taxa in enumerate(taxas)
+    ]
+    for servidor in servidores:
+        servidor.iniciar()
+
+    resultados = []
+    with tempfile.TemporaryDirectory() as pasta:
+        pares = gerar_pares(amostras, args.pares or len(amostras), args.escala, pasta)
+        print(
+            f"{len(pares)} pares, modo {args.modo}, latência {args.latencia_ms:.0f}±{args.jitter_ms:.0f}ms, "
+            f"{args.endpoints} endpoint(s), 429 em {', '.join(f'{taxa:.0%}' for taxa in taxas)} das requisições\n"
+        )
+        print(f"{'workers':>8}{'pares/s':>10}{'p50':>9}{'p99':>9}{'enviado':>11}{'429':>6}{'erros':>7}{'pico heap':>12}")
+        for workers in niveis:
+            resultado = executar_rodada(servidores, pares, workers, args.modo, not args.sem_memoria, args.espera_endpoint_s)
+            resultados.append(resultado)
+            memoria = (
+                f"{resultado['pico_memoria_bytes'] / 1024 / 1024:>10.1f}MB"
+                if resultado["pico_memoria_bytes"] is not None else f"{'-':>12}"
+            )
+            print(
+                f"{workers:>8}{resultado['pares_por_s']:>10.2f}{resultado['p50_s']:>8.2f}s{resultado['p99_s']:>8.2f}s"
+                f"{resultado['bytes_enviados'] / 1024 / 1024:>9.1f}MB{resultado['respostas_429']:>6}"
+                f"{resultado['erros']:>7}{memoria}"
+                + (f"  por endpoint: {resultado['requisicoes_por_endpoint']}" if len(servidores) > 1 else "")
+            )
+    for servidor in servidores:
+        servidor.parar()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parametros": vars(args), "resultados": resultados}, f, ensure_ascii=False, indent=4)
+
+    falhou = False
+    for resultado in resultados:
+        if resultado["erros"]:
+            print(f"❌ {resultado['erros']} pares com erro com {resultado['workers']} workers", file=sys.stderr)
+            falhou = True
+        if args.min_pares_s is not None and resultado["pares_por_s"] < args.min_pares_s:
+            print(f"❌ Vazão abaixo de {args.min_pares_s} pares/s com {resultado['workers']} workers", file=sys.stderr)
+            falhou = True
+        if args.max_p99_s is not None and resultado["p99_s"] > args.max_p99_s:
+            print(f"❌ p99 acima de {args.max_p99_s}s com {resultado['workers']} workers", file=sys.stderr)
+            falhou = True
+    return 1 if falhou else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
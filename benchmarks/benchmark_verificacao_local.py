@@ -0,0 +1,71 @@
+"""Mede a verificação local (código de barras + OCR) nas imagens de exemplo.
+
+Uso (a partir da raiz do projeto):
+    python benchmarks/benchmark_verificacao_local.py
+    python benchmarks/benchmark_verificacao_local.py Nota01.png Nota02.png --repeticoes 3
+
+Tudo roda offline. Mostra quais leitores estão instalados, o tempo de cada etapa
+por imagem e o que foi lido, e a verificação de cada par de imagens (a primeira
+amostra como "caixa" contra cada uma das outras como "nota").
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import verificacao_local
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos), resultado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("imagens", nargs="*", help="Imagens a medir (padrão: Nota0*.png)")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    caminhos = args.imagens or sorted(glob.glob(os.path.join(RAIZ, "Nota0*.png")))
+    backends = verificacao_local.backends_disponiveis()
+    print(f"Leitores disponíveis: código de barras={backends['codigo_barras']}, OCR={backends['ocr']}\n")
+
+    print(f"{'imagem':<14}{'carregar':>10}{'códigos':>10}{'OCR':>10}{'total':>10}  leitura")
+    for caminho in caminhos:
+        t_carregar, imagem = medir(lambda: verificacao_local.carregar_imagem(caminho), args.repeticoes)
+        t_codigos, _ = medir(lambda: verificacao_local.ler_codigos(imagem), args.repeticoes)
+        t_ocr, _ = medir(lambda: verificacao_local.ler_texto(imagem), args.repeticoes)
+        t_total, leitura = medir(lambda: verificacao_local.ler_documento(caminho), args.repeticoes)
+        print(
+            f"{os.path.basename(caminho):<14}"
+            f"{t_carregar * 1000:>8.0f}ms{t_codigos * 1000:>8.0f}ms{t_ocr * 1000:>8.0f}ms{t_total * 1000:>8.0f}ms"
+            f"  nota={leitura['numero_nota'] or '-'} chave={'sim' if leitura['chave_acesso'] else 'não'}"
+            f" ({leitura['origem'] or 'nada lido'})"
+        )
+
+    if len(caminhos) > 1:
+        print()
+        for caminho_nota in caminhos[1:]:
+            inicio = time.perf_counter()
+            verificacao = verificacao_local.verificar_par(caminhos[0], caminho_nota)
+            duracao = time.perf_counter() - inicio
+            print(
+                f"{os.path.basename(caminhos[0])} x {os.path.basename(caminho_nota)}: "
+                f"{verificacao['status']} em {duracao * 1000:.0f}ms"
+                + (" (reprovado sem chamar a API)" if verificacao["status"] == verificacao_local.DIVERGENTE else "")
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Servidor HTTP local que imita o endpoint chat/completions do Azure OpenAI.
+
+Responde às mesmas requisições que a interface e o lote enviam, repetindo
+respostas gravadas (respostas_gravadas.json), com latência, jitter e erros 429
+configuráveis. Nada sai da máquina, então serve para medir desempenho sem gastar
+cota da API.
+
+Uso isolado (depois aponte AZURE_OPENAI_ENDPOINT para a URL impressa):
+    python benchmarks/servidor_simulado.py --porta 8765 --latencia-ms 800 --jitter-ms 200 --taxa-429 0.05
+
+Ou dentro de outro script:
+    servidor = ServidorSimulado(latencia_ms=50)
+    servidor.iniciar()
+    client = OpenAI(base_url=servidor.url, api_key="simulado")
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analise
+import estruturado
+import remessa
+from imagens import estimar_tokens_imagem
+
+ARQUIVO_RESPOSTAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "respostas_gravadas.json")
+
+# Tamanho dos trechos enviados no streaming (em caracteres)
+TAMANHO_TRECHO = 24
+
+
+def classificar(corpo):
+    """Decide qual resposta gravada devolver: caixa, nota ou cruzamento (e a versão estruturada)."""
+    conteudo = corpo["messages"][0]["content"]
+    if isinstance(conteudo, list):
+        texto = next(parte["text"] for parte in conteudo if parte["type"] == "text")
+        if texto.startswith(remessa.PROMPT_CAIXA_REMESSA):
+            return "caixa_remessa"
+        if texto.startswith((analise.PROMPT_CAIXA, estruturado.PROMPT_CAIXA_ESTRUTURADO)):
+            tipo = "caixa"
+        else:
+            tipo = "nota"
+        return tipo + "_estruturado" if corpo.get("response_format") else tipo
+    return "cruzamento"
+
+
+def estimar_uso(corpo, resposta):
+    entrada = 0
+    for mensagem in corpo["messages"]:
+        conteudo = mensagem["content"]
+        partes = conteudo if isinstance(conteudo, list) else [{"type": "text", "text": conteudo}]
+        for parte in partes:
+            # Sem decodificar a imagem: tamanho típico das amostras já pré-processadas
+            entrada += len(parte["text"]) // 4 if parte["type"] == "text" else estimar_tokens_imagem(1024, 1536)
+    saida = len(resposta) // 4
+    return {"prompt_tokens": entrada, "completion_tokens": saida, "total_tokens": entrada + saida}
+
+
+class ServidorSimulado:
+    def __init__(self, porta=0, latencia_ms=0, jitter_ms=0, taxa_429=0.0, retry_after_ms=1000,
+                 intervalo_trecho_ms=0, respostas=ARQUIVO_RESPOSTAS, semente=None):
+        with open(respostas, encoding="utf-8") as f:
+            self.respostas = json.load(f)
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.taxa_429 = taxa_429
+        self.retry_after_ms = retry_after_ms
+        self.intervalo_trecho_ms = intervalo_trecho_ms
+        self._aleatorio = random.Random(semente)
+        self._lock = threading.Lock()
+        self.zerar_contadores()
+
+        self._http = ThreadingHTTPServer(("127.0.0.1", porta), self._criar_handler())
+        self._http.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, porta = self._http.server_address[:2]
+        return f"http://{host}:{porta}/v1"
+
+    def zerar_contadores(self):
+        with self._lock:
+            self.contadores = {"requisicoes": 0, "respostas_429": 0, "bytes_recebidos": 0, "bytes_enviados": 0}
+
+    def _somar(self, **valores):
+        with self._lock:
+            for nome, valor in valores.items():
+                self.contadores[nome] += valor
+
+    def _sortear(self):
+        with self._lock:
+            atraso = max(0.0, self.latencia_ms + self._aleatorio.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            throttle = self._aleatorio.random() < self.taxa_429
+        return atraso, throttle
+
+    def _criar_handler(self):
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _enviar_json(self, status, dados, cabecalhos=()):
+                corpo = json.dumps(dados, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(corpo)))
+                for nome, valor in cabecalhos:
+                    self.send_header(nome, valor)
+                self.end_headers()
+                self.wfile.write(corpo)
+                servidor._somar(bytes_enviados=len(corpo))
+
+            def _enviar_trecho_sse(self, dados):
+                linha = f"data: {dados if isinstance(dados, str) else json.dumps(dados, ensure_ascii=False)}\n\n"
+                bloco = linha.encode("utf-8")
+                # Transfer-Encoding: chunked, para manter a conexão viva entre requisições
+                self.wfile.write(f"{len(bloco):x}\r\n".encode("ascii") + bloco + b"\r\n")
+                self.wfile.flush()
+                servidor._somar(bytes_enviados=len(bloco))
+
+            def do_POST(self):
+                tamanho = int(self.headers.get("Content-Length", 0))
+                corpo = json.loads(self.rfile.read(tamanho))
+                servidor._somar(requisicoes=1, bytes_recebidos=tamanho)
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._enviar_json(404, {"error": {"message": f"Rota não simulada: {self.path}"}})
+                    return
+
+                atraso, throttle = servidor._sortear()
+                if throttle:
+                    servidor._somar(respostas_429=1)
+                    self._enviar_json(
+                        429,
+                        {"error": {"code": "429", "message": "Requests to the deployment have exceeded the rate limit (simulado)."}},
+                        cabecalhos=[("retry-after-ms", str(servidor.retry_after_ms))],
+                    )
+                    return
+
+                time.sleep(atraso)
+                resposta = servidor.respostas[classificar(corpo)]
+                uso = estimar_uso(corpo, resposta)
+                identificador = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                criado = int(time.time())
+
+                if not corpo.get("stream"):
+                    self._enviar_json(200, {
+                        "id": identificador,
+                        "object": "chat.completion",
+                        "created": criado,
+                        "model": corpo["model"],
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": resposta},
+                            "finish_reason": "stop",
+                        }],
+                        "usage": uso,
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                base = {"id": identificador, "object": "chat.completion.chunk", "created": criado, "model": corpo["model"]}
+                for inicio in range(0, len(resposta), TAMANHO_TRECHO):
+                    self._enviar_trecho_sse({**base, "choices": [{
+                        "index": 0,
+                        "delta": {"content": resposta[inicio:inicio + TAMANHO_TRECHO]},
+                        "finish_reason": None,
+                    }]})
+                    if servidor.intervalo_trecho_ms:
+                        time.sleep(servidor.intervalo_trecho_ms / 1000)
+                self._enviar_trecho_sse({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                if (corpo.get("stream_options") or {}).get("include_usage"):
+                    self._enviar_trecho_sse({**base, "choices": [], "usage": uso})
+                self._enviar_trecho_sse("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+    def iniciar(self):
+        """Atende em uma thread própria; retorna a URL base para o cliente OpenAI."""
+        self._thread = threading.Thread(target=self._http.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def parar(self):
+        self._http.shutdown()
+        self._http.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor local que imita o chat/completions do Azure OpenAI.")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--latencia-ms", type=float, default=800, help="Tempo até a resposta")
+    parser.add_argument("--jitter-ms", type=float, default=200, help="Variação aleatória (±) da latência")
+    parser.add_argument("--taxa-429", type=float, default=0.0, help="Fração das requisições respondidas com 429")
+    parser.add_argument("--retry-after-ms", type=int, default=1000, help="Valor do cabeçalho retry-after-ms nos 429")
+    parser.add_argument("--intervalo-trecho-ms", type=float, default=0, help="Pausa entre trechos no streaming")
+    parser.add_argument("--respostas", default=ARQUIVO_RESPOSTAS, help="JSON com as respostas gravadas")
+    args = parser.parse_args(argv)
+
+    servidor = ServidorSimulado(
+        porta=args.porta, latencia_ms=args.latencia_ms, jitter_ms=args.jitter_ms, taxa_429=args.taxa_429,
+        retry_after_ms=args.retry_after_ms, intervalo_trecho_ms=args.intervalo_trecho_ms, respostas=args.respostas,
+    )
+    print(f"Servidor simulado em {servidor.url} (Ctrl+C para parar)")
+    print(f"Use no .env: AZURE_OPENAI_ENDPOINT={servidor.url}")
+    try:
+        servidor._http.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor._http.server_close()
+
+
+if __name__ == "__main__":
+    main()
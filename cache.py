@@ -0,0 +1,165 @@
+"""Cache persistente (SQLite) das respostas do modelo.
+
+As extrações são indexadas pelo hash dos bytes da imagem, do prompt, do
+deployment e do perfil de pré-processamento; os cruzamentos pelo hash do prompt
+de cruzamento (que já contém os dois textos extraídos). Quando o arquivo passa
+do limite configurado, as entradas acessadas há mais tempo são removidas (LRU).
+
+Configuração opcional no .env:
+    CACHE_CAMINHO=.cache/respostas.sqlite3
+    CACHE_LIMITE_MB=200
+    CACHE_DESATIVADO=1
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CAMINHO_PADRAO = os.path.join(".cache", "respostas.sqlite3")
+LIMITE_PADRAO_MB = 200
+
+EXTRACAO = "extracao"
+CRUZAMENTO = "cruzamento"
+
+
+def hash_arquivo(caminho, tamanho_bloco=1024 * 1024):
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def chave_extracao(caminho_imagem, prompt, deployment_name, perfil=None):
+    h = hashlib.sha256()
+    h.update(hash_arquivo(caminho_imagem).encode())
+    h.update(b"\0" + prompt.encode("utf-8"))
+    h.update(b"\0" + deployment_name.encode("utf-8"))
+    h.update(b"\0" + json.dumps(perfil, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def chave_cruzamento(prompt_cruzamento, deployment_name):
+    h = hashlib.sha256()
+    h.update(prompt_cruzamento.encode("utf-8"))
+    h.update(b"\0" + deployment_name.encode("utf-8"))
+    return h.hexdigest()
+
+
+class CacheRespostas:
+    def __init__(self, caminho=CAMINHO_PADRAO, limite_bytes=LIMITE_PADRAO_MB * 1024 * 1024):
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+
+        self.caminho = caminho
+        self.limite_bytes = limite_bytes
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute(
+            """CREATE TABLE IF NOT EXISTS respostas (
+                chave TEXT PRIMARY KEY,
+                tipo TEXT NOT NULL,
+                valor TEXT NOT NULL,
+                tamanho INTEGER NOT NULL,
+                duracao_s REAL NOT NULL,
+                ultimo_acesso REAL NOT NULL
+            )"""
+        )
+        self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_respostas_acesso ON respostas (ultimo_acesso)")
+        self._conexao.commit()
+        self._tamanho_total = self._conexao.execute("SELECT COALESCE(SUM(tamanho), 0) FROM respostas").fetchone()[0]
+
+        self._contadores = {
+            tipo: {"acertos": 0, "falhas": 0, "segundos_economizados": 0.0}
+            for tipo in (EXTRACAO, CRUZAMENTO)
+        }
+
+    def obter(self, chave, tipo):
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT valor, duracao_s FROM respostas WHERE chave = ?", (chave,)
+            ).fetchone()
+            contador = self._contadores[tipo]
+            if linha is None:
+                contador["falhas"] += 1
+                return None
+
+            contador["acertos"] += 1
+            contador["segundos_economizados"] += linha[1]
+            self._conexao.execute(
+                "UPDATE respostas SET ultimo_acesso = ? WHERE chave = ?", (time.time(), chave)
+            )
+            self._conexao.commit()
+            return linha[0]
+
+    def gravar(self, chave, tipo, valor, duracao_s=0.0):
+        tamanho = len(valor.encode("utf-8"))
+        with self._lock:
+            anterior = self._conexao.execute(
+                "SELECT tamanho FROM respostas WHERE chave = ?", (chave,)
+            ).fetchone()
+            if anterior:
+                self._tamanho_total -= anterior[0]
+
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO respostas (chave, tipo, valor, tamanho, duracao_s, ultimo_acesso) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (chave, tipo, valor, tamanho, duracao_s, time.time()),
+            )
+            self._tamanho_total += tamanho
+            self._remover_excedente()
+            self._conexao.commit()
+
+    def _remover_excedente(self):
+        # Remove as entradas menos usadas recentemente até voltar ao limite
+        while self._tamanho_total > self.limite_bytes:
+            linhas = self._conexao.execute(
+                "SELECT chave, tamanho FROM respostas ORDER BY ultimo_acesso LIMIT 64"
+            ).fetchall()
+            if not linhas:
+                break
+            for chave, tamanho in linhas:
+                self._conexao.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+                self._tamanho_total -= tamanho
+                if self._tamanho_total <= self.limite_bytes:
+                    break
+
+    def limpar(self):
+        with self._lock:
+            self._conexao.execute("DELETE FROM respostas")
+            self._conexao.commit()
+            self._tamanho_total = 0
+
+    def estatisticas(self):
+        with self._lock:
+            estatisticas = {tipo: dict(contador) for tipo, contador in self._contadores.items()}
+            estatisticas["tamanho_bytes"] = self._tamanho_total
+        return estatisticas
+
+    def fechar(self):
+        with self._lock:
+            self._conexao.close()
+
+
+def abrir_cache_padrao():
+    """Abre o cache conforme o .env, ou retorna None se estiver desativado."""
+    if os.getenv("CACHE_DESATIVADO") == "1":
+        return None
+    caminho = os.getenv("CACHE_CAMINHO", CAMINHO_PADRAO)
+    limite_mb = float(os.getenv("CACHE_LIMITE_MB", LIMITE_PADRAO_MB))
+    return CacheRespostas(caminho, int(limite_mb * 1024 * 1024))
+
+
+def descrever_estatisticas(estatisticas):
+    partes = []
+    for tipo, rotulo in ((EXTRACAO, "extrações"), (CRUZAMENTO, "cruzamentos")):
+        contador = estatisticas[tipo]
+        partes.append(
+            f"{rotulo}: {contador['acertos']} acertos / {contador['falhas']} falhas "
+            f"(~{contador['segundos_economizados']:.1f}s economizados)"
+        )
+    return "Cache — " + "; ".join(partes)
@@ -0,0 +1,107 @@
+import os
+
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente do arquivo .env
+load_dotenv()
+
+
+def carregar_credenciais():
+    endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
+    deployment_name = os.getenv("AZURE_OPENAI_DEPLOYMENT") or "gpt-4.1"
+    api_key = os.getenv("AZURE_OPENAI_API_KEY")
+
+    # Validar se as credenciais foram carregadas
+    if not endpoint or not api_key:
+        raise ValueError(
+            "Credenciais não encontradas! \n"
+            "Certifique-se de criar um arquivo .env com:\n"
+            "AZURE_OPENAI_ENDPOINT=seu_endpoint\n"
+            "AZURE_OPENAI_API_KEY=sua_api_key\n"
+            "AZURE_OPENAI_DEPLOYMENT=gpt-4.1"
+        )
+
+    return endpoint, api_key, deployment_name
+
+
+def _lista(nome):
+    return [item.strip() for item in (os.getenv(nome) or "").split(",") if item.strip()]
+
+
+def _expandir(nome, valores, quantidade, padrao):
+    """Um valor (ou nenhum, usando o padrão) vale para todos os endpoints; senão precisa haver um por endpoint."""
+    if not valores:
+        valores = padrao
+    if len(valores) == 1:
+        return valores * quantidade
+    if len(valores) != quantidade:
+        raise ValueError(f"{nome} tem {len(valores)} valores, mas há {quantidade} endpoints")
+    return valores
+
+
+def _carregar_grupo(prefixo, padrao_endpoints, padrao_chaves, padrao_deployments):
+    endpoints = _lista(f"{prefixo}_ENDPOINTS") or padrao_endpoints
+    if not endpoints:
+        return []
+    chaves = _expandir(f"{prefixo}_API_KEYS", _lista(f"{prefixo}_API_KEYS"), len(endpoints), padrao_chaves)
+    deployments = _expandir(
+        f"{prefixo}_DEPLOYMENTS", _lista(f"{prefixo}_DEPLOYMENTS"), len(endpoints), padrao_deployments
+    )
+    pesos = [float(peso) for peso in _expandir(f"{prefixo}_PESOS", _lista(f"{prefixo}_PESOS"), len(endpoints), ["1"])]
+    if not all(chaves) or any(peso <= 0 for peso in pesos):
+        raise ValueError(f"Configure {prefixo}_API_KEYS (ou AZURE_OPENAI_API_KEY) e pesos maiores que zero")
+    return [
+        {"endpoint": endpoint, "api_key": chave, "deployment": deployment, "peso": peso}
+        for endpoint, chave, deployment, peso in zip(endpoints, chaves, deployments, pesos)
+    ]
+
+
+def carregar_grupos_endpoints():
+    """Endpoints de extração e de cruzamento do .env (ver balanceador.py); None na configuração de endpoint único."""
+    plurais = ("ENDPOINTS", "API_KEYS", "DEPLOYMENTS", "PESOS")
+    if not any(os.getenv(f"AZURE_OPENAI_{nome}") or os.getenv(f"AZURE_OPENAI_CRUZAMENTO_{nome}") for nome in plurais):
+        return None
+
+    endpoints = _lista("AZURE_OPENAI_ENDPOINT")
+    chave = [os.getenv("AZURE_OPENAI_API_KEY") or ""]
+    deployment = [os.getenv("AZURE_OPENAI_DEPLOYMENT") or "gpt-4.1"]
+    extracao = _carregar_grupo("AZURE_OPENAI", endpoints, chave, deployment)
+    if not extracao:
+        carregar_credenciais()  # mesma mensagem de erro do endpoint único
+    cruzamento = []
+    if any(os.getenv(f"AZURE_OPENAI_CRUZAMENTO_{nome}") for nome in plurais):
+        # O que não for indicado para o cruzamento é herdado da extração
+        cruzamento = _carregar_grupo(
+            "AZURE_OPENAI_CRUZAMENTO",
+            _lista("AZURE_OPENAI_ENDPOINTS") or endpoints,
+            _lista("AZURE_OPENAI_API_KEYS") or chave,
+            _lista("AZURE_OPENAI_DEPLOYMENTS") or deployment,
+        )
+    return {"extracao": extracao, "cruzamento": cruzamento}
+
+
+def criar_cliente():
+    from limitador import criar_limitador
+
+    grupos = carregar_grupos_endpoints()
+    if grupos is not None:
+        from balanceador import criar_balanceador
+
+        deployments = []
+        for item in grupos["extracao"] + grupos["cruzamento"]:
+            if item["deployment"] not in deployments:
+                deployments.append(item["deployment"])
+        # O nome combinado entra na chave do cache e no histórico
+        return criar_limitador().envolver(criar_balanceador(grupos)), "+".join(deployments)
+
+    endpoint, api_key, deployment_name = carregar_credenciais()
+    # Só depois de validar as credenciais: o SDK demora a importar
+    from openai import OpenAI
+
+    client = OpenAI(
+        base_url=endpoint,
+        api_key=api_key,
+        # As novas tentativas ficam a cargo do limitador, que conhece os limites do deployment
+        max_retries=0
+    )
+    return criar_limitador().envolver(client), deployment_name
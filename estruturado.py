@@ -0,0 +1,302 @@
+"""Extração estruturada (JSON schema) e cruzamento local.
+
+No modo estruturado o modelo devolve só os campos usados no cruzamento (número
+da nota, chave de acesso, CNPJ e itens com nome/quantidade). O cruzamento é
+feito aqui mesmo, em Python, comparando os nomes normalizados dos produtos, sem
+a segunda chamada ao modelo. Quando algum produto só casa de forma aproximada,
+o resultado é marcado como ambíguo e pode ser enviado ao cruzamento via LLM
+(analise.cruzar_informacoes) se o fallback estiver ativado.
+
+Ative pelo .env:
+    MODO_EXTRACAO=estruturado
+    CRUZAMENTO_LLM_FALLBACK=1
+"""
+import difflib
+import json
+import os
+import re
+import unicodedata
+
+import analise
+import imagens
+
+MODO_TEXTO = "texto"
+MODO_ESTRUTURADO = "estruturado"
+
+# Similaridade mínima entre nomes normalizados para considerar o mesmo produto
+SIMILARIDADE_MINIMA = 0.85
+# Abaixo deste valor os nomes são considerados produtos diferentes; entre os dois é ambíguo
+SIMILARIDADE_AMBIGUA = 0.6
+
+ESQUEMA_DOCUMENTO = {
+    "type": "object",
+    "properties": {
+        "numero_nota": {"type": ["string", "null"], "description": "Número da nota fiscal (NF-e), só dígitos"},
+        "chave_acesso": {"type": ["string", "null"], "description": "Chave de acesso da NF-e com 44 dígitos"},
+        "cnpj": {"type": ["string", "null"], "description": "CNPJ do emitente/remetente"},
+        "itens": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "nome": {"type": "string"},
+                    "quantidade": {"type": ["number", "null"]},
+                },
+                "required": ["nome", "quantidade"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["numero_nota", "chave_acesso", "cnpj", "itens"],
+    "additionalProperties": False,
+}
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "documento", "strict": True, "schema": ESQUEMA_DOCUMENTO},
+}
+
+PROMPT_CAIXA_ESTRUTURADO = "Extraia da etiqueta/imagem desta caixa o número da nota fiscal, a chave de acesso, o CNPJ e os produtos com suas quantidades. Use null para campos que não estão visíveis."
+
+PROMPT_NOTA_ESTRUTURADO = "Extraia desta nota fiscal o número da nota, a chave de acesso, o CNPJ do emitente e todos os itens com nome e quantidade. Use null para campos que não estão visíveis."
+
+
+def modo_extracao():
+    return os.getenv("MODO_EXTRACAO", MODO_TEXTO).lower()
+
+
+def fallback_llm_ativado():
+    return os.getenv("CRUZAMENTO_LLM_FALLBACK") == "1"
+
+
+def ler_resposta_json(resposta, descricao="extração estruturada"):
+    """Converte a resposta do modelo num dicionário, com um erro legível se ela vier vazia ou não for JSON.
+
+    A resposta vem vazia (None ou "") quando o filtro de conteúdo bloqueia a saída, e
+    o JSON fica incompleto quando ela é cortada pelo limite de tokens.
+    """
+    if not resposta:
+        raise ValueError(f"O modelo não retornou conteúdo na {descricao} (resposta vazia ou bloqueada pelo filtro de conteúdo)")
+    try:
+        dados = json.loads(resposta)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"A resposta da {descricao} não é um JSON válido ({e.msg}, posição {e.pos}): {resposta[:100]!r}") from None
+    if not isinstance(dados, dict):
+        raise ValueError(f"A resposta da {descricao} não é um objeto JSON: {resposta[:100]!r}")
+    return dados
+
+
+def extrair_dados(client, deployment_name, caminho_imagem, tipo, estatisticas=None, cache=None, cancelamento=None,
+                  dica=None):
+    prompt = PROMPT_CAIXA_ESTRUTURADO if tipo == "caixa" else PROMPT_NOTA_ESTRUTURADO
+    descricao = f"extração da {tipo} ({os.path.basename(caminho_imagem)})"
+    validar = lambda resposta: ler_resposta_json(resposta, descricao)
+    resposta = analise.extrair_informacoes(
+        client, deployment_name, caminho_imagem, prompt + (dica or ""),
+        perfil=imagens.carregar_perfil(tipo), estatisticas=estatisticas, cache=cache,
+        cancelamento=cancelamento, response_format=RESPONSE_FORMAT, operacao=tipo, validar=validar
+    )
+    # Validada de novo: uma resposta vinda do cache não passa por `validar`
+    return validar(resposta)
+
+
+def formatar_dados(dados):
+    linhas = [
+        f"Número da nota: {dados.get('numero_nota') or '-'}",
+        f"Chave de acesso: {dados.get('chave_acesso') or '-'}",
+        f"CNPJ: {dados.get('cnpj') or '-'}",
+        "Itens:",
+    ]
+    for item in dados.get("itens") or []:
+        quantidade = item.get("quantidade")
+        linhas.append(f"  - {item['nome']}: {quantidade if quantidade is not None else '?'}")
+    return "\n".join(linhas)
+
+
+def normalizar_nome(nome):
+    nome = unicodedata.normalize("NFKD", nome).encode("ascii", "ignore").decode("ascii").lower()
+    nome = re.sub(r"[^a-z0-9]+", " ", nome)
+    return " ".join(nome.split())
+
+
+def normalizar_numero(numero):
+    if not numero:
+        return None
+    digitos = re.sub(r"\D", "", str(numero)).lstrip("0")
+    return digitos or None
+
+
+def somar_por_nome(itens):
+    # Soma quantidades de itens repetidos com o mesmo nome normalizado
+    totais = {}
+    nomes = {}
+    for item in itens or []:
+        chave = normalizar_nome(item["nome"])
+        if not chave:
+            continue
+        nomes.setdefault(chave, item["nome"])
+        quantidade = item.get("quantidade")
+        if quantidade is None or (chave in totais and totais[chave] is None):
+            # Quantidade ilegível em qualquer ocorrência deixa o total desconhecido
+            totais[chave] = None
+        else:
+            totais[chave] = totais.get(chave, 0) + quantidade
+    return totais, nomes
+
+
+def melhor_correspondencia(nome, candidatos):
+    melhor, melhor_razao = None, 0.0
+    for candidato in candidatos:
+        razao = 1.0 if candidato == nome else difflib.SequenceMatcher(None, nome, candidato).ratio()
+        if razao > melhor_razao:
+            melhor, melhor_razao = candidato, razao
+    return melhor, melhor_razao
+
+
+def comparar_itens(itens_caixa, itens_nota):
+    """Casa os itens da caixa com os da nota; retorna a lista de comparações por produto."""
+    caixa, nomes_caixa = somar_por_nome(itens_caixa)
+    nota, nomes_nota = somar_por_nome(itens_nota)
+    restantes = set(nota)
+    comparacoes = []
+
+    for chave, quantidade_caixa in caixa.items():
+        melhor, razao = melhor_correspondencia(chave, restantes)
+        if melhor is not None and razao >= SIMILARIDADE_AMBIGUA:
+            restantes.discard(melhor)
+            quantidade_nota = nota[melhor]
+            comparacoes.append({
+                "produto": nomes_caixa[chave],
+                "produto_nota": nomes_nota[melhor],
+                "quantidade_caixa": quantidade_caixa,
+                "quantidade_nota": quantidade_nota,
+                "similaridade": round(razao, 2),
+                "ambiguo": razao < SIMILARIDADE_MINIMA,
+                "ok": razao >= SIMILARIDADE_MINIMA and quantidade_caixa is not None and quantidade_caixa == quantidade_nota,
+            })
+        else:
+            comparacoes.append({
+                "produto": nomes_caixa[chave], "produto_nota": None,
+                "quantidade_caixa": quantidade_caixa, "quantidade_nota": None,
+                "similaridade": round(razao, 2), "ambiguo": False, "ok": False,
+            })
+
+    for chave in sorted(restantes):
+        comparacoes.append({
+            "produto": nomes_nota[chave], "produto_nota": nomes_nota[chave],
+            "quantidade_caixa": None, "quantidade_nota": nota[chave],
+            "similaridade": 0.0, "ambiguo": False, "ok": False,
+        })
+    return comparacoes
+
+
+def comparar_localmente(dados_caixa, dados_nota):
+    """Cruzamento local; retorna (veredito, relatório em texto) no mesmo formato do cruzamento via LLM."""
+    comparacoes = comparar_itens(dados_caixa.get("itens"), dados_nota.get("itens"))
+
+    numero_caixa = normalizar_numero(dados_caixa.get("numero_nota"))
+    numero_nota = normalizar_numero(dados_nota.get("numero_nota"))
+    chave_caixa = normalizar_numero(dados_caixa.get("chave_acesso"))
+    chave_nota = normalizar_numero(dados_nota.get("chave_acesso"))
+    if chave_caixa and chave_nota:
+        nota_match = chave_caixa == chave_nota
+    else:
+        nota_match = bool(numero_caixa) and numero_caixa == numero_nota
+
+    produtos_match = bool(comparacoes) and all(c["ok"] for c in comparacoes)
+    itens_ok = sum(1 for c in comparacoes if c["ok"])
+    score = round(100 * (itens_ok + (1 if nota_match else 0)) / (len(comparacoes) + 1))
+    ambiguo = any(c["ambiguo"] for c in comparacoes) or (not numero_caixa and not chave_caixa)
+
+    veredito = {
+        "status": analise.MANUAL if ambiguo else analise.REPROVADO,
+        "score": score,
+        "produtos_match": produtos_match,
+        "nota_match": nota_match,
+        "motivos": [],
+        "ambiguo": ambiguo,
+    }
+    if not ambiguo:
+        if score < analise.SCORE_MINIMO: veredito["motivos"].append(f"Score baixo ({score}%)")
+        if not produtos_match: veredito["motivos"].append("Produtos divergentes")
+        if not nota_match: veredito["motivos"].append("Nota fiscal divergente")
+        veredito["status"] = analise.REPROVADO if veredito["motivos"] else analise.APROVADO
+    else:
+        veredito["motivos"].append("Correspondência ambígua")
+
+    linhas = ["1. COMPARAÇÃO DE PRODUTOS:"]
+    for c in comparacoes:
+        if c["ok"]:
+            status = "OK"
+        elif c["ambiguo"]:
+            status = f"AMBÍGUO (similaridade {c['similaridade']:.0%} com '{c['produto_nota']}')"
+        else:
+            status = "DIVERGENTE"
+        qtd_caixa = c["quantidade_caixa"] if c["quantidade_caixa"] is not None else "-"
+        qtd_nota = c["quantidade_nota"] if c["quantidade_nota"] is not None else "-"
+        linhas.append(f"   - {c['produto']}: Caixa {qtd_caixa} x Nota {qtd_nota} -> {status}")
+    linhas += [
+        "",
+        "2. COMPARAÇÃO DO NÚMERO DA NOTA:",
+        f"   - Caixa: {dados_caixa.get('numero_nota') or '-'}",
+        f"   - Nota: {dados_nota.get('numero_nota') or '-'}",
+        f"   - Status: {'OK' if nota_match else 'DIVERGENTE'}",
+        "",
+        "3. CONCLUSÃO RÁPIDA:",
+        f"   - {analise.descrever_veredito(veredito) if not ambiguo else 'Correspondência ambígua, requer cruzamento via LLM ou análise manual'}",
+        "",
+        "4. DADOS ESTRUTURADOS (JSON):",
+        "```json",
+        json.dumps({"score": score, "produtos_match": produtos_match, "nota_match": nota_match}, indent=4),
+        "```",
+    ]
+    return veredito, "\n".join(linhas)
+
+
+def extrair_par_estruturado(client, deployment_name, caminho_caixa, caminho_nota, cache=None, dicas=None):
+    """Primeira etapa de analisar_par_estruturado: as extrações em JSON da caixa e da nota."""
+    dicas = dicas or {}
+    imagem_caixa = {}
+    imagem_nota = {}
+    dados_caixa = extrair_dados(
+        client, deployment_name, caminho_caixa, "caixa", estatisticas=imagem_caixa, cache=cache, dica=dicas.get("caixa")
+    )
+    dados_nota = extrair_dados(
+        client, deployment_name, caminho_nota, "nota", estatisticas=imagem_nota, cache=cache, dica=dicas.get("nota")
+    )
+    return {
+        "informacoes_caixa": dados_caixa,
+        "informacoes_nota": dados_nota,
+        "imagem_caixa": imagem_caixa,
+        "imagem_nota": imagem_nota,
+    }
+
+
+def cruzar_par_estruturado(client, deployment_name, extracao, cache=None, fallback_llm=False):
+    """Segunda etapa: cruzamento local (LLM só se ambíguo e permitido)."""
+    dados_caixa = extracao["informacoes_caixa"]
+    dados_nota = extracao["informacoes_nota"]
+    estatisticas_cruzamento = {}
+    veredito, relatorio = comparar_localmente(dados_caixa, dados_nota)
+
+    if veredito["ambiguo"] and fallback_llm:
+        relatorio = analise.cruzar_informacoes(
+            client, deployment_name, formatar_dados(dados_caixa), formatar_dados(dados_nota), cache=cache,
+            estatisticas=estatisticas_cruzamento
+        )
+        veredito = analise.interpretar_veredito(relatorio)
+        veredito["cruzamento_llm"] = True
+
+    return {
+        **extracao,
+        "estatisticas_cruzamento": estatisticas_cruzamento,
+        "cruzamento": relatorio,
+        "veredito": veredito,
+    }
+
+
+def analisar_par_estruturado(client, deployment_name, caminho_caixa, caminho_nota, cache=None, fallback_llm=False,
+                             dicas=None):
+    """Fluxo completo no modo estruturado: duas extrações e cruzamento local (LLM só se ambíguo e permitido)."""
+    extracao = extrair_par_estruturado(client, deployment_name, caminho_caixa, caminho_nota, cache=cache, dicas=dicas)
+    return cruzar_par_estruturado(client, deployment_name, extracao, cache=cache, fallback_llm=fallback_llm)
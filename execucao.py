@@ -0,0 +1,104 @@
+"""Execução das chamadas ao modelo fora do loop de eventos do Tkinter.
+
+Cada tarefa roda numa thread própria e o resultado (e os trechos parciais
+publicados durante o streaming) volta ao loop do Tk por uma fila drenada com
+root.after, então os callbacks sempre rodam na thread da interface. Uma tarefa
+cancelada tem o evento de cancelamento sinalizado (as funções de analise.py o
+consultam) e qualquer resultado que ela ainda produza é descartado.
+"""
+import queue
+import sys
+import threading
+import time
+
+
+class Tarefa:
+    def __init__(self, descricao, fila, ao_concluir, ao_falhar, ao_cancelar=None, ao_progresso=None):
+        self.descricao = descricao
+        self.ao_concluir = ao_concluir
+        self.ao_falhar = ao_falhar
+        self.ao_cancelar = ao_cancelar
+        self.ao_progresso = ao_progresso
+        self.cancelamento = threading.Event()
+        self.inicio = time.monotonic()
+        self._fila = fila
+
+    def publicar(self, parcial):
+        """Chamado pela thread de trabalho; entrega um resultado parcial a ao_progresso no loop do Tk."""
+        if self.ao_progresso is not None:
+            self._fila.put((self, self.ao_progresso, parcial, False))
+
+    @property
+    def cancelada(self):
+        return self.cancelamento.is_set()
+
+    def tempo_decorrido(self):
+        return time.monotonic() - self.inicio
+
+
+class ExecutorSegundoPlano:
+    def __init__(self, root, ao_mudar=None, intervalo_ms=50):
+        self.root = root
+        self.ao_mudar = ao_mudar
+        self.intervalo_ms = intervalo_ms
+        self.tarefas = []
+        self._fila = queue.Queue()
+        self.root.after(self.intervalo_ms, self._processar_fila)
+
+    def executar(self, descricao, funcao, ao_concluir, ao_falhar, ao_cancelar=None, ao_progresso=None):
+        """Roda funcao(tarefa) numa thread e agenda os callbacks no loop do Tk."""
+        tarefa = Tarefa(descricao, self._fila, ao_concluir, ao_falhar, ao_cancelar, ao_progresso)
+
+        def trabalho():
+            try:
+                resultado = funcao(tarefa)
+            except Exception as e:
+                self._fila.put((tarefa, tarefa.ao_falhar, e, True))
+            else:
+                self._fila.put((tarefa, tarefa.ao_concluir, resultado, True))
+
+        self.tarefas.append(tarefa)
+        threading.Thread(target=trabalho, daemon=True).start()
+        self._notificar()
+        return tarefa
+
+    def cancelar(self, tarefa):
+        if tarefa not in self.tarefas:
+            return
+        tarefa.cancelamento.set()
+        self.tarefas.remove(tarefa)
+        if tarefa.ao_cancelar:
+            tarefa.ao_cancelar()
+        self._notificar()
+
+    def cancelar_todas(self):
+        for tarefa in list(self.tarefas):
+            self.cancelar(tarefa)
+
+    def em_andamento(self):
+        return bool(self.tarefas)
+
+    def _notificar(self):
+        if self.ao_mudar:
+            self.ao_mudar()
+
+    def _processar_fila(self):
+        try:
+            while True:
+                try:
+                    tarefa, callback, argumento, final = self._fila.get_nowait()
+                except queue.Empty:
+                    break
+                if tarefa.cancelada:
+                    continue
+                if final:
+                    self.tarefas.remove(tarefa)
+                try:
+                    callback(argumento)
+                except Exception:
+                    # Um callback com erro não pode parar a entrega das outras tarefas
+                    self.root.report_callback_exception(*sys.exc_info())
+                if final:
+                    self._notificar()
+        finally:
+            self.root.after(self.intervalo_ms, self._processar_fila)
@@ -0,0 +1,174 @@
+"""Pré-processamento das imagens antes do envio ao modelo.
+
+Corrige a rotação pela tag EXIF, reduz o maior lado, converte notas fiscais para
+tons de cinza e recomprime em JPEG/WebP. O perfil de cada tipo de documento pode
+ser ajustado pelo .env, por exemplo:
+
+    IMAGEM_FORMATO_NOTA=webp      (jpeg, webp ou original)
+    IMAGEM_MAX_LADO_NOTA=1536
+    IMAGEM_QUALIDADE_NOTA=80
+    IMAGEM_CINZA_NOTA=1
+"""
+import binascii
+import io
+import math
+import mmap
+import os
+import time
+
+MIME_POR_FORMATO = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "GIF": "image/gif",
+    "BMP": "image/bmp",
+}
+
+# Bytes lidos por vez na codificação base64 (múltiplo de 3, para não gerar "=" no meio da URL)
+BLOCO_BASE64 = 3 * 64 * 1024
+
+# Perfis padrão por tipo de documento
+PERFIS_PADRAO = {
+    "caixa": {"formato": "jpeg", "max_lado": 1280, "qualidade": 80, "cinza": False},
+    "nota": {"formato": "jpeg", "max_lado": 1536, "qualidade": 80, "cinza": True},
+}
+
+
+def carregar_perfil(tipo):
+    perfil = dict(PERFIS_PADRAO[tipo])
+    sufixo = tipo.upper()
+    perfil["formato"] = os.getenv(f"IMAGEM_FORMATO_{sufixo}", perfil["formato"]).lower()
+    perfil["max_lado"] = int(os.getenv(f"IMAGEM_MAX_LADO_{sufixo}", perfil["max_lado"]))
+    perfil["qualidade"] = int(os.getenv(f"IMAGEM_QUALIDADE_{sufixo}", perfil["qualidade"]))
+    perfil["cinza"] = os.getenv(f"IMAGEM_CINZA_{sufixo}", "1" if perfil["cinza"] else "0") == "1"
+    return perfil
+
+
+def _abrir_original(caminho_imagem):
+    """Mapeia o arquivo na memória (mmap) em vez de lê-lo inteiro; retorna (buffer, mime, dimensões)."""
+    # O Pillow só é importado na primeira imagem, para não pesar no início da interface e do lote
+    from PIL import Image
+
+    with Image.open(caminho_imagem) as imagem:
+        mime = MIME_POR_FORMATO.get(imagem.format, "image/png")
+        dimensoes = imagem.size
+    with open(caminho_imagem, "rb") as arquivo:
+        try:
+            buffer = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Arquivo vazio não pode ser mapeado
+            buffer = io.BytesIO(arquivo.read())
+    return buffer, mime, dimensoes, 0
+
+
+def _abrir_processada(caminho_imagem, perfil):
+    """Recomprime segundo o perfil; retorna (buffer, mime, dimensões, bytes de pixels decodificados)."""
+    if perfil is None or perfil["formato"] == "original":
+        return _abrir_original(caminho_imagem)
+
+    from PIL import Image, ImageOps
+
+    with Image.open(caminho_imagem) as imagem:
+        # Em JPEG (fotos de celular) o draft já decodifica em escala reduzida (1/2, 1/4, 1/8),
+        # sem nunca montar a imagem inteira em resolução máxima na memória
+        imagem.draft("L" if perfil["cinza"] else "RGB", (perfil["max_lado"], perfil["max_lado"]))
+        imagem.load()
+        bytes_pixels = imagem.width * imagem.height * len(imagem.getbands())
+        imagem = ImageOps.exif_transpose(imagem)
+        imagem.thumbnail((perfil["max_lado"], perfil["max_lado"]), Image.LANCZOS)
+
+        if perfil["cinza"]:
+            imagem = imagem.convert("L")
+        elif imagem.mode not in ("RGB", "L"):
+            imagem = imagem.convert("RGB")
+
+        buffer = io.BytesIO()
+        if perfil["formato"] == "webp":
+            imagem.save(buffer, format="WEBP", quality=perfil["qualidade"], method=4)
+            mime = "image/webp"
+        else:
+            imagem.save(buffer, format="JPEG", quality=perfil["qualidade"], optimize=True)
+            mime = "image/jpeg"
+        dimensoes = imagem.size
+    return buffer, mime, dimensoes, bytes_pixels
+
+
+def _conteudo(buffer):
+    # Visão sem cópia do conteúdo do BytesIO ou do mmap
+    return buffer.getbuffer() if isinstance(buffer, io.BytesIO) else memoryview(buffer)
+
+
+def recomprimir(caminho_imagem, perfil):
+    """Retorna (bytes, mime, (largura, altura)) da imagem processada segundo o perfil."""
+    buffer, mime, dimensoes, _ = _abrir_processada(caminho_imagem, perfil)
+    with buffer:
+        conteudo = _conteudo(buffer)
+        dados = bytes(conteudo)
+        conteudo.release()
+    return dados, mime, dimensoes
+
+
+def montar_data_url(buffer, mime):
+    """Codifica o conteúdo do buffer em base64 bloco a bloco, direto num único bytearray.
+
+    Evita as cópias intermediárias de base64.b64encode + decode + concatenação: além
+    do buffer de origem, só existem o bytearray com a URL e a str final. O buffer é
+    fechado antes de gerar a str, então o pico fica em ~2,7x o tamanho da imagem
+    (antes eram ~5x).
+    """
+    prefixo = f"data:{mime};base64,".encode("ascii")
+    conteudo = _conteudo(buffer)
+    destino = bytearray(len(prefixo) + 4 * ((len(conteudo) + 2) // 3))
+    destino[:len(prefixo)] = prefixo
+    posicao = len(prefixo)
+    for inicio in range(0, len(conteudo), BLOCO_BASE64):
+        codificado = binascii.b2a_base64(conteudo[inicio:inicio + BLOCO_BASE64], newline=False)
+        destino[posicao:posicao + len(codificado)] = codificado
+        posicao += len(codificado)
+    conteudo.release()
+    buffer.close()
+    return destino.decode("ascii")
+
+
+def estimar_tokens_imagem(largura, altura):
+    """Tokens cobrados por uma imagem em detail "high": 85 + 170 por bloco de 512 px.
+
+    A imagem é reduzida para caber em 2048x2048 e depois para o menor lado ter 768 px.
+    """
+    escala = min(1.0, 2048 / max(largura, altura))
+    largura, altura = largura * escala, altura * escala
+    escala = min(1.0, 768 / min(largura, altura))
+    largura, altura = largura * escala, altura * escala
+    return 85 + 170 * math.ceil(largura / 512) * math.ceil(altura / 512)
+
+
+def preparar_imagem(caminho_imagem, perfil=None):
+    """Gera a data URL para envio e as estatísticas de tamanho, tempo e memória do pré-processamento."""
+    bytes_original = os.path.getsize(caminho_imagem)
+    inicio = time.perf_counter()
+    buffer, mime, dimensoes, bytes_pixels = _abrir_processada(caminho_imagem, perfil)
+    bytes_processado = len(_conteudo(buffer)) if isinstance(buffer, io.BytesIO) else len(buffer)
+    meio = time.perf_counter()
+    url = montar_data_url(buffer, mime)
+    fim = time.perf_counter()
+    return url, {
+        "mime": mime,
+        "bytes_original": bytes_original,
+        "bytes_processado": bytes_processado,
+        "bytes_economizados": bytes_original - bytes_processado,
+        "bytes_enviados": len(url),
+        "tokens_imagem_estimados": estimar_tokens_imagem(*dimensoes),
+        "tempo_recompressao_s": meio - inicio,
+        "tempo_base64_s": fim - meio,
+        "memoria_pico_estimada_bytes": estimar_memoria_pico(bytes_pixels, bytes_processado, len(url)),
+    }
+
+
+def estimar_memoria_pico(bytes_pixels, bytes_processado, bytes_url):
+    """Pico de memória de uma requisição, pela maior das fases.
+
+    Decodificação (pixels + arquivo recomprimido), base64 (bytearray + str) e envio
+    (a str da URL mais o JSON que o SDK monta, em str e depois em bytes). Depois do
+    envio a URL é descartada (analise.completar) e só resta o corpo da requisição.
+    """
+    return max(bytes_pixels + bytes_processado, bytes_processado + 2 * bytes_url, 3 * bytes_url)
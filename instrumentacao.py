@@ -0,0 +1,259 @@
+"""Instrumentação das chamadas ao modelo: tempo por etapa, tokens, bytes e novas tentativas.
+
+Cada chamada (extração da caixa, da nota ou cruzamento) gera um evento com a
+duração de cada etapa e os contadores da chamada:
+
+    recompressao     pré-processamento da imagem (imagens.recomprimir)
+    base64           montagem da data URL
+    fila             espera no limitador de requisições (inclui novas tentativas)
+    primeiro_trecho  do envio até o primeiro trecho da resposta (upload + início da geração)
+    modelo           do envio até o fim da resposta
+    renderizacao     tempo gasto inserindo os trechos na interface
+    total            a chamada inteira, de ponta a ponta
+    cache            chamada respondida pelo cache de respostas
+
+Os eventos vão para os sinks configurados. O histograma em memória está sempre
+ativo (é ele que alimenta o painel de p50/p95 da interface); os demais são
+opcionais no .env:
+    METRICAS_LOG=metricas.jsonl                 (um evento JSON por linha)
+    METRICAS_PROMETHEUS=metricas.prom           (formato texto do Prometheus, p/ node_exporter textfile)
+"""
+import collections
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+ETAPAS = ("recompressao", "base64", "fila", "primeiro_trecho", "modelo", "renderizacao", "total", "cache")
+
+CONTADORES = ("tokens_entrada", "tokens_saida", "tokens_imagem_estimados", "bytes_enviados", "novas_tentativas")
+
+# Limites (em segundos) dos buckets do histograma exportado para o Prometheus
+LIMITES_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+# Amostras guardadas por etapa para o cálculo de percentis na interface
+AMOSTRAS_POR_ETAPA = 2000
+
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return None
+    # Método do posto mais próximo
+    indice = max(0, math.ceil(p / 100 * len(valores_ordenados)) - 1)
+    return valores_ordenados[indice]
+
+
+class SinkLogJson:
+    """Grava cada evento como uma linha JSON."""
+
+    def __init__(self, caminho):
+        self._lock = threading.Lock()
+        self._arquivo = open(caminho, "a", encoding="utf-8")
+
+    def receber(self, evento):
+        linha = json.dumps(evento, ensure_ascii=False)
+        with self._lock:
+            self._arquivo.write(linha + "\n")
+            self._arquivo.flush()
+
+    def fechar(self):
+        with self._lock:
+            self._arquivo.close()
+
+
+class HistogramaLatencias:
+    """Guarda as últimas durações por operação/etapa e os totais dos contadores, em memória."""
+
+    def __init__(self, amostras=AMOSTRAS_POR_ETAPA):
+        self._lock = threading.Lock()
+        self._amostras = amostras
+        self._duracoes = {}
+        self._totais = collections.defaultdict(
+            lambda: dict.fromkeys(CONTADORES + ("chamadas", "erros", "memoria_pico_max_bytes"), 0)
+        )
+        # Incrementado a cada evento, para a interface só recalcular quando algo mudou
+        self.versao = 0
+
+    def receber(self, evento):
+        with self._lock:
+            for etapa, duracao in evento["etapas"].items():
+                chave = (evento["operacao"], etapa)
+                if chave not in self._duracoes:
+                    self._duracoes[chave] = collections.deque(maxlen=self._amostras)
+                self._duracoes[chave].append(duracao)
+            if evento.get("parcial"):
+                self.versao += 1
+                return
+            totais = self._totais[evento["operacao"]]
+            totais["chamadas"] += 1
+            totais["erros"] += 1 if evento.get("erro") else 0
+            for contador in CONTADORES:
+                totais[contador] += evento.get(contador) or 0
+            totais["memoria_pico_max_bytes"] = max(
+                totais["memoria_pico_max_bytes"], evento.get("memoria_pico_estimada_bytes") or 0
+            )
+            self.versao += 1
+
+    def percentis(self):
+        """{(operacao, etapa): {"n", "p50", "p95"}}, na ordem de ETAPAS."""
+        with self._lock:
+            copia = {chave: sorted(valores) for chave, valores in self._duracoes.items()}
+        ordem = {etapa: i for i, etapa in enumerate(ETAPAS)}
+        resultado = {}
+        for chave in sorted(copia, key=lambda c: (c[0], ordem.get(c[1], len(ETAPAS)))):
+            valores = copia[chave]
+            resultado[chave] = {"n": len(valores), "p50": percentil(valores, 50), "p95": percentil(valores, 95)}
+        return resultado
+
+    def totais(self):
+        with self._lock:
+            return {operacao: dict(totais) for operacao, totais in self._totais.items()}
+
+    def fechar(self):
+        pass
+
+
+class SinkPrometheus:
+    """Mantém histogramas e contadores acumulados e reescreve um arquivo no formato texto do Prometheus."""
+
+    def __init__(self, caminho, intervalo_s=5.0):
+        self.caminho = caminho
+        self.intervalo_s = intervalo_s
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._somas = collections.defaultdict(float)
+        self._contagens = collections.defaultdict(int)
+        self._contadores = collections.defaultdict(float)
+        self._ultima_escrita = 0.0
+
+    def receber(self, evento):
+        operacao = evento["operacao"]
+        with self._lock:
+            for etapa, duracao in evento["etapas"].items():
+                chave = (operacao, etapa)
+                buckets = self._buckets.setdefault(chave, [0] * len(LIMITES_BUCKETS))
+                for i, limite in enumerate(LIMITES_BUCKETS):
+                    if duracao <= limite:
+                        buckets[i] += 1
+                self._somas[chave] += duracao
+                self._contagens[chave] += 1
+            if not evento.get("parcial"):
+                self._contadores[("chamadas", operacao)] += 1
+            if evento.get("erro"):
+                self._contadores[("erros", operacao)] += 1
+            for contador in CONTADORES:
+                self._contadores[(contador, operacao)] += evento.get(contador) or 0
+
+            # Reescrever a cada evento seria desperdício com muitos pares por segundo
+            if time.monotonic() - self._ultima_escrita >= self.intervalo_s:
+                self._escrever()
+
+    def _escrever(self):
+        linhas = [
+            "# HELP analisador_etapa_duracao_segundos Duração de cada etapa das chamadas ao modelo.",
+            "# TYPE analisador_etapa_duracao_segundos histogram",
+        ]
+        for (operacao, etapa), buckets in sorted(self._buckets.items()):
+            rotulos = f'operacao="{operacao}",etapa="{etapa}"'
+            for limite, quantidade in zip(LIMITES_BUCKETS, buckets):
+                linhas.append(f'analisador_etapa_duracao_segundos_bucket{{{rotulos},le="{limite}"}} {quantidade}')
+            linhas.append(f'analisador_etapa_duracao_segundos_bucket{{{rotulos},le="+Inf"}} {self._contagens[(operacao, etapa)]}')
+            linhas.append(f"analisador_etapa_duracao_segundos_sum{{{rotulos}}} {self._somas[(operacao, etapa)]:.6f}")
+            linhas.append(f"analisador_etapa_duracao_segundos_count{{{rotulos}}} {self._contagens[(operacao, etapa)]}")
+
+        for nome in ("chamadas", "erros") + CONTADORES:
+            linhas.append(f"# TYPE analisador_{nome}_total counter")
+            for (contador, operacao), valor in sorted(self._contadores.items()):
+                if contador == nome:
+                    linhas.append(f'analisador_{nome}_total{{operacao="{operacao}"}} {valor:g}')
+
+        temporario = self.caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.write("\n".join(linhas) + "\n")
+        os.replace(temporario, self.caminho)
+        self._ultima_escrita = time.monotonic()
+
+    def fechar(self):
+        with self._lock:
+            self._escrever()
+
+
+class Instrumentacao:
+    def __init__(self, sinks=()):
+        self.histograma = HistogramaLatencias()
+        self.sinks = [self.histograma, *sinks]
+
+    def registrar(self, operacao, etapas, **atributos):
+        evento = {"momento": time.time(), "operacao": operacao, "etapas": etapas, **atributos}
+        for sink in self.sinks:
+            try:
+                sink.receber(evento)
+            except Exception as e:
+                # Falha de um sink (ex.: disco cheio) nunca derruba a análise
+                print(f"Erro na instrumentação ({type(sink).__name__}): {e}", file=sys.stderr)
+
+    def registrar_etapa(self, operacao, etapa, duracao):
+        """Etapa medida fora da chamada (ex.: renderização na interface); não conta como nova chamada."""
+        self.registrar(operacao, {etapa: duracao}, parcial=True)
+
+    def fechar(self):
+        for sink in self.sinks:
+            sink.fechar()
+
+
+def criar_instrumentacao():
+    sinks = []
+    if os.getenv("METRICAS_LOG"):
+        sinks.append(SinkLogJson(os.getenv("METRICAS_LOG")))
+    if os.getenv("METRICAS_PROMETHEUS"):
+        sinks.append(SinkPrometheus(os.getenv("METRICAS_PROMETHEUS")))
+    return Instrumentacao(sinks)
+
+
+_padrao = None
+_lock_padrao = threading.Lock()
+
+
+def instrumentacao_padrao():
+    """Instância compartilhada pelo processo, criada conforme o .env no primeiro uso."""
+    global _padrao
+    with _lock_padrao:
+        if _padrao is None:
+            _padrao = criar_instrumentacao()
+        return _padrao
+
+
+def registrar(operacao, etapas, **atributos):
+    instrumentacao_padrao().registrar(operacao, etapas, **atributos)
+
+
+def registrar_etapa(operacao, etapa, duracao):
+    instrumentacao_padrao().registrar_etapa(operacao, etapa, duracao)
+
+
+def descrever_percentis(percentis):
+    if not percentis:
+        return "Nenhuma chamada medida ainda."
+    linhas = [f"{'operação':<12}{'etapa':<17}{'n':>6}{'p50':>10}{'p95':>10}"]
+    for (operacao, etapa), valores in percentis.items():
+        linhas.append(
+            f"{operacao:<12}{etapa:<17}{valores['n']:>6}"
+            f"{valores['p50'] * 1000:>8.0f}ms{valores['p95'] * 1000:>8.0f}ms"
+        )
+    return "\n".join(linhas)
+
+
+def descrever_totais(totais):
+    linhas = []
+    for operacao, contadores in sorted(totais.items()):
+        linhas.append(
+            f"{operacao}: {contadores['chamadas']} chamadas ({contadores['erros']} com erro), "
+            f"{contadores['tokens_entrada']} tokens de entrada (~{contadores['tokens_imagem_estimados']} de imagem), "
+            f"{contadores['tokens_saida']} de saída, {contadores['bytes_enviados'] / 1024:.0f} KB enviados, "
+            f"{contadores['novas_tentativas']} novas tentativas"
+            + (f", pico de memória por requisição ~{contadores['memoria_pico_max_bytes'] / 1024 / 1024:.1f} MB"
+               if contadores["memoria_pico_max_bytes"] else "")
+        )
+    return "\n".join(linhas)
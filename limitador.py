@@ -0,0 +1,296 @@
+"""Agendador compartilhado de requisições ao Azure OpenAI.
+
+Fica na frente do cliente OpenAI e controla:
+- taxa de requisições e de tokens por minuto (token bucket com RPM/TPM do .env);
+- número máximo de requisições simultâneas;
+- novas tentativas com backoff exponencial e jitter para 429, 5xx e falhas de conexão,
+  respeitando o cabeçalho Retry-After;
+- adaptação da taxa: cada 429 reduz pela metade a taxa efetiva dos baldes e o
+  número de requisições simultâneas (mínimo 1), que voltam a crescer aos poucos
+  a cada requisição bem-sucedida — sem LIMITE_RPM/LIMITE_TPM a concorrência é
+  o que desacelera as chamadas;
+- cancelamento: create(..., cancelamento=evento) interrompe a espera por vaga,
+  pelos baldes e pelo backoff assim que o evento é sinalizado.
+
+Configuração opcional no .env:
+    LIMITE_RPM=60
+    LIMITE_TPM=60000
+    LIMITE_CONCORRENCIA=4
+    LIMITE_TENTATIVAS=6
+"""
+import os
+import random
+import threading
+import time
+
+from analise import OperacaoCancelada, verificar_cancelamento
+
+# Estimativa de tokens por imagem e de tokens de saída usada para o balde de TPM
+TOKENS_POR_IMAGEM = 1100
+TOKENS_SAIDA_ESTIMADOS = 800
+
+BACKOFF_BASE_S = 1.0
+BACKOFF_MAXIMO_S = 60.0
+
+
+def estimar_tokens(messages):
+    total = TOKENS_SAIDA_ESTIMADOS
+    for mensagem in messages:
+        conteudo = mensagem["content"]
+        partes = conteudo if isinstance(conteudo, list) else [{"type": "text", "text": conteudo}]
+        for parte in partes:
+            if parte["type"] == "text":
+                total += len(parte["text"]) // 4
+            else:
+                total += TOKENS_POR_IMAGEM
+    return total
+
+
+def ler_retry_after(erro):
+    resposta = getattr(erro, "response", None)
+    if resposta is None:
+        return None
+    cabecalhos = resposta.headers
+    try:
+        if cabecalhos.get("retry-after-ms"):
+            return float(cabecalhos["retry-after-ms"]) / 1000
+        if cabecalhos.get("retry-after"):
+            return float(cabecalhos["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+class BaldeTokens:
+    def __init__(self, por_minuto):
+        self.capacidade = por_minuto
+        self.disponivel = float(por_minuto)
+        self.taxa_por_segundo = por_minuto / 60.0
+        self.ultimo = time.monotonic()
+
+    def espera_necessaria(self, quantidade, fator, agora):
+        """Reabastece o balde e retorna quantos segundos faltam para haver `quantidade` disponível."""
+        self.disponivel = min(self.capacidade, self.disponivel + (agora - self.ultimo) * self.taxa_por_segundo * fator)
+        self.ultimo = agora
+        quantidade = min(quantidade, self.capacidade)
+        if self.disponivel >= quantidade:
+            return 0.0
+        return (quantidade - self.disponivel) / (self.taxa_por_segundo * fator)
+
+    def consumir(self, quantidade):
+        self.disponivel -= min(quantidade, self.capacidade)
+
+
+class LimitadorRequisicoes:
+    def __init__(self, rpm=None, tpm=None, concorrencia=4, max_tentativas=6):
+        self.balde_requisicoes = BaldeTokens(rpm) if rpm else None
+        self.balde_tokens = BaldeTokens(tpm) if tpm else None
+        # LIMITE_TENTATIVAS=0 significa "sem novas tentativas": a chamada em si sempre é feita
+        self.max_tentativas = max(1, max_tentativas)
+        self.fator = 1.0
+        self.pausado_ate = 0.0
+        self._lock = threading.Lock()
+        # Tentativas e espera da última chamada feita por cada thread (lidas pela instrumentação)
+        self._local = threading.local()
+        self.concorrencia = max(1, concorrencia)
+        self._ocupadas = 0
+        self._vaga_livre = threading.Condition(self._lock)
+        self._metricas = {
+            "requisicoes": 0,
+            "novas_tentativas": 0,
+            "eventos_throttle": 0,
+            "falhas": 0,
+            "espera_fila_total_s": 0.0,
+            "espera_fila_max_s": 0.0,
+        }
+
+    def _concorrencia_efetiva(self):
+        return max(1, round(self.concorrencia * self.fator))
+
+    def _ocupar_vaga(self, cancelamento):
+        with self._vaga_livre:
+            while self._ocupadas >= self._concorrencia_efetiva():
+                verificar_cancelamento(cancelamento)
+                # Timeout curto para notar o cancelamento mesmo sem vaga liberada
+                self._vaga_livre.wait(0.5)
+            self._ocupadas += 1
+
+    def _liberar_vaga(self):
+        with self._vaga_livre:
+            self._ocupadas -= 1
+            self._vaga_livre.notify_all()
+
+    def _aguardar_vez(self, tokens, cancelamento=None):
+        while True:
+            verificar_cancelamento(cancelamento)
+            with self._lock:
+                agora = time.monotonic()
+                espera = max(0.0, self.pausado_ate - agora)
+                for balde, quantidade in ((self.balde_requisicoes, 1), (self.balde_tokens, tokens)):
+                    if balde is not None:
+                        espera = max(espera, balde.espera_necessaria(quantidade, self.fator, agora))
+                if espera == 0.0:
+                    if self.balde_requisicoes is not None:
+                        self.balde_requisicoes.consumir(1)
+                    if self.balde_tokens is not None:
+                        self.balde_tokens.consumir(tokens)
+                    return
+            _dormir(min(espera, 1.0), cancelamento)
+
+    def _registrar_throttle(self, retry_after):
+        with self._lock:
+            self._metricas["eventos_throttle"] += 1
+            self.fator = max(0.1, self.fator * 0.5)
+            if retry_after:
+                # Pausa todas as requisições até o fim do Retry-After
+                self.pausado_ate = max(self.pausado_ate, time.monotonic() + retry_after)
+
+    def _registrar_sucesso(self):
+        with self._lock:
+            self._metricas["requisicoes"] += 1
+            self.fator = min(1.0, self.fator + 0.05)
+            # A concorrência efetiva pode ter voltado a subir
+            self._vaga_livre.notify_all()
+
+    def executar(self, funcao, tokens=0, stream=False, cancelamento=None):
+        """Executa funcao() respeitando os limites; com stream=True a vaga só é liberada ao fechar o stream.
+
+        Com `cancelamento` (threading.Event), as esperas terminam com OperacaoCancelada
+        assim que o evento for sinalizado.
+        """
+        # Importado aqui: o SDK demora a carregar e, quando há chamada, o cliente já o importou
+        import openai
+
+        chamada = self._local.chamada = {"novas_tentativas": 0, "espera_fila_s": 0.0}
+        for tentativa in range(self.max_tentativas):
+            inicio = time.monotonic()
+            self._ocupar_vaga(cancelamento)
+            liberar = True
+            try:
+                self._aguardar_vez(tokens, cancelamento)
+                espera = time.monotonic() - inicio
+                chamada["espera_fila_s"] += espera
+                with self._lock:
+                    self._metricas["espera_fila_total_s"] += espera
+                    self._metricas["espera_fila_max_s"] = max(self._metricas["espera_fila_max_s"], espera)
+
+                resultado = funcao()
+                self._registrar_sucesso()
+                if stream:
+                    liberar = False
+                    return StreamLimitado(resultado, self._liberar_vaga)
+                return resultado
+            except openai.RateLimitError as e:
+                retry_after = ler_retry_after(e)
+                self._registrar_throttle(retry_after)
+                erro = e
+            except (openai.InternalServerError, openai.APIConnectionError) as e:
+                retry_after = None
+                erro = e
+            finally:
+                if liberar:
+                    self._liberar_vaga()
+
+            if tentativa == self.max_tentativas - 1:
+                break
+            with self._lock:
+                self._metricas["novas_tentativas"] += 1
+            chamada["novas_tentativas"] += 1
+            if retry_after:
+                atraso = retry_after + random.uniform(0, 0.5)
+            else:
+                atraso = random.uniform(0, min(BACKOFF_MAXIMO_S, BACKOFF_BASE_S * 2 ** tentativa))
+            _dormir(atraso, cancelamento)
+
+        with self._lock:
+            self._metricas["falhas"] += 1
+        raise erro
+
+    def ultima_chamada(self):
+        """Novas tentativas e espera na fila da última chamada feita pela thread atual."""
+        return dict(getattr(self._local, "chamada", {}))
+
+    def metricas(self):
+        with self._lock:
+            metricas = dict(self._metricas)
+            metricas["fator_taxa"] = round(self.fator, 2)
+            metricas["concorrencia_efetiva"] = self._concorrencia_efetiva()
+        return metricas
+
+    def envolver(self, client):
+        return ClienteLimitado(client, self)
+
+
+def _dormir(segundos, cancelamento):
+    if cancelamento is None:
+        time.sleep(segundos)
+    elif cancelamento.wait(segundos):
+        raise OperacaoCancelada()
+
+
+class StreamLimitado:
+    """Repassa o stream do SDK e devolve a vaga de concorrência quando ele é fechado."""
+
+    def __init__(self, stream, liberar):
+        self._stream = stream
+        self._liberar = liberar
+
+    def __iter__(self):
+        return iter(self._stream)
+
+    def close(self):
+        if self._liberar is not None:
+            self._liberar()
+            self._liberar = None
+        self._stream.close()
+
+
+class _CompletionsLimitadas:
+    def __init__(self, completions, limitador):
+        self._completions = completions
+        self._limitador = limitador
+
+    def create(self, cancelamento=None, **kwargs):
+        # `cancelamento` é do limitador e não segue para o SDK
+        return self._limitador.executar(
+            lambda: self._completions.create(**kwargs),
+            tokens=estimar_tokens(kwargs["messages"]),
+            stream=kwargs.get("stream", False),
+            cancelamento=cancelamento,
+        )
+
+
+class _ChatLimitado:
+    def __init__(self, chat, limitador):
+        self.completions = _CompletionsLimitadas(chat.completions, limitador)
+
+
+class ClienteLimitado:
+    """Cliente com a mesma interface de chat.completions.create usada em analise.py."""
+
+    def __init__(self, client, limitador):
+        self.client = client
+        self.limitador = limitador
+        self.chat = _ChatLimitado(client.chat, limitador)
+
+
+def criar_limitador():
+    def ler_int(nome, padrao=None):
+        valor = os.getenv(nome)
+        return int(valor) if valor else padrao
+
+    return LimitadorRequisicoes(
+        rpm=ler_int("LIMITE_RPM"),
+        tpm=ler_int("LIMITE_TPM"),
+        concorrencia=ler_int("LIMITE_CONCORRENCIA", 4),
+        max_tentativas=ler_int("LIMITE_TENTATIVAS", 6),
+    )
+
+
+def descrever_metricas(metricas):
+    return (
+        f"Limitador — {metricas['requisicoes']} requisições, {metricas['novas_tentativas']} novas tentativas, "
+        f"{metricas['eventos_throttle']} throttles (429), espera na fila {metricas['espera_fila_total_s']:.1f}s "
+        f"(máx {metricas['espera_fila_max_s']:.1f}s), taxa {metricas['fator_taxa']:.0%}, "
+        f"{metricas['concorrencia_efetiva']} simultâneas"
+    )
@@ -0,0 +1,233 @@
+"""Processamento em lote (sem interface) de pares caixa/nota fiscal.
+
+Uso:
+    python lote.py PASTA_OU_MANIFESTO --saida vereditos.jsonl --workers 4
+
+Numa pasta, os pares são formados pelo nome do arquivo: "<id>_caixa.<ext>" com
+"<id>_nota.<ext>". Um manifesto pode ser .jsonl (um objeto {"id", "caixa", "nota"}
+por linha) ou .csv com as colunas id,caixa,nota. Caminhos relativos no manifesto
+são resolvidos a partir da pasta do próprio manifesto.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import analise
+import estruturado
+import instrumentacao
+import verificacao_local
+from balanceador import BalanceadorEndpoints, descrever_endpoints
+from cache import abrir_cache_padrao, descrever_estatisticas
+from configuracao import criar_cliente
+from limitador import descrever_metricas
+from resultados import abrir_armazem_padrao
+
+EXTENSOES_IMAGEM = (".png", ".jpg", ".jpeg", ".bmp", ".gif")
+SUFIXO_CAIXA = "_caixa"
+SUFIXO_NOTA = "_nota"
+
+
+def listar_pares_pasta(pasta):
+    caixas = {}
+    notas = {}
+    for nome in sorted(os.listdir(pasta)):
+        base, ext = os.path.splitext(nome)
+        if ext.lower() not in EXTENSOES_IMAGEM:
+            continue
+        base_lower = base.lower()
+        if base_lower.endswith(SUFIXO_CAIXA):
+            caixas[base[:-len(SUFIXO_CAIXA)]] = os.path.join(pasta, nome)
+        elif base_lower.endswith(SUFIXO_NOTA):
+            notas[base[:-len(SUFIXO_NOTA)]] = os.path.join(pasta, nome)
+
+    pares = []
+    for id_par in sorted(caixas.keys() | notas.keys()):
+        if id_par not in caixas or id_par not in notas:
+            print(f"⚠️ Par incompleto ignorado: {id_par}", file=sys.stderr)
+            continue
+        pares.append({"id": id_par, "caixa": caixas[id_par], "nota": notas[id_par]})
+    return pares
+
+
+def listar_pares_manifesto(caminho):
+    pasta_base = os.path.dirname(os.path.abspath(caminho))
+    with open(caminho, encoding="utf-8") as f:
+        if caminho.lower().endswith(".csv"):
+            linhas = list(csv.DictReader(f))
+        else:
+            linhas = [json.loads(linha) for linha in f if linha.strip()]
+
+    pares = []
+    for i, linha in enumerate(linhas, start=1):
+        pares.append({
+            "id": linha.get("id") or str(i),
+            "caixa": os.path.join(pasta_base, linha["caixa"]),
+            "nota": os.path.join(pasta_base, linha["nota"]),
+        })
+    return pares
+
+
+def listar_pares(entrada):
+    if os.path.isdir(entrada):
+        return listar_pares_pasta(entrada)
+    return listar_pares_manifesto(entrada)
+
+
+def extrair_par(client, deployment_name, par, cache=None, modo=estruturado.MODO_TEXTO, verificar_localmente=False):
+    """Primeira etapa de processar_par: verificação local e extrações.
+
+    Retorna (registro, extracao); extracao é None quando o par já tem veredito
+    (reprovado pela verificação local ou com erro) e não precisa de cruzamento.
+    """
+    registro = {"id": par["id"], "caixa": par["caixa"], "nota": par["nota"]}
+    inicio = time.perf_counter()
+    extracao = None
+    try:
+        dicas = {}
+        if verificar_localmente:
+            verificacao = verificacao_local.verificar_par(par["caixa"], par["nota"])
+            registro["verificacao_local"] = verificacao["status"]
+            if verificacao["status"] == verificacao_local.DIVERGENTE:
+                # Números de nota claramente diferentes: reprovado sem chamar o modelo
+                registro.update(verificacao_local.veredito_divergente(verificacao))
+                registro.update(verificacao_local.campos_nota(verificacao))
+                registro["erro"] = None
+                registro["duracao_s"] = round(time.perf_counter() - inicio, 3)
+                return registro, None
+            dicas = verificacao["dicas"]
+
+        if modo == estruturado.MODO_ESTRUTURADO:
+            extracao = estruturado.extrair_par_estruturado(
+                client, deployment_name, par["caixa"], par["nota"], cache=cache, dicas=dicas
+            )
+        else:
+            extracao = analise.extrair_par(client, deployment_name, par["caixa"], par["nota"], cache=cache, dicas=dicas)
+    except Exception as e:
+        registro.update({"status": analise.ERRO, "erro": str(e)})
+    registro["duracao_s"] = round(time.perf_counter() - inicio, 3)
+    return registro, extracao
+
+
+def cruzar_par(client, deployment_name, registro, extracao, cache=None, modo=estruturado.MODO_TEXTO,
+               fallback_llm=False):
+    """Segunda etapa de processar_par: cruzamento e veredito, completando o registro."""
+    inicio = time.perf_counter()
+    try:
+        if modo == estruturado.MODO_ESTRUTURADO:
+            resultado = estruturado.cruzar_par_estruturado(
+                client, deployment_name, extracao, cache=cache, fallback_llm=fallback_llm
+            )
+        else:
+            resultado = analise.cruzar_par(client, deployment_name, extracao, cache=cache)
+        registro.update(resultado.pop("veredito"))
+        registro.update(resultado)
+        registro["erro"] = None
+    except Exception as e:
+        registro.update({"status": analise.ERRO, "erro": str(e)})
+    registro["duracao_s"] = round(registro["duracao_s"] + time.perf_counter() - inicio, 3)
+    return registro
+
+
+def processar_par(client, deployment_name, par, cache=None, modo=estruturado.MODO_TEXTO, fallback_llm=False,
+                  verificar_localmente=False):
+    registro, extracao = extrair_par(
+        client, deployment_name, par, cache=cache, modo=modo, verificar_localmente=verificar_localmente
+    )
+    if extracao is not None:
+        cruzar_par(client, deployment_name, registro, extracao, cache=cache, modo=modo, fallback_llm=fallback_llm)
+    return registro
+
+
+def processar_lote(client, deployment_name, pares, saida, workers=4, cache=None,
+                   modo=estruturado.MODO_TEXTO, fallback_llm=False, verificar_localmente=False, armazem=None):
+    """Processa os pares num pool limitado de threads, gravando um registro JSONL por par assim que termina.
+
+    Com um armazem (resultados.ArmazemResultados), cada registro também entra no histórico consultável.
+    """
+    contagem = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futuros = [
+            executor.submit(processar_par, client, deployment_name, par, cache, modo, fallback_llm, verificar_localmente)
+            for par in pares
+        ]
+        for futuro in as_completed(futuros):
+            registro = futuro.result()
+            saida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            saida.flush()
+            if armazem is not None:
+                try:
+                    armazem.registrar(registro, origem="lote", modo=modo, deployment_name=deployment_name)
+                except Exception as e:
+                    # O veredito já está no JSONL; o histórico não pode interromper o lote
+                    print(f"Erro ao gravar no histórico de conciliações: {e}", file=sys.stderr)
+            contagem[registro["status"]] = contagem.get(registro["status"], 0) + 1
+    return contagem
+
+
+def imprimir_resumo_execucao(client, cache=None):
+    """Fim de execução sem interface (lote, remessa, vigia): cache, limitador, endpoints e latências no stderr."""
+    if cache is not None:
+        print(descrever_estatisticas(cache.estatisticas()), file=sys.stderr)
+    if hasattr(client, "limitador"):
+        print(descrever_metricas(client.limitador.metricas()), file=sys.stderr)
+        if isinstance(client.client, BalanceadorEndpoints):
+            print(descrever_endpoints(client.client.metricas()), file=sys.stderr)
+    medicoes = instrumentacao.instrumentacao_padrao()
+    print(instrumentacao.descrever_percentis(medicoes.histograma.percentis()), file=sys.stderr)
+    print(instrumentacao.descrever_totais(medicoes.histograma.totais()), file=sys.stderr)
+    medicoes.fechar()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cruzamento em lote de imagens de caixa e nota fiscal.")
+    parser.add_argument("entrada", help="Pasta com pares <id>_caixa/<id>_nota ou manifesto .jsonl/.csv")
+    parser.add_argument("--saida", default="-", help="Arquivo JSONL de saída (padrão: stdout)")
+    parser.add_argument("--workers", type=int, default=4, help="Número máximo de pares em paralelo")
+    parser.add_argument("--sem-cache", action="store_true", help="Ignora o cache de respostas")
+    parser.add_argument("--modo", choices=[estruturado.MODO_TEXTO, estruturado.MODO_ESTRUTURADO],
+                        default=estruturado.modo_extracao(),
+                        help="texto: cruzamento via LLM; estruturado: extração em JSON e cruzamento local")
+    parser.add_argument("--fallback-llm", action=argparse.BooleanOptionalAction, default=estruturado.fallback_llm_ativado(),
+                        help="No modo estruturado, envia ao LLM os pares com correspondência ambígua "
+                             "(padrão: %(default)s, de CRUZAMENTO_LLM_FALLBACK no .env)")
+    parser.add_argument("--verificacao-local", action=argparse.BooleanOptionalAction,
+                        default=verificacao_local.verificacao_ativada(),
+                        help="Lê código de barras/OCR antes e reprova sem chamar o modelo se as notas divergirem "
+                             "(padrão: %(default)s, de VERIFICACAO_LOCAL no .env)")
+    parser.add_argument("--sem-historico", action="store_true",
+                        help="Não grava os vereditos no histórico de conciliações (resultados.py)")
+    args = parser.parse_args(argv)
+
+    pares = listar_pares(args.entrada)
+    if not pares:
+        print("Nenhum par caixa/nota encontrado.", file=sys.stderr)
+        return 1
+
+    client, deployment_name = criar_cliente()
+    cache = None if args.sem_cache else abrir_cache_padrao()
+    armazem = None if args.sem_historico else abrir_armazem_padrao()
+
+    saida = sys.stdout if args.saida == "-" else open(args.saida, "a", encoding="utf-8")
+    try:
+        contagem = processar_lote(
+            client, deployment_name, pares, saida, workers=args.workers, cache=cache,
+            modo=args.modo, fallback_llm=args.fallback_llm, verificar_localmente=args.verificacao_local, armazem=armazem
+        )
+    finally:
+        if saida is not sys.stdout:
+            saida.close()
+        if armazem is not None:
+            armazem.fechar()
+
+    resumo = ", ".join(f"{status}: {qtd}" for status, qtd in sorted(contagem.items()))
+    print(f"✓ {len(pares)} pares processados ({resumo})", file=sys.stderr)
+    imprimir_resumo_execucao(client, cache)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,558 @@
+"""Conciliação de remessas inteiras: várias caixas e várias notas fiscais de uma vez.
+
+No fluxo por pares (lote.py) cada caixa é conferida contra uma única nota: uma
+remessa de 20 caixas da mesma nota extrai a nota 20 vezes, e a etiqueta de um
+palete que cobre várias notas não tem par possível. Aqui cada documento é
+extraído uma única vez (em JSON, como no modo estruturado) e o cruzamento é local:
+
+1. todas as caixas e notas da remessa são extraídas em paralelo;
+2. as notas entram num índice por número (e por chave de acesso); páginas de
+   uma mesma nota têm os itens somados;
+3. os itens de cada caixa vão para a nota que a etiqueta indica para o item, ou
+   para a única nota que a caixa cita; quando a caixa cita várias notas sem
+   dizer de qual é cada item, a quantidade é distribuída entre as notas que têm
+   aquele produto, até completar o que cada uma ainda espera;
+4. as quantidades de todas as caixas são somadas por nota e comparadas com os
+   itens da nota (estruturado.comparar_localmente), dando um veredito por nota
+   e um da remessa.
+
+O número de chamadas ao modelo é o número de documentos (mais um cruzamento via
+LLM por nota ambígua, se o fallback estiver ativado), e não caixas × notas.
+
+Uso:
+    python remessa.py PASTA_OU_MANIFESTO --saida remessas.jsonl --workers 8
+
+Numa pasta, as imagens com "caixa" ou "etiqueta" no nome são caixas e as com
+"nota" são notas fiscais; se a pasta só tiver subpastas, cada subpasta é uma
+remessa. O manifesto .jsonl tem um objeto {"id", "caixas": [...], "notas": [...]}
+por linha, com caminhos relativos à pasta do manifesto.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import analise
+import estruturado
+import imagens
+import lote
+import verificacao_local
+from cache import abrir_cache_padrao
+from configuracao import criar_cliente
+from resultados import abrir_armazem_padrao
+
+MARCADORES_CAIXA = ("caixa", "etiqueta")
+MARCADORES_NOTA = ("nota",)
+
+# A etiqueta de uma caixa/palete pode citar várias notas e dizer a nota de cada item
+ESQUEMA_CAIXA_REMESSA = {
+    "type": "object",
+    "properties": {
+        "notas": {
+            "type": "array",
+            "description": "Notas fiscais citadas na etiqueta",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "numero_nota": {"type": ["string", "null"], "description": "Número da NF-e, só dígitos"},
+                    "chave_acesso": {"type": ["string", "null"], "description": "Chave de acesso com 44 dígitos"},
+                },
+                "required": ["numero_nota", "chave_acesso"],
+                "additionalProperties": False,
+            },
+        },
+        "cnpj": {"type": ["string", "null"], "description": "CNPJ do remetente"},
+        "itens": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "nome": {"type": "string"},
+                    "quantidade": {"type": ["number", "null"]},
+                    "numero_nota": {"type": ["string", "null"], "description": "Nota do item, se a etiqueta indicar"},
+                },
+                "required": ["nome", "quantidade", "numero_nota"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["notas", "cnpj", "itens"],
+    "additionalProperties": False,
+}
+
+RESPONSE_FORMAT_CAIXA = {
+    "type": "json_schema",
+    "json_schema": {"name": "caixa_remessa", "strict": True, "schema": ESQUEMA_CAIXA_REMESSA},
+}
+
+PROMPT_CAIXA_REMESSA = "Extraia da etiqueta/imagem desta caixa ou palete todas as notas fiscais citadas (número e chave de acesso), o CNPJ e os produtos com suas quantidades. Se a etiqueta indicar a nota de cada produto, preencha numero_nota no item; senão use null. Use null para campos que não estão visíveis."
+
+
+def _classificar_imagem(nome):
+    base, ext = os.path.splitext(nome.lower())
+    if ext not in lote.EXTENSOES_IMAGEM:
+        return None
+    if any(marcador in base for marcador in MARCADORES_CAIXA):
+        return "caixas"
+    if any(marcador in base for marcador in MARCADORES_NOTA):
+        return "notas"
+    return None
+
+
+def listar_remessa_pasta(pasta, id_remessa=None):
+    remessa = {"id": id_remessa or os.path.basename(os.path.normpath(pasta)), "caixas": [], "notas": []}
+    for nome in sorted(os.listdir(pasta)):
+        tipo = _classificar_imagem(nome)
+        if tipo:
+            remessa[tipo].append(os.path.join(pasta, nome))
+    return remessa
+
+
+def listar_remessas_pasta(pasta):
+    remessa = listar_remessa_pasta(pasta)
+    if remessa["caixas"] or remessa["notas"]:
+        return [remessa]
+    # Sem imagens na raiz: cada subpasta é uma remessa
+    remessas = []
+    for nome in sorted(os.listdir(pasta)):
+        caminho = os.path.join(pasta, nome)
+        if os.path.isdir(caminho):
+            remessa = listar_remessa_pasta(caminho, id_remessa=nome)
+            if remessa["caixas"] or remessa["notas"]:
+                remessas.append(remessa)
+    return remessas
+
+
+def listar_remessas_manifesto(caminho):
+    pasta_base = os.path.dirname(os.path.abspath(caminho))
+    remessas = []
+    with open(caminho, encoding="utf-8") as f:
+        for i, linha in enumerate((linha for linha in f if linha.strip()), start=1):
+            dados = json.loads(linha)
+            remessas.append({
+                "id": dados.get("id") or str(i),
+                "caixas": [os.path.join(pasta_base, c) for c in dados.get("caixas", [])],
+                "notas": [os.path.join(pasta_base, n) for n in dados.get("notas", [])],
+            })
+    return remessas
+
+
+def listar_remessas(entrada):
+    if os.path.isdir(entrada):
+        return listar_remessas_pasta(entrada)
+    return listar_remessas_manifesto(entrada)
+
+
+def extrair_caixa(client, deployment_name, caminho_imagem, estatisticas=None, cache=None):
+    descricao = f"extração da caixa ({os.path.basename(caminho_imagem)})"
+    validar = lambda resposta: estruturado.ler_resposta_json(resposta, descricao)
+    resposta = analise.extrair_informacoes(
+        client, deployment_name, caminho_imagem, PROMPT_CAIXA_REMESSA,
+        perfil=imagens.carregar_perfil("caixa"), estatisticas=estatisticas, cache=cache,
+        response_format=RESPONSE_FORMAT_CAIXA, operacao="caixa", validar=validar
+    )
+    return validar(resposta)
+
+
+def extrair_documento(client, deployment_name, caminho_imagem, tipo, cache=None):
+    """Extrai uma caixa ou nota; retorna {"caminho", "tipo", "dados", "estatisticas"}."""
+    estatisticas = {}
+    if tipo == "caixa":
+        dados = extrair_caixa(client, deployment_name, caminho_imagem, estatisticas=estatisticas, cache=cache)
+    else:
+        # Mesmo prompt do modo estruturado: aproveita o cache das notas já conferidas no lote
+        dados = estruturado.extrair_dados(
+            client, deployment_name, caminho_imagem, "nota", estatisticas=estatisticas, cache=cache
+        )
+    return {"caminho": caminho_imagem, "tipo": tipo, "dados": dados, "estatisticas": estatisticas}
+
+
+def numero_documento(dados):
+    """Número normalizado da nota; sem o número, lido da chave de acesso."""
+    numero = estruturado.normalizar_numero(dados.get("numero_nota"))
+    if numero:
+        return numero
+    chave = estruturado.normalizar_numero(dados.get("chave_acesso"))
+    if chave and len(chave) == 44 and verificacao_local.chave_valida(chave):
+        return verificacao_local.dados_da_chave(chave)["numero_nota"]
+    return None
+
+
+def indexar_notas(documentos_nota):
+    """Índice {número: nota} e {chave de acesso: número}; também as notas sem número legível.
+
+    Várias imagens com o mesmo número são páginas da mesma nota e têm os itens
+    somados; uma imagem com exatamente os mesmos itens de uma página já
+    indexada é tratada como foto repetida e ignorada.
+    """
+    indice = {}
+    chaves = {}
+    sem_numero = []
+    for documento in documentos_nota:
+        dados = documento["dados"]
+        numero = numero_documento(dados)
+        if not numero:
+            sem_numero.append(documento["caminho"])
+            continue
+        chave = estruturado.normalizar_numero(dados.get("chave_acesso"))
+        if chave:
+            chaves[chave] = numero
+
+        nota = indice.get(numero)
+        if nota is None:
+            indice[numero] = {
+                "numero_nota": numero,
+                "chave_acesso": chave,
+                "cnpj": dados.get("cnpj"),
+                "paginas": [documento["caminho"]],
+                "totais_paginas": [estruturado.somar_por_nome(dados.get("itens"))],
+                "repetidas": [],
+                "itens": list(dados.get("itens") or []),
+            }
+            continue
+        totais = estruturado.somar_por_nome(dados.get("itens"))
+        if totais in nota["totais_paginas"]:
+            nota["repetidas"].append(documento["caminho"])
+            continue
+        nota["paginas"].append(documento["caminho"])
+        nota["totais_paginas"].append(totais)
+        nota["itens"].extend(dados.get("itens") or [])
+        nota["chave_acesso"] = nota["chave_acesso"] or chave
+        nota["cnpj"] = nota["cnpj"] or dados.get("cnpj")
+    return indice, chaves, sem_numero
+
+
+def notas_citadas(dados_caixa, chaves):
+    """Números (normalizados e sem repetição) das notas citadas na etiqueta da caixa."""
+    numeros = []
+    for referencia in dados_caixa.get("notas") or []:
+        chave = estruturado.normalizar_numero(referencia.get("chave_acesso"))
+        numero = chaves.get(chave) if chave else None
+        numero = numero or numero_documento(referencia)
+        if numero and numero not in numeros:
+            numeros.append(numero)
+    return numeros
+
+
+class AlocacaoItens:
+    """Distribui os itens das caixas entre as notas do índice, acumulando o que cada nota recebeu."""
+
+    def __init__(self, indice):
+        self.indice = indice
+        self.esperado = {numero: estruturado.somar_por_nome(nota["itens"])[0] for numero, nota in indice.items()}
+        self.itens = {numero: [] for numero in indice}
+        self.caixas = {numero: [] for numero in indice}
+        self.sem_nota = []
+        self.notas_ausentes = {}
+
+    def _produto_da_nota(self, numero, nome):
+        """Chave do produto da nota que corresponde ao nome, com a similaridade."""
+        return estruturado.melhor_correspondencia(estruturado.normalizar_nome(nome), self.esperado[numero])
+
+    def _restante(self, numero, produto):
+        esperado = self.esperado[numero].get(produto)
+        if esperado is None:
+            return None
+        recebido = sum(
+            item["quantidade"] or 0 for item in self.itens[numero]
+            if self._produto_da_nota(numero, item["nome"])[0] == produto
+        )
+        return max(0, esperado - recebido)
+
+    def nota_ausente(self, numero, caminho_caixa):
+        caixas = self.notas_ausentes.setdefault(numero, [])
+        if caminho_caixa not in caixas:
+            caixas.append(caminho_caixa)
+
+    def atribuir(self, numero, item, quantidade, caminho_caixa):
+        self.itens[numero].append({"nome": item["nome"], "quantidade": quantidade, "caixa": caminho_caixa})
+        if caminho_caixa not in self.caixas[numero]:
+            self.caixas[numero].append(caminho_caixa)
+
+    def atribuir_direto(self, item, citadas, caminho_caixa):
+        """Primeira passada: item com nota indicada, ou caixa que cita uma só nota. False se não deu."""
+        numero = estruturado.normalizar_numero(item.get("numero_nota"))
+        if not numero and len(citadas) == 1:
+            numero = citadas[0]
+        if not numero:
+            return False
+        if numero in self.indice:
+            self.atribuir(numero, item, item.get("quantidade"), caminho_caixa)
+        else:
+            self.nota_ausente(numero, caminho_caixa)
+        return True
+
+    def distribuir(self, item, citadas, caminho_caixa):
+        """Segunda passada: caixa com várias notas (ou nenhuma) sem a nota do item.
+
+        A quantidade vai para as notas que têm o produto, completando primeiro o
+        que cada uma ainda espera; o excedente fica na de melhor correspondência
+        (e aparece como divergência na conferência dela).
+        """
+        candidatas = [numero for numero in (citadas or self.indice) if numero in self.indice]
+        correspondencias = []
+        for numero in candidatas:
+            produto, razao = self._produto_da_nota(numero, item["nome"])
+            if produto is not None and razao >= estruturado.SIMILARIDADE_AMBIGUA:
+                correspondencias.append((razao, numero, produto))
+        if not correspondencias:
+            self.sem_nota.append({"caixa": caminho_caixa, "nome": item["nome"], "quantidade": item.get("quantidade")})
+            return
+        correspondencias.sort(key=lambda c: -c[0])
+
+        quantidade = item.get("quantidade")
+        if quantidade is None:
+            self.atribuir(correspondencias[0][1], item, None, caminho_caixa)
+            return
+        for _, numero, produto in correspondencias:
+            restante = self._restante(numero, produto)
+            parte = quantidade if restante is None else min(quantidade, restante)
+            if parte > 0:
+                self.atribuir(numero, item, parte, caminho_caixa)
+                quantidade -= parte
+            if quantidade <= 0:
+                return
+        self.atribuir(correspondencias[0][1], item, quantidade, caminho_caixa)
+
+
+def alocar_itens(documentos_caixa, indice, chaves):
+    """Atribui os itens de todas as caixas às notas; retorna a AlocacaoItens e as caixas sem nota."""
+    alocacao = AlocacaoItens(indice)
+    pendentes = []
+    caixas_sem_nota = []
+    for documento in documentos_caixa:
+        dados = documento["dados"]
+        citadas = notas_citadas(dados, chaves)
+        if not citadas and not any(estruturado.normalizar_numero(i.get("numero_nota")) for i in dados.get("itens") or []):
+            caixas_sem_nota.append(documento["caminho"])
+        for numero in citadas:
+            if numero not in indice:
+                alocacao.nota_ausente(numero, documento["caminho"])
+        for item in dados.get("itens") or []:
+            if not alocacao.atribuir_direto(item, citadas, documento["caminho"]):
+                pendentes.append((item, citadas, documento["caminho"]))
+
+    # Os itens sem nota definida só são distribuídos depois, quando já se sabe
+    # o que as atribuições diretas deixaram faltando em cada nota
+    for item, citadas, caminho_caixa in pendentes:
+        alocacao.distribuir(item, citadas, caminho_caixa)
+    return alocacao, caixas_sem_nota
+
+
+def conferir_nota(client, deployment_name, nota, itens, caixas, cache=None, fallback_llm=False):
+    """Veredito de uma nota contra a soma dos itens de todas as caixas atribuídos a ela."""
+    dados_nota = {
+        "numero_nota": nota["numero_nota"], "chave_acesso": nota["chave_acesso"],
+        "cnpj": nota["cnpj"], "itens": nota["itens"],
+    }
+    dados_caixas = {
+        "numero_nota": nota["numero_nota"], "chave_acesso": None, "cnpj": None,
+        "itens": [{"nome": item["nome"], "quantidade": item["quantidade"]} for item in itens],
+    }
+    resultado = {"caixas": caixas, "paginas": nota["paginas"], "informacoes_caixas": dados_caixas,
+                 "informacoes_nota": dados_nota, "estatisticas_cruzamento": {}}
+    if not caixas:
+        resultado.update({
+            "status": analise.REPROVADO, "score": 0, "produtos_match": False, "nota_match": False,
+            "motivos": ["Nenhuma caixa da remessa corresponde a esta nota"], "ambiguo": False, "cruzamento": None,
+        })
+        return resultado
+
+    veredito, relatorio = estruturado.comparar_localmente(dados_caixas, dados_nota)
+    if veredito["ambiguo"] and fallback_llm:
+        relatorio = analise.cruzar_informacoes(
+            client, deployment_name, estruturado.formatar_dados(dados_caixas), estruturado.formatar_dados(dados_nota),
+            cache=cache, estatisticas=resultado["estatisticas_cruzamento"]
+        )
+        veredito = analise.interpretar_veredito(relatorio)
+        veredito["cruzamento_llm"] = True
+    resultado.update(veredito)
+    resultado["cruzamento"] = relatorio
+    return resultado
+
+
+def veredito_remessa(notas, alocacao, caixas_sem_nota, notas_sem_numero):
+    """Veredito da remessa: reprovada se alguma nota ou item não fecha; manual se algo ficou ambíguo."""
+    motivos = [] if notas else ["Nenhuma nota fiscal legível na remessa"]
+    for numero, nota in notas.items():
+        if nota["status"] != analise.APROVADO:
+            motivos += [f"Nota {numero}: {motivo}" for motivo in nota["motivos"]] or [f"Nota {numero}: {nota['status']}"]
+    for numero, caixas in alocacao.notas_ausentes.items():
+        motivos.append(f"Nota {numero} citada em {len(caixas)} caixa(s) mas ausente da remessa")
+    if caixas_sem_nota:
+        motivos.append(f"{len(caixas_sem_nota)} caixa(s) sem número de nota legível")
+    if alocacao.sem_nota:
+        motivos.append(f"{len(alocacao.sem_nota)} item(ns) de caixa sem nota correspondente")
+    if notas_sem_numero:
+        motivos.append(f"{len(notas_sem_numero)} nota(s) sem número legível")
+
+    reprovada = (
+        any(nota["status"] == analise.REPROVADO for nota in notas.values())
+        or alocacao.notas_ausentes or alocacao.sem_nota or notas_sem_numero or not notas
+    )
+    if reprovada:
+        status = analise.REPROVADO
+    elif caixas_sem_nota or any(nota["status"] != analise.APROVADO for nota in notas.values()):
+        status = analise.MANUAL
+    else:
+        status = analise.APROVADO
+    score = min((nota["score"] or 0 for nota in notas.values()), default=0)
+    return {"status": status, "score": score, "motivos": motivos}
+
+
+def conciliar_remessa(client, deployment_name, remessa, documentos, cache=None, fallback_llm=False):
+    """Cruza os documentos já extraídos de uma remessa; retorna o registro da remessa.
+
+    documentos é a lista de (caminho, tipo, futuro) com as extrações de
+    extrair_documento, na ordem de remessa["caixas"] + remessa["notas"].
+    """
+    registro = {"id": remessa["id"], "caixas": remessa["caixas"], "notas": remessa["notas"]}
+    inicio = time.perf_counter()
+    extraidos = {"caixa": [], "nota": []}
+    erros = {}
+    for caminho, tipo, futuro in documentos:
+        try:
+            extraidos[tipo].append(futuro.result())
+        except Exception as e:
+            erros[caminho] = str(e)
+    registro["documentos"] = {d["caminho"]: d["dados"] for d in extraidos["caixa"] + extraidos["nota"]}
+    registro["chamadas_extracao"] = sum(
+        1 for d in extraidos["caixa"] + extraidos["nota"] if not d["estatisticas"].get("cache")
+    )
+    registro["imagens"] = {d["caminho"]: d["estatisticas"] for d in extraidos["caixa"] + extraidos["nota"]}
+
+    try:
+        indice, chaves, notas_sem_numero = indexar_notas(extraidos["nota"])
+        alocacao, caixas_sem_nota = alocar_itens(extraidos["caixa"], indice, chaves)
+        notas = {
+            numero: conferir_nota(
+                client, deployment_name, nota, alocacao.itens[numero], alocacao.caixas[numero],
+                cache=cache, fallback_llm=fallback_llm
+            )
+            for numero, nota in indice.items()
+        }
+        registro.update(veredito_remessa(notas, alocacao, caixas_sem_nota, notas_sem_numero))
+        registro.update({
+            "notas_conferidas": notas,
+            "notas_ausentes": alocacao.notas_ausentes,
+            "notas_sem_numero": notas_sem_numero,
+            "notas_repetidas": [caminho for nota in indice.values() for caminho in nota["repetidas"]],
+            "caixas_sem_nota": caixas_sem_nota,
+            "itens_sem_nota": alocacao.sem_nota,
+            "chamadas_cruzamento": sum(1 for nota in notas.values() if nota.get("cruzamento_llm")),
+            "erro": None,
+        })
+        if erros:
+            # Sem todos os documentos o veredito não é confiável (faltariam notas ou caixas)
+            registro.update({"status": analise.ERRO, "erro": f"{len(erros)} documento(s) com erro na extração"})
+    except Exception as e:
+        registro.update({"status": analise.ERRO, "erro": str(e)})
+    registro["erros_extracao"] = erros
+    registro["duracao_s"] = round(time.perf_counter() - inicio, 3)
+    return registro
+
+
+def registros_por_nota(registro):
+    """Um registro no formato do lote por nota conferida, para o histórico (resultados.py)."""
+    for numero, nota in (registro.get("notas_conferidas") or {}).items():
+        yield {
+            "id": f"{registro['id']}/{numero}",
+            "caixa": nota["caixas"][0] if len(nota["caixas"]) == 1 else None,
+            "nota": nota["paginas"][0],
+            "status": nota["status"],
+            "score": nota["score"],
+            "produtos_match": nota["produtos_match"],
+            "nota_match": nota["nota_match"],
+            "motivos": nota["motivos"],
+            "informacoes_caixa": nota["informacoes_caixas"],
+            "informacoes_nota": nota["informacoes_nota"],
+            "cruzamento": nota["cruzamento"],
+            "estatisticas_cruzamento": nota["estatisticas_cruzamento"],
+            "erro": None,
+        }
+
+
+def processar_remessas(client, deployment_name, remessas, saida, workers=8, cache=None, fallback_llm=False,
+                       armazem=None):
+    """Extrai todos os documentos num pool de threads e grava um registro JSONL por remessa, na ordem.
+
+    As extrações de todas as remessas entram no pool de uma vez, para que
+    remessas pequenas não deixem o pool ocioso; cada remessa é cruzada assim
+    que os documentos dela ficam prontos.
+    """
+    contagem = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pendentes = [
+            (remessa, [
+                (caminho, tipo, executor.submit(extrair_documento, client, deployment_name, caminho, tipo, cache))
+                for tipo, caminhos in (("caixa", remessa["caixas"]), ("nota", remessa["notas"]))
+                for caminho in caminhos
+            ])
+            for remessa in remessas
+        ]
+        for remessa, documentos in pendentes:
+            registro = conciliar_remessa(
+                client, deployment_name, remessa, documentos, cache=cache, fallback_llm=fallback_llm
+            )
+            saida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            saida.flush()
+            if armazem is not None:
+                for registro_nota in registros_por_nota(registro):
+                    try:
+                        armazem.registrar(
+                            registro_nota, origem="remessa", modo=estruturado.MODO_ESTRUTURADO,
+                            deployment_name=deployment_name
+                        )
+                    except Exception as e:
+                        # O veredito já está no JSONL; o histórico não pode interromper as remessas
+                        print(f"Erro ao gravar no histórico de conciliações: {e}", file=sys.stderr)
+            contagem[registro["status"]] = contagem.get(registro["status"], 0) + 1
+    return contagem
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Conciliação de remessas com várias caixas e várias notas fiscais.")
+    parser.add_argument("entrada", help="Pasta da remessa (ou com uma subpasta por remessa) ou manifesto .jsonl")
+    parser.add_argument("--saida", default="-", help="Arquivo JSONL de saída (padrão: stdout)")
+    parser.add_argument("--workers", type=int, default=8, help="Número máximo de documentos extraídos em paralelo")
+    parser.add_argument("--sem-cache", action="store_true", help="Ignora o cache de respostas")
+    parser.add_argument("--fallback-llm", action=argparse.BooleanOptionalAction, default=estruturado.fallback_llm_ativado(),
+                        help="Envia ao LLM as notas com correspondência ambígua "
+                             "(padrão: %(default)s, de CRUZAMENTO_LLM_FALLBACK no .env)")
+    parser.add_argument("--sem-historico", action="store_true",
+                        help="Não grava os vereditos das notas no histórico de conciliações (resultados.py)")
+    args = parser.parse_args(argv)
+
+    remessas = listar_remessas(args.entrada)
+    if not remessas:
+        print("Nenhuma remessa com imagens de caixa/nota encontrada.", file=sys.stderr)
+        return 1
+
+    client, deployment_name = criar_cliente()
+    cache = None if args.sem_cache else abrir_cache_padrao()
+    armazem = None if args.sem_historico else abrir_armazem_padrao()
+
+    saida = sys.stdout if args.saida == "-" else open(args.saida, "a", encoding="utf-8")
+    try:
+        contagem = processar_remessas(
+            client, deployment_name, remessas, saida, workers=args.workers, cache=cache,
+            fallback_llm=args.fallback_llm, armazem=armazem
+        )
+    finally:
+        if saida is not sys.stdout:
+            saida.close()
+        if armazem is not None:
+            armazem.fechar()
+
+    resumo = ", ".join(f"{status}: {qtd}" for status, qtd in sorted(contagem.items()))
+    documentos = sum(len(r["caixas"]) + len(r["notas"]) for r in remessas)
+    print(f"✓ {len(remessas)} remessas processadas, {documentos} documentos extraídos uma vez cada ({resumo})",
+          file=sys.stderr)
+    lote.imprimir_resumo_execucao(client, cache)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,376 @@
+"""Histórico persistente (SQLite) das conciliações caixa x nota fiscal.
+
+Cada conciliação concluída (pela interface ou pelo lote) vira uma linha com as
+extrações, o texto do cruzamento, o veredito (score, produtos_match, nota_match,
+status e motivos), a duração e os tokens gastos. As consultas usam índices por
+número da nota, CNPJ, data e hash das imagens, e o histórico pode ser exportado
+em CSV ou Parquet (este último precisa do pyarrow: pip install pyarrow).
+
+Uso:
+    python resultados.py buscar --nota 12345
+    python resultados.py buscar --imagem Nota01.png --desde 2026-10-01
+    python resultados.py exportar historico.csv --status REPROVADO
+    python resultados.py exportar historico.parquet --desde 2026-10-01 --ate 2026-10-31
+
+Configuração opcional no .env:
+    RESULTADOS_CAMINHO=dados/resultados.sqlite3
+    RESULTADOS_DESATIVADO=1
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+import analise
+import verificacao_local
+from cache import hash_arquivo
+
+CAMINHO_PADRAO = os.path.join("dados", "resultados.sqlite3")
+
+# Linhas lidas do SQLite por vez na exportação, para não carregar o histórico inteiro na memória
+LOTE_EXPORTACAO = 5000
+
+COLUNAS = (
+    "id", "criado_em", "origem", "id_par", "modo", "deployment",
+    "caminho_caixa", "caminho_nota", "hash_caixa", "hash_nota",
+    "numero_nota", "cnpj", "chave_acesso", "data_emissao",
+    "status", "score", "produtos_match", "nota_match", "motivos",
+    "informacoes_caixa", "informacoes_nota", "cruzamento",
+    "duracao_s", "tokens_entrada", "tokens_saida", "erro",
+)
+
+PADRAO_CNPJ = re.compile(r"\b(\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2})\b")
+PADRAO_DATA = re.compile(r"\b(\d{2})/(\d{2})/(\d{4})\b")
+
+
+def _como_texto(informacoes):
+    if informacoes is None or isinstance(informacoes, str):
+        return informacoes
+    return json.dumps(informacoes, ensure_ascii=False)
+
+
+def _hash_ou_nada(caminho):
+    try:
+        return hash_arquivo(caminho)
+    except OSError:
+        return None
+
+
+def _ler_campos_texto(texto):
+    campos = {}
+    for candidato in verificacao_local.PADRAO_CHAVE.findall(texto):
+        chave = re.sub(r"\D", "", candidato)
+        if verificacao_local.chave_valida(chave):
+            campos.update(verificacao_local.dados_da_chave(chave))
+            del campos["serie"]
+            break
+    if not campos.get("numero_nota"):
+        numero = verificacao_local.ler_numero_nota(texto)
+        if numero:
+            campos["numero_nota"] = numero
+    if not campos.get("cnpj"):
+        encontrado = PADRAO_CNPJ.search(texto)
+        if encontrado:
+            campos["cnpj"] = re.sub(r"\D", "", encontrado.group(1))
+    encontrado = PADRAO_DATA.search(texto)
+    if encontrado:
+        dia, mes, ano = encontrado.groups()
+        campos["data_emissao"] = f"{ano}-{mes}-{dia}"
+    return campos
+
+
+def campos_indexados(registro):
+    """Número da nota, CNPJ, chave de acesso e data de emissão de uma conciliação.
+
+    Usa, nesta ordem: valores já informados no registro (ex.: leitura local),
+    os dados estruturados da nota/caixa e, no modo texto, expressões regulares
+    sobre o texto extraído pelo modelo.
+    """
+    campos = {"numero_nota": None, "cnpj": None, "chave_acesso": None, "data_emissao": None}
+    for origem in (registro, registro.get("informacoes_nota"), registro.get("informacoes_caixa")):
+        if isinstance(origem, str):
+            origem = _ler_campos_texto(origem)
+        if not isinstance(origem, dict):
+            continue
+        for campo in campos:
+            if not campos[campo] and origem.get(campo):
+                campos[campo] = str(origem[campo])
+
+    # Só dígitos, para que "12.345" e "000012345" caiam no mesmo índice
+    for campo in ("cnpj", "chave_acesso"):
+        if campos[campo]:
+            campos[campo] = re.sub(r"\D", "", campos[campo]) or None
+    if campos["numero_nota"]:
+        campos["numero_nota"] = verificacao_local.normalizar_numero(campos["numero_nota"])
+    return campos
+
+
+def _somar_tokens(registro):
+    entrada = saida = 0
+    for chave in ("imagem_caixa", "imagem_nota", "estatisticas_cruzamento"):
+        estatisticas = registro.get(chave) or {}
+        entrada += estatisticas.get("tokens_entrada", 0)
+        saida += estatisticas.get("tokens_saida", 0)
+    return entrada, saida
+
+
+def _como_inteiro(valor):
+    return None if valor is None else int(bool(valor))
+
+
+class ArmazemResultados:
+    def __init__(self, caminho=CAMINHO_PADRAO):
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._conexao.row_factory = sqlite3.Row
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute(
+            """CREATE TABLE IF NOT EXISTS reconciliacoes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                criado_em TEXT NOT NULL,
+                origem TEXT NOT NULL,
+                id_par TEXT,
+                modo TEXT,
+                deployment TEXT,
+                caminho_caixa TEXT,
+                caminho_nota TEXT,
+                hash_caixa TEXT,
+                hash_nota TEXT,
+                numero_nota TEXT,
+                cnpj TEXT,
+                chave_acesso TEXT,
+                data_emissao TEXT,
+                status TEXT NOT NULL,
+                score INTEGER,
+                produtos_match INTEGER,
+                nota_match INTEGER,
+                motivos TEXT,
+                informacoes_caixa TEXT,
+                informacoes_nota TEXT,
+                cruzamento TEXT,
+                duracao_s REAL,
+                tokens_entrada INTEGER,
+                tokens_saida INTEGER,
+                erro TEXT
+            )"""
+        )
+        for coluna in ("numero_nota", "cnpj", "criado_em", "data_emissao", "hash_caixa", "hash_nota"):
+            self._conexao.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_reconciliacoes_{coluna} ON reconciliacoes ({coluna})"
+            )
+        self._conexao.commit()
+
+    def registrar(self, registro, origem="lote", modo=None, deployment_name=None):
+        """Grava uma conciliação no formato dos registros de lote.processar_par; retorna o id."""
+        campos = campos_indexados(registro)
+        tokens_entrada, tokens_saida = _somar_tokens(registro)
+        valores = {
+            "criado_em": datetime.now().isoformat(sep=" ", timespec="seconds"),
+            "origem": origem,
+            "id_par": registro.get("id"),
+            "modo": modo,
+            "deployment": deployment_name,
+            "caminho_caixa": registro.get("caixa"),
+            "caminho_nota": registro.get("nota"),
+            "hash_caixa": _hash_ou_nada(registro["caixa"]) if registro.get("caixa") else None,
+            "hash_nota": _hash_ou_nada(registro["nota"]) if registro.get("nota") else None,
+            **campos,
+            "status": registro.get("status") or analise.ERRO,
+            "score": registro.get("score"),
+            "produtos_match": _como_inteiro(registro.get("produtos_match")),
+            "nota_match": _como_inteiro(registro.get("nota_match")),
+            "motivos": json.dumps(registro.get("motivos") or [], ensure_ascii=False),
+            "informacoes_caixa": _como_texto(registro.get("informacoes_caixa")),
+            "informacoes_nota": _como_texto(registro.get("informacoes_nota")),
+            "cruzamento": registro.get("cruzamento"),
+            "duracao_s": registro.get("duracao_s"),
+            "tokens_entrada": tokens_entrada,
+            "tokens_saida": tokens_saida,
+            "erro": registro.get("erro"),
+        }
+        nomes = ", ".join(valores)
+        marcadores = ", ".join("?" for _ in valores)
+        with self._lock:
+            cursor = self._conexao.execute(
+                f"INSERT INTO reconciliacoes ({nomes}) VALUES ({marcadores})", tuple(valores.values())
+            )
+            self._conexao.commit()
+            return cursor.lastrowid
+
+    def _consulta(self, numero_nota=None, cnpj=None, hash_imagem=None, desde=None, ate=None, status=None):
+        condicoes = []
+        parametros = []
+        if numero_nota:
+            condicoes.append("numero_nota = ?")
+            parametros.append(verificacao_local.normalizar_numero(str(numero_nota)))
+        if cnpj:
+            condicoes.append("cnpj = ?")
+            parametros.append(re.sub(r"\D", "", cnpj))
+        if hash_imagem:
+            condicoes.append("(hash_caixa = ? OR hash_nota = ?)")
+            parametros += [hash_imagem, hash_imagem]
+        if desde:
+            condicoes.append("criado_em >= ?")
+            parametros.append(desde)
+        if ate:
+            # Uma data sem horário cobre o dia inteiro
+            condicoes.append("criado_em < date(?, '+1 day')" if len(ate) == 10 else "criado_em <= ?")
+            parametros.append(ate)
+        if status:
+            condicoes.append("status = ?")
+            parametros.append(status)
+        sql = "SELECT * FROM reconciliacoes"
+        if condicoes:
+            sql += " WHERE " + " AND ".join(condicoes)
+        return sql, parametros
+
+    def buscar(self, limite=100, **filtros):
+        """Conciliações que atendem aos filtros, da mais recente para a mais antiga."""
+        sql, parametros = self._consulta(**filtros)
+        sql += " ORDER BY id DESC"
+        if limite:
+            sql += f" LIMIT {int(limite)}"
+        with self._lock:
+            return [dict(linha) for linha in self._conexao.execute(sql, parametros)]
+
+    def ultima_conciliacao(self, numero_nota, cnpj=None):
+        """Responde "esta nota já foi conciliada?": a última conciliação sem erro, ou None."""
+        if not numero_nota:
+            return None
+        sql, parametros = self._consulta(numero_nota=numero_nota, cnpj=cnpj)
+        sql += " AND status != ? ORDER BY id DESC LIMIT 1"
+        with self._lock:
+            linha = self._conexao.execute(sql, parametros + [analise.ERRO]).fetchone()
+        return dict(linha) if linha else None
+
+    def _linhas_em_lotes(self, filtros):
+        # Conexão própria de leitura: com WAL a exportação não bloqueia quem está gravando
+        sql, parametros = self._consulta(**filtros)
+        conexao = sqlite3.connect(self.caminho)
+        try:
+            cursor = conexao.execute(sql + " ORDER BY id", parametros)
+            while True:
+                linhas = cursor.fetchmany(LOTE_EXPORTACAO)
+                if not linhas:
+                    return
+                yield linhas
+        finally:
+            conexao.close()
+
+    def exportar_csv(self, caminho, **filtros):
+        """Exporta as conciliações filtradas em CSV; retorna quantas linhas foram gravadas."""
+        total = 0
+        with open(caminho, "w", encoding="utf-8", newline="") as f:
+            escritor = csv.writer(f)
+            escritor.writerow(COLUNAS)
+            for linhas in self._linhas_em_lotes(filtros):
+                escritor.writerows(linhas)
+                total += len(linhas)
+        return total
+
+    def exportar_parquet(self, caminho, **filtros):
+        """Exporta as conciliações filtradas em Parquet (requer pyarrow); retorna quantas linhas foram gravadas."""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("A exportação em Parquet requer o pyarrow: pip install pyarrow") from None
+
+        tipos = {
+            "id": pa.int64(), "score": pa.int64(), "produtos_match": pa.bool_(), "nota_match": pa.bool_(),
+            "duracao_s": pa.float64(), "tokens_entrada": pa.int64(), "tokens_saida": pa.int64(),
+        }
+        esquema = pa.schema([(coluna, tipos.get(coluna, pa.string())) for coluna in COLUNAS])
+        total = 0
+        with pq.ParquetWriter(caminho, esquema) as escritor:
+            for linhas in self._linhas_em_lotes(filtros):
+                colunas = {nome: [linha[i] for linha in linhas] for i, nome in enumerate(COLUNAS)}
+                for nome in ("produtos_match", "nota_match"):
+                    colunas[nome] = [None if valor is None else bool(valor) for valor in colunas[nome]]
+                escritor.write_table(pa.table(colunas, schema=esquema))
+                total += len(linhas)
+        return total
+
+    def fechar(self):
+        with self._lock:
+            self._conexao.close()
+
+
+def abrir_armazem_padrao():
+    """Abre o histórico conforme o .env, ou retorna None se estiver desativado."""
+    if os.getenv("RESULTADOS_DESATIVADO") == "1":
+        return None
+    return ArmazemResultados(os.getenv("RESULTADOS_CAMINHO", CAMINHO_PADRAO))
+
+
+def descrever_conciliacao(linha):
+    return f"Nota {linha['numero_nota']} já conciliada em {linha['criado_em']} ({linha['status']})"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consulta e exportação do histórico de conciliações.")
+    parser.add_argument("--banco", default=os.getenv("RESULTADOS_CAMINHO", CAMINHO_PADRAO),
+                        help="Arquivo SQLite do histórico")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    def adicionar_filtros(subparser):
+        subparser.add_argument("--nota", help="Número da nota fiscal")
+        subparser.add_argument("--cnpj", help="CNPJ do emitente")
+        subparser.add_argument("--imagem", help="Imagem (caixa ou nota) já conciliada, buscada pelo hash")
+        subparser.add_argument("--desde", help="Data inicial (AAAA-MM-DD)")
+        subparser.add_argument("--ate", help="Data final, inclusiva (AAAA-MM-DD)")
+        subparser.add_argument("--status", choices=[analise.APROVADO, analise.REPROVADO, analise.MANUAL, analise.ERRO])
+
+    buscar = subparsers.add_parser("buscar", help="Lista conciliações em JSONL")
+    adicionar_filtros(buscar)
+    buscar.add_argument("--limite", type=int, default=20)
+
+    exportar = subparsers.add_parser("exportar", help="Exporta conciliações em CSV ou Parquet (pela extensão)")
+    exportar.add_argument("saida", help="Arquivo .csv ou .parquet")
+    adicionar_filtros(exportar)
+
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.banco):
+        print(f"Histórico não encontrado: {args.banco}", file=sys.stderr)
+        return 1
+
+    filtros = {
+        "numero_nota": args.nota,
+        "cnpj": args.cnpj,
+        "hash_imagem": hash_arquivo(args.imagem) if args.imagem else None,
+        "desde": args.desde,
+        "ate": args.ate,
+        "status": args.status,
+    }
+    armazem = ArmazemResultados(args.banco)
+    try:
+        if args.comando == "buscar":
+            for linha in armazem.buscar(limite=args.limite, **filtros):
+                print(json.dumps(linha, ensure_ascii=False))
+        else:
+            if args.saida.lower().endswith(".parquet"):
+                try:
+                    total = armazem.exportar_parquet(args.saida, **filtros)
+                except RuntimeError as e:
+                    print(f"❌ {e}", file=sys.stderr)
+                    return 1
+            else:
+                total = armazem.exportar_csv(args.saida, **filtros)
+            print(f"✓ {total} conciliações exportadas para {args.saida}", file=sys.stderr)
+    finally:
+        armazem.fechar()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+import json
+import os
+import types
+
+import pytest
+
+import analise
+import estruturado
+from cache import CacheRespostas
+
+IMAGEM = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Nota01.png")
+
+
+class ClienteFixo:
+    """Cliente com a interface de chat.completions.create que sempre devolve o mesmo conteúdo."""
+
+    def __init__(self, conteudo):
+        self.chamadas = 0
+        resposta = types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=conteudo))], usage=None
+        )
+
+        def create(**kwargs):
+            self.chamadas += 1
+            return resposta
+
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+
+
+def dados(numero="12345", itens=(("Caneta Azul", 10),), chave=None):
+    return {
+        "numero_nota": numero, "chave_acesso": chave, "cnpj": None,
+        "itens": [{"nome": nome, "quantidade": quantidade} for nome, quantidade in itens],
+    }
+
+
+@pytest.mark.parametrize("resposta", [None, ""])
+def test_ler_resposta_json_vazia(resposta):
+    with pytest.raises(ValueError, match="resposta vazia"):
+        estruturado.ler_resposta_json(resposta, "extração da nota (x.png)")
+
+
+def test_ler_resposta_json_invalida():
+    with pytest.raises(ValueError, match=r"extração da nota \(x.png\) não é um JSON válido"):
+        estruturado.ler_resposta_json('{"numero_nota": "12', "extração da nota (x.png)")
+    with pytest.raises(ValueError, match="não é um objeto JSON"):
+        estruturado.ler_resposta_json("[1, 2]")
+
+
+@pytest.mark.parametrize("conteudo", [None, "", '{"numero_nota": '])
+def test_extrair_dados_com_resposta_ruim_nao_vai_para_o_cache(tmp_path, conteudo):
+    cache = CacheRespostas(str(tmp_path / "cache.sqlite3"))
+    cliente = ClienteFixo(conteudo)
+    for _ in range(2):
+        with pytest.raises(ValueError, match="Nota01.png"):
+            estruturado.extrair_dados(cliente, "d", IMAGEM, "nota", cache=cache)
+    assert cliente.chamadas == 2
+    cache.fechar()
+
+
+def test_extrair_dados_valido(tmp_path):
+    cache = CacheRespostas(str(tmp_path / "cache.sqlite3"))
+    cliente = ClienteFixo(json.dumps(dados()))
+    assert estruturado.extrair_dados(cliente, "d", IMAGEM, "nota", cache=cache) == dados()
+    assert estruturado.extrair_dados(cliente, "d", IMAGEM, "nota", cache=cache) == dados()
+    assert cliente.chamadas == 1
+    cache.fechar()
+
+
+def test_somar_por_nome_agrupa_nomes_normalizados():
+    totais, nomes = estruturado.somar_por_nome([
+        {"nome": "Caneta Azul", "quantidade": 2},
+        {"nome": "caneta  azul!", "quantidade": 3},
+        {"nome": "Lápis", "quantidade": 1},
+        {"nome": "***", "quantidade": 7},
+    ])
+    assert totais == {"caneta azul": 5, "lapis": 1}
+    assert nomes == {"caneta azul": "Caneta Azul", "lapis": "Lápis"}
+
+
+def test_somar_por_nome_quantidade_ilegivel_deixa_total_desconhecido():
+    for itens in ([{"nome": "A", "quantidade": 2}, {"nome": "a", "quantidade": None}],
+                  [{"nome": "A", "quantidade": None}, {"nome": "a", "quantidade": 2}]):
+        totais, _ = estruturado.somar_por_nome(itens)
+        assert totais == {"a": None}
+    assert estruturado.somar_por_nome(None) == ({}, {})
+
+
+def test_melhor_correspondencia():
+    assert estruturado.melhor_correspondencia("caneta azul", {"caneta azul", "caneta"}) == ("caneta azul", 1.0)
+    melhor, razao = estruturado.melhor_correspondencia("caneta azull", ["lapis", "caneta azul"])
+    assert melhor == "caneta azul" and razao >= estruturado.SIMILARIDADE_MINIMA
+    assert estruturado.melhor_correspondencia("caneta", []) == (None, 0.0)
+
+
+def test_comparar_localmente_aprova_par_igual():
+    veredito, relatorio = estruturado.comparar_localmente(
+        dados(numero="NF 12.345"), dados(numero="000012345", itens=(("caneta azul", 10),))
+    )
+    assert veredito["status"] == analise.APROVADO
+    assert veredito["score"] == 100 and veredito["nota_match"] and veredito["produtos_match"]
+    assert analise.interpretar_veredito(relatorio)["score"] == 100
+
+
+def test_comparar_localmente_reprova_quantidade_e_nota_divergentes():
+    veredito, _ = estruturado.comparar_localmente(dados(), dados(numero="999", itens=(("Caneta Azul", 9),)))
+    assert veredito["status"] == analise.REPROVADO
+    assert veredito["motivos"] == ["Score baixo (0%)", "Produtos divergentes", "Nota fiscal divergente"]
+
+
+def test_comparar_localmente_chave_de_acesso_tem_precedencia():
+    chave = "3" * 44
+    veredito, _ = estruturado.comparar_localmente(dados(numero="1", chave=chave), dados(numero="2", chave=chave))
+    assert veredito["nota_match"]
+
+
+def test_comparar_localmente_nome_parecido_e_ambiguo():
+    veredito, relatorio = estruturado.comparar_localmente(
+        dados(itens=(("Caneta Azul", 10),)), dados(itens=(("Caneta Azul Fina", 10),))
+    )
+    assert veredito["ambiguo"] and veredito["status"] == analise.MANUAL
+    assert "AMBÍGUO" in relatorio
+
+
+def test_comparar_localmente_sem_numero_na_caixa_e_ambiguo():
+    veredito, _ = estruturado.comparar_localmente(dados(numero=None), dados())
+    assert veredito["status"] == analise.MANUAL
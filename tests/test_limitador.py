@@ -0,0 +1,69 @@
+import threading
+import time
+import types
+
+import openai
+import pytest
+
+from analise import OperacaoCancelada
+from limitador import LimitadorRequisicoes
+
+
+def erro_429(retry_after="5"):
+    resposta = types.SimpleNamespace(request=None, status_code=429, headers={"retry-after": retry_after})
+    return openai.RateLimitError("429", response=resposta, body=None)
+
+
+def test_cancelamento_interrompe_o_backoff():
+    limitador = LimitadorRequisicoes(concorrencia=2, max_tentativas=6)
+    cancelamento = threading.Event()
+    threading.Timer(0.2, cancelamento.set).start()
+
+    def chamada():
+        raise erro_429()
+
+    inicio = time.monotonic()
+    with pytest.raises(OperacaoCancelada):
+        limitador.executar(chamada, cancelamento=cancelamento)
+    assert time.monotonic() - inicio < 2
+
+
+def test_throttle_reduz_a_concorrencia_sem_baldes():
+    limitador = LimitadorRequisicoes(concorrencia=4)
+    limitador._registrar_throttle(None)
+    assert limitador.metricas()["concorrencia_efetiva"] == 2
+
+    ativos = [0, 0]
+    trava = threading.Lock()
+
+    def chamada():
+        with trava:
+            ativos[0] += 1
+            ativos[1] = max(ativos[1], ativos[0])
+        time.sleep(0.1)
+        with trava:
+            ativos[0] -= 1
+
+    # Impede a recuperação do fator durante o teste
+    limitador._registrar_sucesso = lambda: None
+    threads = [threading.Thread(target=limitador.executar, args=(chamada,)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert ativos[1] == 2
+
+
+def test_create_nao_repassa_cancelamento_ao_sdk():
+    recebidos = {}
+
+    class Completions:
+        def create(self, **kwargs):
+            recebidos.update(kwargs)
+            return "ok"
+
+    cliente = types.SimpleNamespace(chat=types.SimpleNamespace(completions=Completions()))
+    limitado = LimitadorRequisicoes().envolver(cliente)
+    mensagens = [{"role": "user", "content": "oi"}]
+    assert limitado.chat.completions.create(model="m", messages=mensagens, cancelamento=threading.Event()) == "ok"
+    assert "cancelamento" not in recebidos
@@ -0,0 +1,128 @@
+from concurrent.futures import Future
+
+import analise
+import remessa
+
+
+def nota(caminho, numero, itens, chave=None):
+    return {
+        "caminho": caminho, "tipo": "nota", "estatisticas": {},
+        "dados": {"numero_nota": numero, "chave_acesso": chave, "cnpj": None,
+                  "itens": [{"nome": nome, "quantidade": quantidade} for nome, quantidade in itens]},
+    }
+
+
+def caixa(caminho, notas, itens):
+    return {
+        "caminho": caminho, "tipo": "caixa", "estatisticas": {},
+        "dados": {"notas": [{"numero_nota": numero, "chave_acesso": None} for numero in notas], "cnpj": None,
+                  "itens": [{"nome": nome, "quantidade": quantidade, "numero_nota": numero_item}
+                            for nome, quantidade, numero_item in itens]},
+    }
+
+
+def indice_de(*notas):
+    indice, _, _ = remessa.indexar_notas(list(notas))
+    return indice
+
+
+def test_indexar_notas_soma_paginas_e_ignora_foto_repetida():
+    indice, chaves, sem_numero = remessa.indexar_notas([
+        nota("n1a.png", "001", [("Caneta", 10)], chave="3" * 44),
+        nota("n1b.png", "1", [("Lápis", 5)]),
+        nota("n1b_de_novo.png", "1", [("Lápis", 5)]),
+        nota("ilegivel.png", None, [("Caneta", 1)]),
+    ])
+    assert list(indice) == ["1"]
+    assert indice["1"]["paginas"] == ["n1a.png", "n1b.png"]
+    assert indice["1"]["repetidas"] == ["n1b_de_novo.png"]
+    assert len(indice["1"]["itens"]) == 2
+    assert chaves == {"3" * 44: "1"}
+    assert sem_numero == ["ilegivel.png"]
+
+
+def test_atribuir_direto_usa_nota_do_item_ou_unica_citada():
+    alocacao = remessa.AlocacaoItens(indice_de(nota("n1.png", "1", [("Caneta", 10)]), nota("n2.png", "2", [("Caneta", 5)])))
+    assert alocacao.atribuir_direto({"nome": "Caneta", "quantidade": 4, "numero_nota": "2"}, ["1", "2"], "c1.png")
+    assert alocacao.atribuir_direto({"nome": "Caneta", "quantidade": 3, "numero_nota": None}, ["1"], "c2.png")
+    assert not alocacao.atribuir_direto({"nome": "Caneta", "quantidade": 1, "numero_nota": None}, ["1", "2"], "c3.png")
+    assert alocacao.itens["2"] == [{"nome": "Caneta", "quantidade": 4, "caixa": "c1.png"}]
+    assert alocacao.caixas["1"] == ["c2.png"]
+
+
+def test_atribuir_direto_registra_nota_ausente():
+    alocacao = remessa.AlocacaoItens(indice_de(nota("n1.png", "1", [("Caneta", 10)])))
+    assert alocacao.atribuir_direto({"nome": "Caneta", "quantidade": 4, "numero_nota": "99"}, [], "c1.png")
+    assert alocacao.atribuir_direto({"nome": "Lápis", "quantidade": 1, "numero_nota": "99"}, [], "c1.png")
+    assert alocacao.notas_ausentes == {"99": ["c1.png"]}
+    assert alocacao.itens["1"] == []
+
+
+def test_distribuir_completa_cada_nota_e_deixa_excedente_na_melhor():
+    alocacao = remessa.AlocacaoItens(indice_de(nota("n1.png", "1", [("Caneta Azul", 3)]), nota("n2.png", "2", [("Caneta Azul", 5)])))
+    alocacao.distribuir({"nome": "caneta azul", "quantidade": 10}, ["1", "2"], "palete.png")
+    recebido = {numero: sum(item["quantidade"] for item in itens) for numero, itens in alocacao.itens.items()}
+    # 3 e 5 completam as notas; os 2 que sobram ficam na primeira de melhor correspondência
+    assert recebido == {"1": 5, "2": 5}
+
+
+def test_distribuir_item_sem_produto_correspondente_fica_sem_nota():
+    alocacao = remessa.AlocacaoItens(indice_de(nota("n1.png", "1", [("Caneta", 3)])))
+    alocacao.distribuir({"nome": "Grampeador", "quantidade": 2}, [], "c1.png")
+    assert alocacao.sem_nota == [{"caixa": "c1.png", "nome": "Grampeador", "quantidade": 2}]
+
+
+def test_distribuir_quantidade_ilegivel_vai_para_uma_nota():
+    alocacao = remessa.AlocacaoItens(indice_de(nota("n1.png", "1", [("Caneta", 3)]), nota("n2.png", "2", [("Lápis", 3)])))
+    alocacao.distribuir({"nome": "Lapis", "quantidade": None}, ["1", "2"], "c1.png")
+    assert alocacao.itens == {"1": [], "2": [{"nome": "Lapis", "quantidade": None, "caixa": "c1.png"}]}
+
+
+def test_alocar_itens_distribui_depois_das_atribuicoes_diretas():
+    indice, chaves, _ = remessa.indexar_notas([nota("n1.png", "1", [("Caneta", 10)]), nota("n2.png", "2", [("Caneta", 4)])])
+    alocacao, caixas_sem_nota = remessa.alocar_itens([
+        # Sem nota por item: só é distribuída depois da caixa c2, que já entrega 8 na nota 1
+        caixa("palete.png", ["1", "2"], [("Caneta", 6, None)]),
+        caixa("c2.png", ["1"], [("Caneta", 8, None)]),
+        caixa("sem_etiqueta.png", [], [("Caneta", 1, None)]),
+    ], indice, chaves)
+    recebido = {numero: sum(item["quantidade"] for item in itens) for numero, itens in alocacao.itens.items()}
+    # O palete completa as duas notas (2 + 4); a unidade que sobra da caixa sem etiqueta é excedente
+    assert recebido == {"1": 11, "2": 4}
+    assert alocacao.itens["1"][-1] == {"nome": "Caneta", "quantidade": 1, "caixa": "sem_etiqueta.png"}
+    assert caixas_sem_nota == ["sem_etiqueta.png"]
+
+
+def concluido(documento):
+    futuro = Future()
+    futuro.set_result(documento)
+    return futuro
+
+
+def test_conciliar_remessa_aprova_quando_as_caixas_fecham_as_notas():
+    documentos = [
+        caixa("c1.png", ["1"], [("Caneta", 6, None)]),
+        caixa("c2.png", ["1", "2"], [("Caneta", 4, "1"), ("Lápis", 5, "2")]),
+        nota("n1.png", "1", [("Caneta", 10)]),
+        nota("n2.png", "2", [("Lápis", 5)]),
+    ]
+    registro = remessa.conciliar_remessa(
+        None, "d", {"id": "r1", "caixas": ["c1.png", "c2.png"], "notas": ["n1.png", "n2.png"]},
+        [(d["caminho"], d["tipo"], concluido(d)) for d in documentos],
+    )
+    assert registro["status"] == analise.APROVADO, registro["motivos"]
+    assert registro["notas_conferidas"]["1"]["caixas"] == ["c1.png", "c2.png"]
+    assert registro["chamadas_extracao"] == 4 and registro["erro"] is None
+
+
+def test_conciliar_remessa_registra_nota_ausente_e_erro_de_extracao():
+    falha = Future()
+    falha.set_exception(ValueError("resposta vazia"))
+    documentos = [caixa("c1.png", ["1", "7"], [("Caneta", 10, "1")]), nota("n1.png", "1", [("Caneta", 10)])]
+    registro = remessa.conciliar_remessa(
+        None, "d", {"id": "r2", "caixas": ["c1.png", "c2.png"], "notas": ["n1.png"]},
+        [(d["caminho"], d["tipo"], concluido(d)) for d in documentos] + [("c2.png", "caixa", falha)],
+    )
+    assert registro["notas_ausentes"] == {"7": ["c1.png"]}
+    assert registro["status"] == analise.ERRO
+    assert registro["erros_extracao"] == {"c2.png": "resposta vazia"}
@@ -0,0 +1,38 @@
+import resultados
+
+NOTA = """INFORMAÇÕES DA NOTA FISCAL:
+
+- Série: 001
+- Número da Nota: 12345
+- Data de emissão: 27/11/2025
+
+Emitente:
+- Rua das Flores, nº 150 - Centro
+- CNPJ: 12.345.654/0001-90
+"""
+
+CAIXA = """- Remetente: Rua das Flores, nº 150
+- Nota fiscal: NF-e Nº 12.345, Série 001
+"""
+
+
+def test_campos_indexados_usa_a_linha_numero_da_nota():
+    campos = resultados.campos_indexados({"informacoes_nota": NOTA, "informacoes_caixa": CAIXA})
+    assert campos["numero_nota"] == "12345"
+    assert campos["cnpj"] == "12345654000190"
+    assert campos["data_emissao"] == "2025-11-27"
+
+
+def test_campos_indexados_nao_indexa_numero_do_endereco():
+    campos = resultados.campos_indexados({"informacoes_nota": "Emitente: Av. Brasil Nº 2000", "informacoes_caixa": None})
+    assert campos["numero_nota"] is None
+
+
+def test_campos_indexados_prefere_dados_estruturados():
+    registro = {
+        "informacoes_nota": {"numero_nota": "000987", "cnpj": "12.345.654/0001-90", "itens": []},
+        "informacoes_caixa": CAIXA,
+    }
+    campos = resultados.campos_indexados(registro)
+    assert campos["numero_nota"] == "987"
+    assert campos["cnpj"] == "12345654000190"
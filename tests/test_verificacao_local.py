@@ -0,0 +1,47 @@
+import pytest
+
+import verificacao_local
+
+
+@pytest.mark.parametrize("texto, esperado", [
+    ("Número da Nota: 12.345", "12345"),
+    ("NF-e Nº 12.345, Série 001", "12345"),
+    ("NFe no 12345", "12345"),
+    ("Nota fiscal nº 000123456", "123456"),
+    ("NF 4321", "4321"),
+    ("Número da nota: 12 345", "12345"),
+])
+def test_ler_numero_nota_com_rotulo(texto, esperado):
+    assert verificacao_local.ler_numero_nota(texto) == esperado
+
+
+@pytest.mark.parametrize("texto", [
+    "Emitente: Rua das Flores, nº 150",
+    "Av. Brasil Nº 2000 - Centro",
+    "Sala n° 12, bloco B",
+])
+def test_ler_numero_nota_ignora_numero_de_endereco(texto):
+    assert verificacao_local.ler_numero_nota(texto) is None
+
+
+def test_ler_numero_nota_prefere_a_linha_numero_da_nota():
+    texto = "Emitente: Rua das Flores, nº 150\nNF-e nº 777\nNúmero da Nota: 12.345"
+    assert verificacao_local.ler_numero_nota(texto) == "12345"
+
+
+def test_ler_numero_nota_ignora_chave_de_acesso():
+    assert verificacao_local.ler_numero_nota("NF-e: 35190812345678000190550010000123451000123456") is None
+
+
+def test_chave_valida_e_dados_da_chave():
+    chave = "3519081234567800019055001000012345100012345"
+    # Completa o dígito verificador (módulo 11) para montar uma chave válida
+    for dv in "0123456789":
+        if verificacao_local.chave_valida(chave + dv):
+            chave += dv
+            break
+    assert verificacao_local.chave_valida(chave)
+    assert not verificacao_local.chave_valida(chave[:-1] + str((int(chave[-1]) + 1) % 10))
+    dados = verificacao_local.dados_da_chave(chave)
+    assert dados["numero_nota"] == "12345"
+    assert dados["cnpj"] == "12345678000190"
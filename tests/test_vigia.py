@@ -0,0 +1,84 @@
+import io
+import os
+import shutil
+
+import vigia
+
+
+def criar_par(pasta, id_par):
+    for sufixo in ("caixa", "nota"):
+        caminho = os.path.join(pasta, f"{id_par}_{sufixo}.png")
+        with open(caminho, "wb") as f:
+            f.write(b"png " + sufixo.encode())
+        # Gravado "há tempo suficiente" para passar pela verificação de estabilidade
+        os.utime(caminho, ns=(1_000_000_000_000_000_000, 1_000_000_000_000_000_000))
+
+
+def novo_vigia(tmp_path, estado):
+    pasta = tmp_path / "entrada"
+    pasta.mkdir(exist_ok=True)
+    return vigia.Vigia(None, "d", str(pasta), estado, io.StringIO(), polling=True, estabilidade_s=0.0)
+
+
+def test_devolver_espera_antes_de_nova_tentativa(tmp_path):
+    estado = vigia.EstadoFila(str(tmp_path / "fila.sqlite3"), espera_nova_tentativa_s=60)
+    estado.adicionar({"id": "p1", "caixa": "c", "nota": "n", "assinatura": "a"})
+    [par] = estado.reservar(4)
+    assert estado.devolver(par["fila_id"], par["tentativas"]) == 60
+    assert estado.reservar(4) == []
+
+    estado.devolver(par["fila_id"], 3)
+    assert estado.contagem() == {vigia.PENDENTE: 1}
+    estado.fechar()
+
+
+def test_espera_dobra_ate_o_teto(tmp_path):
+    estado = vigia.EstadoFila(str(tmp_path / "fila.sqlite3"), espera_nova_tentativa_s=5)
+    estado.adicionar({"id": "p1", "caixa": "c", "nota": "n", "assinatura": "a"})
+    [par] = estado.reservar(1)
+    assert [estado.devolver(par["fila_id"], n) for n in (1, 2, 3)] == [5, 10, 20]
+    assert estado.devolver(par["fila_id"], 20) == vigia.ESPERA_NOVA_TENTATIVA_MAXIMA_S
+    estado.fechar()
+
+
+def test_par_regravado_depois_de_sumir_volta_para_a_fila(tmp_path):
+    estado = vigia.EstadoFila(str(tmp_path / "fila.sqlite3"))
+    v = novo_vigia(tmp_path, estado)
+    criar_par(v.pasta, "p1")
+    v.enfileirar_novos(set())
+    assert v.enfileirar_novos(set()) == 1
+    [par] = estado.reservar(1)
+    estado.concluir(par["fila_id"], "APROVADO")
+
+    guardados = tmp_path / "guardados"
+    shutil.move(v.pasta, guardados)
+    os.mkdir(v.pasta)
+    v.enfileirar_novos(set())
+    assert v._conhecidos == set()
+    assert estado.contagem() == {}
+
+    # Mesmos arquivos (mesmo nome, tamanho e data) gravados de novo
+    os.rmdir(v.pasta)
+    shutil.move(guardados, v.pasta)
+    v.enfileirar_novos(set())
+    assert v.enfileirar_novos(set()) == 1
+    assert estado.contagem() == {vigia.PENDENTE: 1}
+    v.observador.fechar()
+    estado.fechar()
+
+
+def test_lateral_removido_sai_da_memoria(tmp_path):
+    estado = vigia.EstadoFila(str(tmp_path / "fila.sqlite3"))
+    v = novo_vigia(tmp_path, estado)
+    lateral = os.path.join(v.pasta, "ruim.json")
+    with open(lateral, "w", encoding="utf-8") as f:
+        f.write('{"caixa": "x"}')
+    v.enfileirar_novos(set())
+    v.enfileirar_novos(set())
+    assert "ruim.json" in v._laterais
+
+    os.remove(lateral)
+    v.enfileirar_novos(set())
+    assert v._laterais == {}
+    v.observador.fechar()
+    estado.fechar()
@@ -0,0 +1,238 @@
+"""Verificação local (offline) do número da nota antes de chamar o modelo.
+
+Lê os códigos de barras/QR das duas imagens (a chave de acesso da NF-e tem 44
+dígitos e contém o CNPJ do emitente e o número da nota) e faz OCR do número
+da nota. Se as duas imagens trazem chaves de acesso válidas e diferentes, o par
+é reprovado na hora, sem nenhuma chamada à API. Quando as leituras conferem, os
+valores lidos viram dicas para os prompts de extração.
+
+Dependências opcionais (sem elas a etapa simplesmente não encontra nada):
+    pip install pyzbar pytesseract   (+ bibliotecas do sistema zbar e tesseract-ocr)
+
+Ative pelo .env com VERIFICACAO_LOCAL=1.
+"""
+import os
+import re
+
+import analise
+
+DIVERGENTE = "DIVERGENTE"
+CONFERE = "CONFERE"
+INCONCLUSIVO = "INCONCLUSIVO"
+
+# Lado máximo usado no OCR; maior que isso só deixa o tesseract mais lento
+MAX_LADO_OCR = 2000
+
+PADRAO_CHAVE = re.compile(r"(?:\d[\s.]?){44}")
+# Só números precedidos de um rótulo de nota fiscal: um "nº" solto costuma ser o número do endereço.
+# O número pode vir com ou sem separador de milhar ("12.345", "12 345", "12345").
+_NUMERO = r"\s*[:\-]?\s*(\d[\d. ]*\d|\d)"
+PADRAO_NUMERO_NOTA_ROTULADO = re.compile(r"n[úu]mero\s+da\s+(?:nota|nf-?e?)(?:\s+fiscal)?" + _NUMERO, re.IGNORECASE)
+PADRAO_NUMERO_NOTA = re.compile(
+    r"(?:n[úu]mero\s+da\s+(?:nota|nf-?e?)(?:\s+fiscal)?"
+    r"|\bnota\s+fiscal(?:\s+eletr[ôo]nica)?\s*(?:n[º°o]\.?|n[úu]mero)"
+    r"|\bnf-?e?\b\.?\s*(?:n[º°o]\b\.?|n[º°])?)" + _NUMERO,
+    re.IGNORECASE,
+)
+
+# O número da NF-e tem no máximo 9 dígitos; mais que isso é a chave de acesso ou outro código
+MAX_DIGITOS_NUMERO_NOTA = 9
+
+
+_backends = None
+_ocr_disponivel = None
+
+
+def carregar_backends():
+    """(pyzbar, pytesseract), importados só no primeiro uso; None no que não estiver instalado."""
+    global _backends
+    if _backends is None:
+        try:
+            from pyzbar import pyzbar
+        except ImportError:
+            pyzbar = None
+        try:
+            import pytesseract
+        except ImportError:
+            pytesseract = None
+        _backends = (pyzbar, pytesseract)
+    return _backends
+
+
+def verificacao_ativada():
+    return os.getenv("VERIFICACAO_LOCAL") == "1"
+
+
+def ocr_disponivel():
+    """pytesseract instalado e o executável tesseract encontrado; conferido uma vez por processo."""
+    global _ocr_disponivel
+    if _ocr_disponivel is None:
+        _, pytesseract = carregar_backends()
+        disponivel = False
+        if pytesseract is not None:
+            try:
+                pytesseract.get_tesseract_version()
+                disponivel = True
+            except Exception:
+                pass
+        _ocr_disponivel = disponivel
+    return _ocr_disponivel
+
+
+def backends_disponiveis():
+    pyzbar, _ = carregar_backends()
+    return {"codigo_barras": pyzbar is not None, "ocr": ocr_disponivel()}
+
+
+def chave_valida(chave):
+    """Confere o dígito verificador (módulo 11) da chave de acesso de 44 dígitos."""
+    if len(chave) != 44 or not chave.isdigit():
+        return False
+    soma = 0
+    peso = 2
+    for digito in reversed(chave[:43]):
+        soma += int(digito) * peso
+        peso = 2 if peso == 9 else peso + 1
+    resto = soma % 11
+    dv = 0 if resto < 2 else 11 - resto
+    return dv == int(chave[43])
+
+
+def dados_da_chave(chave):
+    # Layout da chave: cUF(2) AAMM(4) CNPJ(14) modelo(2) série(3) número(9) tpEmis(1) código(8) DV(1)
+    return {
+        "chave_acesso": chave,
+        "cnpj": chave[6:20],
+        "serie": chave[22:25].lstrip("0") or "0",
+        "numero_nota": chave[25:34].lstrip("0") or "0",
+    }
+
+
+def normalizar_numero(numero):
+    return re.sub(r"\D", "", numero).lstrip("0") or None
+
+
+def ler_numero_nota(texto):
+    """Número da nota num texto livre (OCR ou resposta do modelo), já normalizado; None se não houver.
+
+    A linha "Número da nota" tem prioridade sobre rótulos mais curtos como "NF-e nº".
+    """
+    for padrao in (PADRAO_NUMERO_NOTA_ROTULADO, PADRAO_NUMERO_NOTA):
+        for encontrado in padrao.finditer(texto):
+            numero = normalizar_numero(encontrado.group(1))
+            if numero and len(numero) <= MAX_DIGITOS_NUMERO_NOTA:
+                return numero
+    return None
+
+
+def carregar_imagem(caminho_imagem):
+    from PIL import Image, ImageOps
+
+    with Image.open(caminho_imagem) as imagem:
+        imagem = ImageOps.exif_transpose(imagem)
+        imagem = imagem.convert("L")
+    imagem.thumbnail((MAX_LADO_OCR, MAX_LADO_OCR))
+    return imagem
+
+
+def ler_codigos(imagem):
+    pyzbar, _ = carregar_backends()
+    if pyzbar is None:
+        return []
+    try:
+        return [codigo.data.decode("ascii", "ignore") for codigo in pyzbar.decode(imagem)]
+    except Exception:
+        return []
+
+
+def ler_texto(imagem):
+    # Sem o executável cada chamada falharia depois de ~200 ms tentando iniciá-lo
+    if not ocr_disponivel():
+        return ""
+    _, pytesseract = carregar_backends()
+    try:
+        return pytesseract.image_to_string(imagem, lang=os.getenv("OCR_IDIOMA", "por"))
+    except Exception:
+        return ""
+
+
+def ler_documento(caminho_imagem):
+    """Retorna o que foi possível ler localmente de uma imagem (caixa ou nota)."""
+    imagem = carregar_imagem(caminho_imagem)
+    leitura = {"chave_acesso": None, "cnpj": None, "numero_nota": None, "origem": None}
+
+    # 1. Código de barras / QR code: a chave de acesso validada é a evidência mais forte
+    for codigo in ler_codigos(imagem):
+        for candidato in PADRAO_CHAVE.findall(codigo):
+            chave = re.sub(r"\D", "", candidato)
+            if chave_valida(chave):
+                leitura.update(dados_da_chave(chave), origem="codigo_barras")
+                return leitura
+
+    # 2. OCR: procura a chave de acesso impressa e, na falta dela, o número da nota
+    texto = ler_texto(imagem)
+    for candidato in PADRAO_CHAVE.findall(texto):
+        chave = re.sub(r"\D", "", candidato)
+        if chave_valida(chave):
+            leitura.update(dados_da_chave(chave), origem="ocr_chave")
+            return leitura
+
+    numero = ler_numero_nota(texto)
+    if numero:
+        leitura["numero_nota"] = numero
+        leitura["origem"] = "ocr_numero"
+    return leitura
+
+
+def montar_dica(leitura):
+    if not leitura["numero_nota"]:
+        return None
+    partes = [f"número da nota {leitura['numero_nota']}"]
+    if leitura["chave_acesso"]:
+        partes.append(f"chave de acesso {leitura['chave_acesso']}")
+    if leitura["cnpj"]:
+        partes.append(f"CNPJ do emitente {leitura['cnpj']}")
+    return (
+        "\n\nDica de uma leitura local (código de barras/OCR) desta imagem: "
+        + ", ".join(partes)
+        + ". Confirme com o que está visível na imagem."
+    )
+
+
+def verificar_par(caminho_caixa, caminho_nota):
+    caixa = ler_documento(caminho_caixa)
+    nota = ler_documento(caminho_nota)
+
+    # Só reprova sem o modelo quando as duas chaves foram validadas pelo dígito verificador;
+    # um número lido só por OCR pode ter erro de leitura e vira apenas dica
+    if caixa["chave_acesso"] and nota["chave_acesso"]:
+        status = CONFERE if caixa["chave_acesso"] == nota["chave_acesso"] else DIVERGENTE
+    elif caixa["numero_nota"] and nota["numero_nota"] and caixa["numero_nota"] == nota["numero_nota"]:
+        status = CONFERE
+    else:
+        status = INCONCLUSIVO
+
+    dicas = {}
+    if status == CONFERE:
+        dicas = {"caixa": montar_dica(caixa), "nota": montar_dica(nota)}
+    return {"status": status, "caixa": caixa, "nota": nota, "dicas": dicas}
+
+
+def campos_nota(verificacao):
+    """Número, CNPJ e chave de acesso lidos da nota, para o histórico de conciliações."""
+    nota = verificacao["nota"]
+    return {"numero_nota": nota["numero_nota"], "cnpj": nota["cnpj"], "chave_acesso": nota["chave_acesso"]}
+
+
+def veredito_divergente(verificacao):
+    """Veredito no formato de analise.interpretar_veredito para um par reprovado localmente."""
+    return {
+        "status": analise.REPROVADO,
+        "score": 0,
+        "produtos_match": None,
+        "nota_match": False,
+        "motivos": [
+            f"Nota fiscal divergente na leitura local (caixa {verificacao['caixa']['numero_nota']}"
+            f" x nota {verificacao['nota']['numero_nota']})"
+        ],
+    }
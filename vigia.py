@@ -0,0 +1,650 @@
+"""Modo contínuo: vigia uma pasta e concilia os pares à medida que os scanners gravam as imagens.
+
+Uso:
+    python vigia.py PASTA --saida vereditos.jsonl --workers 4
+
+Os pares são formados:
+- pelo nome, como no lote: "<id>_caixa.<ext>" com "<id>_nota.<ext>";
+- ou por um arquivo lateral "<id>.json" com {"caixa": "...", "nota": "..."} (nomes de
+  arquivos da própria pasta), para scanners que não controlam o nome das imagens.
+
+Um arquivo só entra num par quando está pronto: o inotify avisou que ele foi fechado
+ou movido para a pasta, ou (sem inotify) o tamanho e a data não mudaram entre duas
+varreduras e ele foi gravado há mais de VIGIA_ESTABILIDADE_S segundos.
+
+Cada par passa por duas etapas em pools separados, extração e cruzamento, então um
+par é extraído enquanto o anterior está no cruzamento. Os vereditos são gravados um
+a um (JSONL e histórico de resultados.py) e a fila fica num SQLite: ao reiniciar, os
+pares que estavam em andamento voltam para a fila e os concluídos não são refeitos.
+Um par com erro volta para a fila com espera exponencial (VIGIA_ESPERA_NOVA_TENTATIVA_S,
+dobrando a cada tentativa) até VIGIA_TENTATIVAS. Quando os arquivos de um par somem
+da pasta, ele é esquecido: se os mesmos arquivos forem gravados de novo, são refeitos.
+
+Contrapressão: só entram no pipeline tantos pares quanto a janela permite. A janela
+cai pela metade quando o limitador recebe 429 ou a espera média na fila dele passa
+de VIGIA_ESPERA_MAXIMA_S, e volta a crescer de um em um enquanto o endpoint responde
+bem; os demais pares esperam no disco.
+
+Configuração opcional no .env:
+    VIGIA_ESTADO=dados/vigia.sqlite3
+    VIGIA_POLLING=1          (sem inotify; necessário em pastas de rede SMB/NFS gravadas por outras máquinas)
+    VIGIA_INTERVALO_S=2
+    VIGIA_ESTABILIDADE_S=2
+    VIGIA_ESPERA_MAXIMA_S=5
+    VIGIA_TENTATIVAS=3
+    VIGIA_ESPERA_NOVA_TENTATIVA_S=5
+"""
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import signal
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import analise
+import estruturado
+import lote
+import verificacao_local
+from cache import abrir_cache_padrao
+from configuracao import criar_cliente
+from resultados import abrir_armazem_padrao
+
+CAMINHO_ESTADO = os.path.join("dados", "vigia.sqlite3")
+
+PENDENTE = "pendente"
+PROCESSANDO = "processando"
+CONCLUIDO = "concluido"
+
+# Teto da espera antes de uma nova tentativa de um par que voltou para a fila
+ESPERA_NOVA_TENTATIVA_MAXIMA_S = 300.0
+
+# Eventos do inotify que indicam arquivo completo: gravação fechada ou movido para a pasta
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+EVENTO_INOTIFY = struct.Struct("iIII")
+
+
+def _abrir_inotify(pasta):
+    """Descritor do inotify vigiando a pasta, ou None onde não houver inotify (Windows, macOS)."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(pasta), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+class ObservadorPasta:
+    """Espera novos arquivos na pasta com inotify ou, sem ele, simplesmente pelo intervalo de varredura."""
+
+    def __init__(self, pasta, polling=False):
+        self._fd = None if polling else _abrir_inotify(pasta)
+        if self._fd is not None:
+            self._leitura, self._escrita = os.pipe()
+        else:
+            self._acordado = threading.Event()
+
+    @property
+    def modo(self):
+        return "polling" if self._fd is None else "inotify"
+
+    def acordar(self):
+        """Interrompe aguardar() antes do tempo (ex.: abriu vaga na janela de pares)."""
+        if self._fd is not None:
+            os.write(self._escrita, b"\0")
+        else:
+            self._acordado.set()
+
+    def aguardar(self, timeout):
+        """Bloqueia até chegar arquivo, acordar() ou o timeout; retorna os nomes avisados pelo inotify."""
+        if self._fd is None:
+            self._acordado.wait(timeout)
+            self._acordado.clear()
+            return set()
+
+        prontos, _, _ = select.select([self._fd, self._leitura], [], [], timeout)
+        if self._leitura in prontos:
+            os.read(self._leitura, 4096)
+        nomes = set()
+        if self._fd in prontos:
+            dados = os.read(self._fd, 64 * 1024)
+            posicao = 0
+            while posicao < len(dados):
+                _, _, _, tamanho = EVENTO_INOTIFY.unpack_from(dados, posicao)
+                posicao += EVENTO_INOTIFY.size
+                nome = os.fsdecode(dados[posicao:posicao + tamanho].rstrip(b"\0"))
+                posicao += tamanho
+                if nome:
+                    nomes.add(nome)
+        return nomes
+
+    def fechar(self):
+        if self._fd is not None:
+            for fd in (self._fd, self._leitura, self._escrita):
+                os.close(fd)
+            self._fd = None
+
+
+class EstadoFila:
+    """Fila persistente (SQLite) dos pares encontrados, para retomar o trabalho depois de reiniciar."""
+
+    def __init__(self, caminho=CAMINHO_ESTADO, max_tentativas=3, espera_nova_tentativa_s=5.0):
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+
+        self.caminho = caminho
+        self.max_tentativas = max_tentativas
+        self.espera_nova_tentativa_s = espera_nova_tentativa_s
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._conexao.row_factory = sqlite3.Row
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute(
+            """CREATE TABLE IF NOT EXISTS fila (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                id_par TEXT NOT NULL,
+                caminho_caixa TEXT NOT NULL,
+                caminho_nota TEXT NOT NULL,
+                assinatura TEXT NOT NULL,
+                estado TEXT NOT NULL,
+                status TEXT,
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                disponivel_em TEXT,
+                criado_em TEXT NOT NULL,
+                atualizado_em TEXT NOT NULL,
+                UNIQUE (id_par, assinatura)
+            )"""
+        )
+        colunas = {linha["name"] for linha in self._conexao.execute("PRAGMA table_info(fila)")}
+        if "disponivel_em" not in colunas:
+            # Fila criada por uma versão anterior, sem espera entre tentativas
+            self._conexao.execute("ALTER TABLE fila ADD COLUMN disponivel_em TEXT")
+        self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_fila_estado ON fila (estado, id)")
+        self._conexao.commit()
+
+    @staticmethod
+    def _agora(daqui_s=0.0):
+        return (datetime.now() + timedelta(seconds=daqui_s)).isoformat(sep=" ", timespec="seconds")
+
+    @staticmethod
+    def _par(linha):
+        return {
+            "fila_id": linha["id"],
+            "id": linha["id_par"],
+            "caixa": linha["caminho_caixa"],
+            "nota": linha["caminho_nota"],
+            "tentativas": linha["tentativas"],
+        }
+
+    def adicionar(self, par):
+        """Enfileira o par; retorna False se ele (com os mesmos arquivos) já estava na fila."""
+        agora = self._agora()
+        with self._lock:
+            cursor = self._conexao.execute(
+                """INSERT OR IGNORE INTO fila (id_par, caminho_caixa, caminho_nota, assinatura, estado,
+                                               criado_em, atualizado_em)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (par["id"], par["caixa"], par["nota"], par["assinatura"], PENDENTE, agora, agora),
+            )
+            self._conexao.commit()
+        return cursor.rowcount == 1
+
+    def recuperar(self):
+        """Devolve à fila os pares que estavam em andamento quando o processo parou.
+
+        Retorna os que já esgotaram as tentativas (provavelmente derrubam o processo);
+        esses são encerrados com ERRO em vez de voltar para a fila.
+        """
+        with self._lock:
+            abandonados = [self._par(linha) for linha in self._conexao.execute(
+                "SELECT * FROM fila WHERE estado = ? AND tentativas >= ?", (PROCESSANDO, self.max_tentativas)
+            )]
+            self._conexao.execute(
+                "UPDATE fila SET estado = ?, status = ?, atualizado_em = ? WHERE estado = ? AND tentativas >= ?",
+                (CONCLUIDO, analise.ERRO, self._agora(), PROCESSANDO, self.max_tentativas),
+            )
+            self._conexao.execute(
+                "UPDATE fila SET estado = ?, atualizado_em = ? WHERE estado = ?", (PENDENTE, self._agora(), PROCESSANDO)
+            )
+            self._conexao.commit()
+        return abandonados
+
+    def reservar(self, quantidade):
+        """Marca até `quantidade` pares pendentes (os mais antigos) como em andamento e os retorna.
+
+        Os pares devolvidos por devolver() só voltam depois de cumprida a espera.
+        """
+        with self._lock:
+            linhas = self._conexao.execute(
+                """SELECT * FROM fila WHERE estado = ? AND (disponivel_em IS NULL OR disponivel_em <= ?)
+                   ORDER BY id LIMIT ?""",
+                (PENDENTE, self._agora(), quantidade),
+            ).fetchall()
+            self._conexao.executemany(
+                "UPDATE fila SET estado = ?, tentativas = tentativas + 1, atualizado_em = ? WHERE id = ?",
+                [(PROCESSANDO, self._agora(), linha["id"]) for linha in linhas],
+            )
+            self._conexao.commit()
+        pares = [self._par(linha) for linha in linhas]
+        for par in pares:
+            par["tentativas"] += 1
+        return pares
+
+    def devolver(self, fila_id, tentativas):
+        """Põe o par de volta na fila após `tentativas` tentativas; retorna a espera (s) até a próxima."""
+        espera = min(ESPERA_NOVA_TENTATIVA_MAXIMA_S, self.espera_nova_tentativa_s * 2 ** max(0, tentativas - 1))
+        with self._lock:
+            self._conexao.execute(
+                "UPDATE fila SET estado = ?, disponivel_em = ?, atualizado_em = ? WHERE id = ?",
+                (PENDENTE, self._agora(espera), self._agora(), fila_id),
+            )
+            self._conexao.commit()
+        return espera
+
+    def esquecer(self, id_par, assinatura):
+        """Remove o par (se não estiver em andamento) para os mesmos arquivos poderem ser enfileirados de novo."""
+        with self._lock:
+            self._conexao.execute(
+                "DELETE FROM fila WHERE id_par = ? AND assinatura = ? AND estado != ?", (id_par, assinatura, PROCESSANDO)
+            )
+            self._conexao.commit()
+
+    def concluir(self, fila_id, status):
+        with self._lock:
+            self._conexao.execute(
+                "UPDATE fila SET estado = ?, status = ?, atualizado_em = ? WHERE id = ?",
+                (CONCLUIDO, status, self._agora(), fila_id),
+            )
+            self._conexao.commit()
+
+    def contagem(self):
+        with self._lock:
+            return dict(self._conexao.execute("SELECT estado, COUNT(*) FROM fila GROUP BY estado").fetchall())
+
+    def fechar(self):
+        with self._lock:
+            self._conexao.close()
+
+
+class JanelaAdaptativa:
+    """Quantos pares podem estar no pipeline ao mesmo tempo, ajustada pelos sinais do limitador.
+
+    Cai pela metade se houve 429 ou se a espera média na fila do limitador passou de
+    espera_maxima_s desde o último ajuste; senão cresce de um em um até o máximo.
+    """
+
+    def __init__(self, maximo, limitador=None, espera_maxima_s=5.0):
+        self.maximo = maximo
+        self.tamanho = maximo
+        self.em_andamento = 0
+        self.limitador = limitador
+        self.espera_maxima_s = espera_maxima_s
+        self._lock = threading.Lock()
+        self._vazia = threading.Condition(self._lock)
+        self._anteriores = limitador.metricas() if limitador is not None else None
+
+    def vagas(self):
+        with self._lock:
+            return max(0, self.tamanho - self.em_andamento)
+
+    def ocupar(self):
+        with self._lock:
+            self.em_andamento += 1
+
+    def liberar(self):
+        with self._lock:
+            self.em_andamento -= 1
+            self._vazia.notify_all()
+
+    def aguardar_vazia(self):
+        with self._lock:
+            while self.em_andamento:
+                self._vazia.wait()
+
+    def ajustar(self):
+        """Recalcula o tamanho; retorna o novo tamanho se ele diminuiu (para avisar), senão None."""
+        if self.limitador is None:
+            return None
+        metricas = self.limitador.metricas()
+        with self._lock:
+            throttles = metricas["eventos_throttle"] - self._anteriores["eventos_throttle"]
+            requisicoes = metricas["requisicoes"] - self._anteriores["requisicoes"]
+            if not throttles and not requisicoes:
+                return None
+            espera = metricas["espera_fila_total_s"] - self._anteriores["espera_fila_total_s"]
+            self._anteriores = metricas
+            if throttles or espera / max(1, requisicoes) > self.espera_maxima_s:
+                anterior = self.tamanho
+                self.tamanho = max(1, self.tamanho // 2)
+                return self.tamanho if self.tamanho < anterior else None
+            self.tamanho = min(self.maximo, self.tamanho + 1)
+            return None
+
+
+class Vigia:
+    def __init__(self, client, deployment_name, pasta, estado, saida, workers=4, workers_cruzamento=None,
+                 cache=None, modo=estruturado.MODO_TEXTO, fallback_llm=False, verificar_localmente=False,
+                 armazem=None, max_em_andamento=None, intervalo_s=2.0, estabilidade_s=2.0, polling=False,
+                 espera_maxima_s=5.0):
+        self.client = client
+        self.deployment_name = deployment_name
+        self.pasta = pasta
+        self.estado = estado
+        self.saida = saida
+        self.workers = workers
+        self.workers_cruzamento = workers_cruzamento or workers
+        self.cache = cache
+        self.modo = modo
+        self.fallback_llm = fallback_llm
+        self.verificar_localmente = verificar_localmente
+        self.armazem = armazem
+        self.intervalo_s = intervalo_s
+        self.estabilidade_s = estabilidade_s
+        self.janela = JanelaAdaptativa(
+            max_em_andamento or 2 * workers, getattr(client, "limitador", None), espera_maxima_s
+        )
+        self.observador = ObservadorPasta(pasta, polling=polling)
+        self.parada = threading.Event()
+        self.contagem = {}
+        self._lock = threading.Lock()
+        # Tamanho/data de cada arquivo na última varredura e, para os que o inotify deu como
+        # prontos, o tamanho/data que tinham quando o aviso foi aplicado
+        self._vistos = {}
+        self._avisados = {}
+        # Só guardam o que ainda está na pasta (podados a cada varredura em enfileirar_novos)
+        self._laterais = {}
+        self._conhecidos = set()
+        self._pool_cruzamento = None
+
+    def parar(self):
+        self.parada.set()
+        self.observador.acordar()
+
+    def arquivos_prontos(self, avisados):
+        """{nome: (tamanho, data)} dos arquivos da pasta que já terminaram de ser gravados."""
+        agora = time.time()
+        atuais = {}
+        prontos = {}
+        for entrada in os.scandir(self.pasta):
+            extensao = os.path.splitext(entrada.name)[1].lower()
+            if extensao not in lote.EXTENSOES_IMAGEM + (".json",) or not entrada.is_file():
+                continue
+            info = entrada.stat()
+            assinatura = (info.st_size, info.st_mtime_ns)
+            atuais[entrada.name] = assinatura
+            if entrada.name in avisados:
+                self._avisados[entrada.name] = assinatura
+            estavel = self._vistos.get(entrada.name) == assinatura and agora - info.st_mtime >= self.estabilidade_s
+            if self._avisados.get(entrada.name) == assinatura or estavel:
+                prontos[entrada.name] = assinatura
+        self._vistos = atuais
+        # O aviso só vale para o conteúdo que foi fechado: um arquivo regravado precisa
+        # de um novo aviso (ou passar pela verificação de estabilidade) para voltar a contar
+        self._avisados = {nome: a for nome, a in self._avisados.items() if atuais.get(nome) == a}
+        return prontos
+
+    def _ler_lateral(self, nome, assinatura):
+        if self._laterais.get(nome, (None,))[0] != assinatura:
+            try:
+                with open(os.path.join(self.pasta, nome), encoding="utf-8") as f:
+                    dados = json.load(f)
+                if not dados.get("caixa") or not dados.get("nota"):
+                    raise ValueError("faltam os campos caixa e nota")
+            except (OSError, ValueError, AttributeError) as e:
+                # Lido de novo (e avisado de novo) só se o arquivo mudar
+                print(f"⚠️ Arquivo lateral ignorado: {nome} ({e})", file=sys.stderr)
+                dados = None
+            self._laterais[nome] = (assinatura, dados)
+        return self._laterais[nome][1]
+
+    def formar_pares(self, prontos):
+        """Pares completos entre os arquivos prontos: primeiro os dos arquivos laterais, depois pelo nome."""
+        pares = []
+        usados = set()
+        for nome in sorted(prontos):
+            if not nome.lower().endswith(".json"):
+                continue
+            dados = self._ler_lateral(nome, prontos[nome])
+            if dados is None:
+                continue
+            caixa, nota = os.path.basename(dados["caixa"]), os.path.basename(dados["nota"])
+            usados.update((caixa, nota))
+            if caixa in prontos and nota in prontos:
+                pares.append((dados.get("id") or os.path.splitext(nome)[0], caixa, nota))
+
+        caixas = {}
+        notas = {}
+        for nome in prontos:
+            base, extensao = os.path.splitext(nome)
+            if nome in usados or extensao.lower() not in lote.EXTENSOES_IMAGEM:
+                continue
+            if base.lower().endswith(lote.SUFIXO_CAIXA):
+                caixas[base[:-len(lote.SUFIXO_CAIXA)]] = nome
+            elif base.lower().endswith(lote.SUFIXO_NOTA):
+                notas[base[:-len(lote.SUFIXO_NOTA)]] = nome
+        pares.extend((id_par, caixas[id_par], notas[id_par]) for id_par in sorted(caixas.keys() & notas.keys()))
+
+        return [
+            {
+                "id": id_par,
+                "caixa": os.path.join(self.pasta, caixa),
+                "nota": os.path.join(self.pasta, nota),
+                # Uma imagem regravada com o mesmo nome vira um par novo
+                "assinatura": "{}:{}|{}:{}".format(*prontos[caixa], *prontos[nota]),
+            }
+            for id_par, caixa, nota in pares
+        ]
+
+    def enfileirar_novos(self, avisados):
+        prontos = self.arquivos_prontos(avisados)
+        pares = self.formar_pares(prontos)
+        self._laterais = {nome: lateral for nome, lateral in self._laterais.items() if nome in prontos}
+
+        atuais = set()
+        novos = 0
+        for par in pares:
+            chave = (par["id"], par["assinatura"])
+            atuais.add(chave)
+            if chave not in self._conhecidos and self.estado.adicionar(par):
+                novos += 1
+        # Par cujos arquivos sumiram ou foram regravados: se os mesmos arquivos voltarem
+        # (mesmo nome, tamanho e data), é um par novo e não pode ser ignorado
+        for id_par, assinatura in self._conhecidos - atuais:
+            self.estado.esquecer(id_par, assinatura)
+        self._conhecidos = atuais
+        return novos
+
+    def despachar(self, pool_extracao):
+        vagas = self.janela.vagas()
+        if not vagas:
+            return
+        for par in self.estado.reservar(vagas):
+            self.janela.ocupar()
+            self._submeter(pool_extracao, self._extrair, par)
+
+    def _submeter(self, pool, funcao, par, *argumentos):
+        futuro = pool.submit(funcao, par, *argumentos)
+        futuro.add_done_callback(lambda futuro: self._tratar_falha(futuro, par))
+
+    def _tratar_falha(self, futuro, par):
+        """Erro que escapou de _extrair/_cruzar (ex.: disco cheio ao gravar o veredito): o par volta para a fila."""
+        if futuro.cancelled() or futuro.exception() is None:
+            return
+        erro = futuro.exception()
+        try:
+            if par["tentativas"] < self.estado.max_tentativas:
+                espera = self.estado.devolver(par["fila_id"], par["tentativas"])
+                print(f"❌ {par['id']}: erro inesperado ({erro}); volta para a fila em {espera:.0f}s", file=sys.stderr)
+            else:
+                print(f"❌ {par['id']}: erro inesperado ({erro}); desistindo após {par['tentativas']} tentativas",
+                      file=sys.stderr)
+                self.estado.concluir(par["fila_id"], analise.ERRO)
+        except Exception as e:
+            print(f"❌ {par['id']}: não foi possível atualizar a fila ({e})", file=sys.stderr)
+        if not par.get("janela_liberada"):
+            self.janela.liberar()
+            self.observador.acordar()
+
+    def _extrair(self, par):
+        registro, extracao = lote.extrair_par(
+            self.client, self.deployment_name, par, cache=self.cache, modo=self.modo,
+            verificar_localmente=self.verificar_localmente,
+        )
+        if extracao is None:
+            self._concluir(par, registro)
+        else:
+            # O cruzamento roda no outro pool, liberando esta thread para extrair o próximo par
+            self._submeter(self._pool_cruzamento, self._cruzar, par, registro, extracao)
+
+    def _cruzar(self, par, registro, extracao):
+        lote.cruzar_par(
+            self.client, self.deployment_name, registro, extracao, cache=self.cache, modo=self.modo,
+            fallback_llm=self.fallback_llm,
+        )
+        self._concluir(par, registro)
+
+    def gravar_veredito(self, registro):
+        self.saida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        self.saida.flush()
+        if self.armazem is not None:
+            try:
+                self.armazem.registrar(registro, origem="vigia", modo=self.modo, deployment_name=self.deployment_name)
+            except Exception as e:
+                # O veredito já está no JSONL; o histórico não pode travar a fila
+                print(f"Erro ao gravar no histórico de conciliações: {e}", file=sys.stderr)
+        self.contagem[registro["status"]] = self.contagem.get(registro["status"], 0) + 1
+
+    def _concluir(self, par, registro):
+        try:
+            with self._lock:
+                if registro["status"] == analise.ERRO and par["tentativas"] < self.estado.max_tentativas:
+                    espera = self.estado.devolver(par["fila_id"], par["tentativas"])
+                    print(f"⚠️ {par['id']}: {registro['erro']} (tentativa {par['tentativas']}, "
+                          f"volta para a fila em {espera:.0f}s)", file=sys.stderr)
+                else:
+                    self.gravar_veredito(registro)
+                    self.estado.concluir(par["fila_id"], registro["status"])
+                    print(f"✓ {par['id']}: {registro['status']} em {registro['duracao_s']:.1f}s", file=sys.stderr)
+            reduzida = self.janela.ajustar()
+            if reduzida is not None:
+                print(f"⚠️ Endpoint lento ou com 429: janela reduzida para {reduzida} par(es) em andamento", file=sys.stderr)
+        finally:
+            par["janela_liberada"] = True
+            self.janela.liberar()
+            self.observador.acordar()
+
+    def executar(self):
+        for par in self.estado.recuperar():
+            self.gravar_veredito({
+                "id": par["id"], "caixa": par["caixa"], "nota": par["nota"], "status": analise.ERRO,
+                "erro": f"Processamento interrompido {par['tentativas']} vezes", "duracao_s": None,
+            })
+        print(f"👀 Vigiando {self.pasta} ({self.observador.modo}); fila: {self.estado.contagem()}", file=sys.stderr)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool_extracao, \
+                ThreadPoolExecutor(max_workers=self.workers_cruzamento) as pool_cruzamento:
+            self._pool_cruzamento = pool_cruzamento
+            avisados = set()
+            while not self.parada.is_set():
+                self.enfileirar_novos(avisados)
+                self.despachar(pool_extracao)
+                avisados = self.observador.aguardar(self.intervalo_s)
+            # Os pares ainda não despachados continuam na fila para a próxima execução
+            self.janela.aguardar_vazia()
+        self.observador.fechar()
+        return self.contagem
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concilia continuamente os pares caixa/nota gravados numa pasta.")
+    parser.add_argument("pasta", help="Pasta onde os scanners gravam as imagens")
+    parser.add_argument("--saida", default="-", help="Arquivo JSONL onde os vereditos são acrescentados (padrão: stdout)")
+    parser.add_argument("--workers", type=int, default=4, help="Threads de extração (e de cruzamento, salvo --workers-cruzamento)")
+    parser.add_argument("--workers-cruzamento", type=int, help="Threads de cruzamento")
+    parser.add_argument("--max-em-andamento", type=int, help="Máximo de pares no pipeline (padrão: 2x workers)")
+    parser.add_argument("--estado", default=os.getenv("VIGIA_ESTADO", CAMINHO_ESTADO), help="SQLite com a fila")
+    parser.add_argument("--polling", action="store_true", default=os.getenv("VIGIA_POLLING") == "1",
+                        help="Varre a pasta periodicamente em vez de usar inotify")
+    parser.add_argument("--intervalo", type=float, default=float(os.getenv("VIGIA_INTERVALO_S", "2")),
+                        help="Segundos entre varreduras da pasta")
+    parser.add_argument("--estabilidade", type=float, default=float(os.getenv("VIGIA_ESTABILIDADE_S", "2")),
+                        help="Sem inotify, idade mínima (s) de um arquivo sem mudanças para ser usado")
+    parser.add_argument("--sem-cache", action="store_true", help="Ignora o cache de respostas")
+    parser.add_argument("--modo", choices=[estruturado.MODO_TEXTO, estruturado.MODO_ESTRUTURADO],
+                        default=estruturado.modo_extracao(),
+                        help="texto: cruzamento via LLM; estruturado: extração em JSON e cruzamento local")
+    parser.add_argument("--fallback-llm", action=argparse.BooleanOptionalAction, default=estruturado.fallback_llm_ativado(),
+                        help="No modo estruturado, envia ao LLM os pares com correspondência ambígua "
+                             "(padrão: %(default)s, de CRUZAMENTO_LLM_FALLBACK no .env)")
+    parser.add_argument("--verificacao-local", action=argparse.BooleanOptionalAction,
+                        default=verificacao_local.verificacao_ativada(),
+                        help="Lê código de barras/OCR antes e reprova sem chamar o modelo se as notas divergirem "
+                             "(padrão: %(default)s, de VERIFICACAO_LOCAL no .env)")
+    parser.add_argument("--sem-historico", action="store_true",
+                        help="Não grava os vereditos no histórico de conciliações (resultados.py)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.pasta):
+        print(f"❌ Pasta não encontrada: {args.pasta}", file=sys.stderr)
+        return 1
+
+    client, deployment_name = criar_cliente()
+    cache = None if args.sem_cache else abrir_cache_padrao()
+    armazem = None if args.sem_historico else abrir_armazem_padrao()
+    estado = EstadoFila(
+        args.estado, max_tentativas=int(os.getenv("VIGIA_TENTATIVAS", "3")),
+        espera_nova_tentativa_s=float(os.getenv("VIGIA_ESPERA_NOVA_TENTATIVA_S", "5")),
+    )
+    saida = sys.stdout if args.saida == "-" else open(args.saida, "a", encoding="utf-8")
+    vigia = Vigia(
+        client, deployment_name, args.pasta, estado, saida, workers=args.workers,
+        workers_cruzamento=args.workers_cruzamento, cache=cache, modo=args.modo, fallback_llm=args.fallback_llm,
+        verificar_localmente=args.verificacao_local, armazem=armazem, max_em_andamento=args.max_em_andamento,
+        intervalo_s=args.intervalo, estabilidade_s=args.estabilidade, polling=args.polling,
+        espera_maxima_s=float(os.getenv("VIGIA_ESPERA_MAXIMA_S", "5")),
+    )
+
+    def ao_sinal(numero, quadro):
+        if vigia.parada.is_set():
+            # A fila está no SQLite: os pares interrompidos voltam no próximo início
+            print("Parada imediata.", file=sys.stderr)
+            os._exit(130)
+        print("Parando: aguardando os pares em andamento (repita para sair já)...", file=sys.stderr)
+        vigia.parar()
+
+    signal.signal(signal.SIGINT, ao_sinal)
+    signal.signal(signal.SIGTERM, ao_sinal)
+
+    try:
+        contagem = vigia.executar()
+    finally:
+        if saida is not sys.stdout:
+            saida.close()
+        if armazem is not None:
+            armazem.fechar()
+
+    resumo = ", ".join(f"{status}: {qtd}" for status, qtd in sorted(contagem.items()))
+    print(f"✓ Vigia encerrado ({resumo or 'nenhum par'}); fila: {estado.contagem()}", file=sys.stderr)
+    estado.fechar()
+    lote.imprimir_resumo_execucao(client, cache)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())